@@ -1,53 +1,76 @@
+import asyncio
+import logging
 import random
-from websocket import WebSocketApp, enableTrace
-import json as json
-from common.messages import MoveMsg, msg_from_json, YourMoveMsg, GameOverMsg
+from bot_sdk import Bot, BotClient, legal_moves
+from common.messages import GameOverMsg, YourMoveMsg
+from common.pylos import Move, Position
+from common.search import SEARCH_TIME, Searcher
+from common.tablebase import open_tablebase
+from common.wire import Encoding
 
+logger = logging.getLogger(__name__)
 
-def on_message(ws: WebSocketApp, message):
-    try:
-        msg_json = json.loads(message)
-        msg_obj = msg_from_json(msg_json)
-        if type(msg_obj) is YourMoveMsg:
-            if len(msg_obj.legal) == 0:
-                print("no moves left")
-                return
-            move = random.choice(msg_obj.legal)
-            move["type"] = MoveMsg.__name__
-            print(move, "move")
-            ws.send(json.dumps(MoveMsg(move).to_dict()))
-        if type(msg_obj) is GameOverMsg:
-            print(msg_obj)
-            ws.close()
-    except json.JSONDecodeError:
-        print(message)
-        print("not a valid json msg, ignoring")
 
+class RandomBot(Bot):
+    """
+    Example bot, plays random legal move
+    """
+    async def choose(self, state: YourMoveMsg) -> Move:
+        move = random.choice(legal_moves(state))
+        logger.info("%s move", move)
+        return move
 
-def on_error(ws, error):
-    print(error)
+    def game_over(self, msg: GameOverMsg):
+        logger.info("game over: %s", msg.to_dict())
 
 
-def on_close(ws, close_status_code, close_msg):
-    print("### closed ###")
-    ws.close()
+# opening book and solved endgames, generated by python -m common.tablebase
+tablebase = open_tablebase()
 
 
-def connect(game_id: int, player_id: int):
-    return WebSocketApp(
-        f"ws://127.0.0.1:8000/game/connect?game_id={game_id}&player_id={player_id}",
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close,
-    )
+class SearchBot(RandomBot):
+    """
+    Reference bot, plays tablebase move if position is in tablebase, otherwise
+    alpha-beta search for SEARCH_TIME seconds per move (at most half of time left on clock),
+    searches in thread so that other games go on
+    """
+    def __init__(self) -> None:
+        self.searcher = Searcher()
+
+    async def choose(self, state: YourMoveMsg) -> Move:
+        position = Position.from_board(state.board, state.turn, state.tokens)
+        legal = legal_moves(state)
+        entry = None if tablebase is None else tablebase.probe(position)
+        if entry is not None and entry.move in legal:
+            logger.info("%s move, tablebase %s %s", entry.move, entry.result.value, entry.plies)
+            return entry.move
+        clock = state.clocks[(state.turn + 1) % 2]
+        budget = SEARCH_TIME if clock is None else min(SEARCH_TIME, clock / 2000)
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, self.searcher.search, position, legal, budget
+        )
+        logger.info("%s move, depth %s, %.0f nodes/s", result.move, result.depth, result.nps)
+        return result.move
+
+
+BOTS = {"random": RandomBot, "search": SearchBot}
 
 
 if __name__ == "__main__":
-    enableTrace(True)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     while True:
-        print("game id")
-        game = int(input())
+        print("tournament id (empty to play games)")
+        tournament = input()
+        if not tournament:
+            print("game ids (separated by spaces)")
+            games = [int(game) for game in input().split()]
         print("player id")
         player = int(input())
-        ws = connect(game_id=game, player_id=player)
-        ws.run_forever()
+        print("encoding (json/binary)")
+        encoding = Encoding(input() or Encoding.json)
+        print(f"bot ({'/'.join(BOTS)})")
+        client = BotClient(BOTS[input() or "random"], player, encoding=encoding)
+        if tournament:
+            asyncio.run(client.play_tournament(int(tournament)))
+        else:
+            asyncio.run(client.play_many(games))
@@ -0,0 +1,180 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from asyncio import (
+    FIRST_COMPLETED,
+    Task,
+    TimeoutError,
+    create_task,
+    gather,
+    get_running_loop,
+    sleep,
+    wait,
+    wait_for,
+)
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.request import urlopen
+from common.messages import GameOverMsg, MoveMsg, ResyncMsg, YourMoveMsg
+from common.pylos import Move
+from common.wire import Encoding, decode_msg, encode_msg
+from common.ws_client import WebSocketClient
+
+logger = logging.getLogger(__name__)
+
+SERVER_URL = "ws://127.0.0.1:8000"
+RECONNECT_DELAY = 1.0
+"""
+seconds between attempts to reconnect to game
+"""
+MAX_RECONNECTS = 5
+"""
+attempts to reconnect before game is given up, server keeps player's seat for RECONNECT_GRACE
+"""
+RESYNC_TIMEOUT = 5.0
+"""
+seconds to wait for game state after reconnect, nothing comes if game finished in the meantime
+"""
+
+
+def legal_moves(state: YourMoveMsg) -> List[Move]:
+    return [Move.from_dict(move) for move in state.legal]
+
+
+class Bot(ABC):
+    """
+    Base of bots, implement choose, every game gets its own bot;
+    choose runs in event loop shared by all games, long computations should go to executor
+    (loop.run_in_executor) so that other games don't wait
+    """
+    @abstractmethod
+    async def choose(self, state: YourMoveMsg) -> Move:
+        pass
+
+    def game_over(self, msg: GameOverMsg):
+        """
+        called when game finishes
+        """
+
+
+class BotClient:
+    """
+    Plays games as player **player_id**, any number of games at once in single event loop,
+    connection lost in the middle of game is opened again
+    - **bot**: makes bot for every game, e.g. Bot subclass
+    - **url**: websocket base url of server, its http counterpart is used for tournaments
+    - **encoding**: wire format, json or binary
+    """
+    def __init__(
+        self,
+        bot: Callable[[], Bot],
+        player_id: int,
+        url: str = SERVER_URL,
+        encoding: Encoding = Encoding.json,
+        reconnect_delay: float = RECONNECT_DELAY,
+        max_reconnects: int = MAX_RECONNECTS,
+    ) -> None:
+        self.bot = bot
+        self.player_id = player_id
+        self.url = url
+        self.encoding = encoding
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnects = max_reconnects
+
+    async def play(self, game_id: int) -> Optional[GameOverMsg]:
+        """
+        play game until it is over, returns None if connection couldn't be restored
+        or bot failed (error is logged, other games go on)
+        """
+        try:
+            return await self._play_reconnecting(game_id)
+        except Exception:
+            logger.exception("game %s given up, bot failed", game_id)
+            return None
+
+    async def _play_reconnecting(self, game_id: int) -> Optional[GameOverMsg]:
+        url = (
+            f"{self.url}/game/connect?game_id={game_id}&player_id={self.player_id}"
+            f"&encoding={self.encoding.value}"
+        )
+        bot = self.bot()
+        failures = 0
+        while failures <= self.max_reconnects:
+            try:
+                websocket = await WebSocketClient.connect(url)
+            except OSError:
+                failures += 1
+                await sleep(self.reconnect_delay)
+                continue
+            try:
+                result = await self._play(bot, websocket, RESYNC_TIMEOUT if failures else None)
+            except TimeoutError:
+                # game finished while player was away, nothing comes after reconnect;
+                # first, as TimeoutError is OSError since python 3.11
+                return None
+            except OSError:
+                result = None
+            finally:
+                await websocket.close()
+            if result is not None:
+                bot.game_over(result)
+                return result
+            failures += 1
+            await sleep(self.reconnect_delay)
+        return None
+
+    async def _play(
+        self, bot: Bot, websocket: WebSocketClient, first_timeout: Optional[float]
+    ) -> Optional[GameOverMsg]:
+        """
+        raises TimeoutError if first message doesn't come in **first_timeout** seconds
+        """
+        frame = await wait_for(websocket.receive(), first_timeout)
+        while True:
+            try:
+                msg = decode_msg(frame, self.encoding)
+            except (TypeError, ValueError):
+                msg = None
+                await websocket.send(encode_msg(ResyncMsg({}), self.encoding))
+            if type(msg) is YourMoveMsg and msg.legal:
+                move = await bot.choose(msg)
+                await websocket.send(encode_msg(MoveMsg.from_move(move), self.encoding))
+            elif type(msg) is GameOverMsg:
+                return msg
+            frame = await websocket.receive()
+
+    async def play_many(self, games_ids: Iterable[int]) -> List[Optional[GameOverMsg]]:
+        """
+        play games at once, results in order of **games_ids**
+        """
+        return await gather(*(self.play(game_id) for game_id in games_ids))
+
+    async def play_tournament(self, tournament_id: int):
+        """
+        play every game player gets in tournament, until tournament is over
+        """
+        http_url = "http" + self.url[len("ws"):]
+        loop = get_running_loop()
+        playing: Dict[int, Task] = {}
+        tournament_url = f"{http_url}/tournament/{tournament_id}"
+        while True:
+            games = await loop.run_in_executor(
+                None, _get_json, f"{tournament_url}/games?player_id={self.player_id}"
+            )
+            # nothing came until server's poll timeout, or tournament is over
+            if not games and (await loop.run_in_executor(None, _get_json, tournament_url))["is_finished"]:
+                break
+            for game in games:
+                if game["game_id"] not in playing:
+                    playing[game["game_id"]] = create_task(self.play(game["game_id"]))
+            # ask again once some game finishes
+            running = [task for task in playing.values() if not task.done()]
+            if running:
+                await wait(running, return_when=FIRST_COMPLETED)
+            else:
+                await sleep(self.reconnect_delay)
+        await gather(*playing.values())
+
+
+def _get_json(url: str):
+    with urlopen(url) as response:
+        return json.load(response)
@@ -0,0 +1,148 @@
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from time import perf_counter
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from common.pylos import Move, Position
+
+Bot = Callable[[Position, Sequence[Move]], Move]
+"""
+bot gets position and legal moves of player to move and returns its move,
+it may make and unmake moves on position, but has to leave it as it got it
+"""
+
+MAX_MOVES = 1000
+"""
+moves after which match ends without winner
+"""
+MATCH_CHUNK = 64
+"""
+matches played by process pool worker at once
+"""
+
+
+class Outcome(str, Enum):
+    """
+    How match ended
+    - **no_moves**: player to move has no legal move (or no tokens), they lose
+    - **illegal_move**: bot returned move that isn't legal, it loses
+    - **error**: bot raised exception, it loses
+    - **max_moves**: MAX_MOVES were played, nobody wins
+    """
+    no_moves = "no_moves"
+    illegal_move = "illegal_move"
+    error = "error"
+    max_moves = "max_moves"
+
+
+class MatchResult(NamedTuple):
+    """
+    - **winner**: index of bot that won (in order bots were given to Match), None if nobody won
+    - **winner_tokens**: tokens winner had left
+    - **first**: index of bot that moved first
+    - **moves**: all moves, in order
+    """
+    winner: Optional[int]
+    winner_tokens: int
+    outcome: Outcome
+    first: int
+    moves: Tuple[Move, ...]
+
+
+class Match:
+    """
+    Game of two bots played in process, with the same rules as GameSession,
+    1st bot plays 1st player and 2nd bot 2nd player, who moves first
+    """
+    def __init__(self, first: Bot, second: Bot, max_moves: int = MAX_MOVES) -> None:
+        self.bots = (first, second)
+        self.max_moves = max_moves
+        self.position = Position()
+
+    def play(self) -> MatchResult:
+        position = self.position
+        for _ in range(0, self.max_moves):
+            legal = position.legal_moves()
+            slot = (position.turn + 1) % 2
+            if not legal:
+                return self._result(1 - slot, Outcome.no_moves)
+            try:
+                move = self.bots[slot](position, legal)
+            except Exception:
+                return self._result(1 - slot, Outcome.error)
+            if move not in legal:
+                return self._result(1 - slot, Outcome.illegal_move)
+            position.make(move)
+        return self._result(None, Outcome.max_moves)
+
+    def _result(self, winner: Optional[int], outcome: Outcome) -> MatchResult:
+        tokens = 0 if winner is None else self.position.tokens[winner]
+        return MatchResult(winner, tokens, outcome, 1, self.position.history)
+
+
+def random_bot(position: Position, legal: Sequence[Move]) -> Move:
+    return random.choice(legal)
+
+
+def _play_chunk(first: Bot, second: Bot, games: int, alternate: bool, seed: int, max_moves: int):
+    random.seed(seed)
+    results = []
+    for i in range(0, games):
+        if alternate and i % 2:
+            winner, tokens, outcome, _, moves = Match(second, first, max_moves).play()
+            results.append(MatchResult(None if winner is None else 1 - winner, tokens, outcome, 0, moves))
+        else:
+            results.append(Match(first, second, max_moves).play())
+    return results
+
+
+def run_matches(
+    first: Bot,
+    second: Bot,
+    games: int,
+    processes: Optional[int] = None,
+    alternate: bool = True,
+    seed: int = 0,
+    max_moves: int = MAX_MOVES,
+    chunk: int = MATCH_CHUNK,
+) -> Iterator[MatchResult]:
+    """
+    play **games** matches of **first** against **second** across process pool,
+    results are yielded in order of games
+    - **processes**: pool size, cpu count by default, 0 plays in this process
+    - **alternate**: bots swap sides every other game (results still index bots as given)
+    - **seed**: seeds random of every chunk of games, so runs are reproducible
+    - bots have to be picklable (e.g. module level functions) to be sent to pool
+    """
+    chunks = [
+        (first, second, min(chunk, games - start), alternate, seed + start, max_moves)
+        for start in range(0, games, chunk)
+    ]
+    if processes == 0:
+        for args in chunks:
+            yield from _play_chunk(*args)
+        return
+    with ProcessPoolExecutor(processes) as pool:
+        for results in pool.map(_play_chunk, *zip(*chunks)):
+            yield from results
+
+
+def score(results: Iterator[MatchResult]) -> List[int]:
+    """
+    wins of 1st bot, wins of 2nd bot and games without winner
+    """
+    counts = [0, 0, 0]
+    for result in results:
+        counts[2 if result.winner is None else result.winner] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    start = perf_counter()
+    wins = score(run_matches(random_bot, random_bot, games))
+    elapsed = perf_counter() - start
+    print(f"{games} games in {elapsed:.1f}s on {os.cpu_count()} cpus, {games / elapsed * 3600:.0f} per hour")
+    print(f"random vs random: {wins[0]} / {wins[1]}, {wins[2]} without winner")
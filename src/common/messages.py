@@ -1,5 +1,16 @@
-from typing import List
-from common.pylos import Board
+from enum import Enum
+from typing import List, Optional, Sequence, Union
+from common.pylos import Board, LegalList, Move
+
+
+class Protocol(str, Enum):
+    """
+    How game state is sent to connection
+    - **full**: every state is full GameStateMsg
+    - **delta**: GameStateMsg on connect (and on ResyncMsg), then only GameStateDeltaMsg
+    """
+    full = "full"
+    delta = "delta"
 
 
 class Msg:
@@ -53,26 +64,58 @@ class MoveMsg(Msg):
         if not 0 <= self.x < level_max:
             raise MoveMsgError
 
+    def to_move(self) -> Move:
+        """
+        raises ValueError if message doesn't describe move on board
+        """
+        return Move.from_dict(self.__dict__)
+
+    @classmethod
+    def from_move(cls, move: Move) -> "MoveMsg":
+        return cls(move.to_dict())
+
+
+def _state_dict(msg: Msg) -> dict:
+    """
+    state message as json, server puts legal moves in messages as LegalList with dicts built
+    in advance (or as Move), they become dicts only here
+    """
+    res = dict(msg.__dict__)
+    if isinstance(msg.legal, LegalList):
+        res["legal"] = msg.legal.dicts
+    else:
+        res["legal"] = [m.to_dict() if isinstance(m, Move) else m for m in msg.legal]
+    return res
+
 
 class GameStateMsg(Msg):
     """
     Represents game state
+    - **seq**: sequence number of game state
     - **turn**: current game turn
     - **players_ids**: players ids that are connected to game (at most 2)
     - **players_names**: names of players that are connected to game
     - **tokens**: remaining tokens of players
     - **board**: current state of board (0 => empty, 1 => 1st player, 2 => 2nd player)
-    - **legal**: list of all legal moves
+    - **legal**: list of all legal moves, as dicts in MoveMsg shape
+        (server builds message with LegalList of Move objects, encodings use its ready forms)
+    - **clocks**: milliseconds each player has for their move (running down for player on move),
+        None if player isn't limited by time control
     """
 
     def __init__(self, json_msg) -> None:
         super().__init__(json_msg)
+        self.seq: int = json_msg["seq"]
         self.turn: int = json_msg["turn"]
         self.players_ids: List[int] = json_msg["players_ids"]
         self.players_names: List[str] = json_msg["players_names"]
         self.tokens: List[int] = json_msg["tokens"]
         self.board: Board = json_msg["board"]
-        self.legal = json_msg["legal"]
+        self.legal: Sequence[Union[dict, Move]] = json_msg["legal"]
+        self.clocks: List[Optional[int]] = json_msg.get("clocks", [None, None])
+
+    def to_dict(self):
+        return _state_dict(self)
 
 
 class YourMoveMsg(Msg):
@@ -82,12 +125,61 @@ class YourMoveMsg(Msg):
 
     def __init__(self, json_msg) -> None:
         super().__init__(json_msg)
+        self.seq: int = json_msg["seq"]
         self.turn: int = json_msg["turn"]
         self.players_ids: List[int] = json_msg["players_ids"]
         self.players_names: List[str] = json_msg["players_names"]
         self.tokens: List[int] = json_msg["tokens"]
         self.board: Board = json_msg["board"]
-        self.legal = json_msg["legal"]
+        self.legal: Sequence[Union[dict, Move]] = json_msg["legal"]
+        self.clocks: List[Optional[int]] = json_msg.get("clocks", [None, None])
+
+    def to_dict(self):
+        return _state_dict(self)
+
+
+class GameStateDeltaMsg(Msg):
+    """
+    Represents change of game state since state with previous sequence number
+    (sent instead of GameStateMsg with protocol=delta)
+    - **seq**: sequence number of game state, if it isn't previous **seq** + 1
+        some state was missed and client should send ResyncMsg
+    - **turn**: current game turn
+    - **changed**: list of [level, x, y, value] of cells that changed
+    - **tokens**: change of remaining tokens of players
+    - **move**: move that was applied if state finishes it, otherwise None
+    """
+
+    def __init__(self, json_msg) -> None:
+        super().__init__(json_msg)
+        self.seq: int = json_msg["seq"]
+        self.turn: int = json_msg["turn"]
+        self.changed: List[List[int]] = json_msg["changed"]
+        self.tokens: List[int] = json_msg["tokens"]
+        self.move: Optional[dict] = json_msg["move"]
+
+    def apply(self, state: GameStateMsg) -> bool:
+        """
+        update **state** in place, returns False (leaving state untouched)
+        if delta doesn't directly follow state, delta older than state is ignored
+        """
+        if self.seq <= state.seq:
+            return True
+        if self.seq != state.seq + 1:
+            return False
+        for level, x, y, value in self.changed:
+            state.board[level][x][y] = value
+        state.tokens = [t + d for t, d in zip(state.tokens, self.tokens)]
+        state.turn = self.turn
+        state.seq = self.seq
+        state.legal = []
+        return True
+
+
+class ResyncMsg(Msg):
+    """
+    Ask for current GameStateMsg, send it when GameStateDeltaMsg sequence has gap
+    """
 
 
 class GameOverMsg(Msg):
@@ -116,17 +208,25 @@ class BadMsgResp(Msg):
         self.detail: str = json_msg["detail"]
 
 
+MSG_TYPES = {
+    cls.__name__: cls
+    for cls in (
+        MoveMsg,
+        GameStateMsg,
+        YourMoveMsg,
+        GameStateDeltaMsg,
+        ResyncMsg,
+        GameOverMsg,
+        BadMsgResp,
+    )
+}
+
+
 def msg_from_json(json):
     """
     json msg casting to object representing msg of given type
     """
-    msg_type = json["type"]
-    if msg_type == MoveMsg.__name__:
-        return MoveMsg(json)
-    if msg_type == GameStateMsg.__name__:
-        return GameStateMsg(json)
-    if msg_type == YourMoveMsg.__name__:
-        return YourMoveMsg(json)
-    if msg_type == BadMsgResp.__name__:
-        return BadMsgResp(json)
-    raise TypeError
+    msg_cls = MSG_TYPES.get(json["type"])
+    if msg_cls is None:
+        raise TypeError
+    return msg_cls(json)
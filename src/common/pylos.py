@@ -1,226 +1,324 @@
-from typing import List
-from copy import deepcopy
+from collections import OrderedDict
+from random import Random
+from struct import Struct
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 
 
 Board = List[List[List[int]]]
+BitBoard = Tuple[int, int]
+"""
+board as pair of 30 bit masks, one per player (1st player, 2nd player)
+"""
 
+LEVEL_SIZES = (4, 3, 2, 1)
+LEVEL_OFFSETS = (0, 16, 25, 29)
+CELLS = 30
 
-def _supported_empty(board: Board, level):
+
+def cell_index(level: int, x: int, y: int) -> int:
+    """
+    bit index of cell in bitboard masks
+    """
+    return LEVEL_OFFSETS[level] + x * LEVEL_SIZES[level] + y
+
+
+CELL_COORDS: Tuple[Tuple[int, int, int], ...] = tuple(
+    (level, x, y)
+    for level in range(0, 4)
+    for x in range(0, LEVEL_SIZES[level])
+    for y in range(0, LEVEL_SIZES[level])
+)
+
+LEVEL_MASKS: Tuple[int, ...] = tuple(
+    ((1 << LEVEL_SIZES[level] ** 2) - 1) << LEVEL_OFFSETS[level]
+    for level in range(0, 4)
+)
+
+# cells that could ever be taken from the board (top of pyramid never is)
+LOWER_MASK = LEVEL_MASKS[0] | LEVEL_MASKS[1] | LEVEL_MASKS[2]
+
+
+def _support_mask(level: int, x: int, y: int) -> int:
     if level == 0:
-        return [
-            {"x": x, "y": y, "level": 0}
-            for x in range(0, 4)
-            for y in range(0, 4)
-            if board[0][x][y] == 0
-        ]
+        return 0
+    return sum(
+        1 << cell_index(level - 1, xi, yi)
+        for xi in range(x, x + 2)
+        for yi in range(y, y + 2)
+    )
 
-    return [
-        {"x": x, "y": y, "level": level}
-        for x in range(0, 4 - level)
-        for y in range(0, 4 - level)
-        if board[level][x][y] == 0
-        and all(
-            [
-                board[level - 1][xi][yi]
-                for xi in range(x, x + 2)
-                for yi in range(y, y + 2)
-            ]
+
+def _cover_mask(level: int, x: int, y: int) -> int:
+    if level == 3:
+        return 0
+    return sum(
+        1 << cell_index(level + 1, xi, yi)
+        for xi in range(max(0, x - 1), min(3 - level, x + 1))
+        for yi in range(max(0, y - 1), min(3 - level, y + 1))
+    )
+
+
+def _square_masks(level: int, x: int, y: int) -> Tuple[int, ...]:
+    """
+    for every 2x2 square containing the cell, mask of 3 remaining cells
+    """
+    if level == 3:
+        return ()
+    size = LEVEL_SIZES[level]
+    return tuple(
+        sum(
+            1 << cell_index(level, xi, yi)
+            for xi in range(sx, sx + 2)
+            for yi in range(sy, sy + 2)
+            if (xi, yi) != (x, y)
         )
-    ]
+        for sx in range(max(0, x - 1), min(size - 1, x + 1))
+        for sy in range(max(0, y - 1), min(size - 1, y + 1))
+    )
 
 
-def _legal_cat_put(board):
-    s = [
-        m for i in [_supported_empty(board, level) for level in range(0, 4)] for m in i
-    ]
-    for p in s:
-        p["cat"] = "put"
-    return s
+SUPPORT_MASKS: Tuple[int, ...] = tuple(_support_mask(*c) for c in CELL_COORDS)
+"""
+for every cell mask of cells it rests on
+"""
+COVER_MASKS: Tuple[int, ...] = tuple(_cover_mask(*c) for c in CELL_COORDS)
+"""
+for every cell mask of cells resting on it
+"""
+SQUARE_MASKS: Tuple[Tuple[int, ...], ...] = tuple(_square_masks(*c) for c in CELL_COORDS)
 
+_UPPER_CELLS = tuple(
+    (1 << i, SUPPORT_MASKS[i]) for i in range(LEVEL_OFFSETS[1], CELLS)
+)
 
-def _takeable(board, level, player):
+
+_BITS_TABLES = tuple(
+    tuple(
+        tuple(shift + i for i in range(0, 10) if chunk >> i & 1)
+        for chunk in range(0, 1024)
+    )
+    for shift in (0, 10, 20)
+)
+
+
+def bits(mask: int) -> Tuple[int, ...]:
+    """
+    indexes of set bits of 30 bit mask, lowest first
+    """
+    t0, t1, t2 = _BITS_TABLES
+    return t0[mask & 1023] + t1[mask >> 10 & 1023] + t2[mask >> 20]
+
+
+def to_bitboard(board: Board) -> BitBoard:
+    """
+    converts nested list board into pair of player masks
+    """
+    masks = [0, 0, 0]
+    for i, (level, x, y) in enumerate(CELL_COORDS):
+        masks[board[level][x][y]] |= 1 << i
+    return masks[1], masks[2]
+
+
+def from_bitboard(bitboard: BitBoard) -> Board:
+    """
+    converts pair of player masks into nested list board
+    """
+    board = generate_empty_board()
+    for player, mask in enumerate(bitboard, start=1):
+        for i in bits(mask):
+            level, x, y = CELL_COORDS[i]
+            board[level][x][y] = player
+    return board
+
+
+def changed_cells(old: BitBoard, new: BitBoard) -> List[Tuple[int, int]]:
+    """
+    (cell index, new value) of cells that differ between boards
+    """
     return [
-        {"x": x, "y": y, "level": level}
-        for x in range(0, 4 - level)
-        for y in range(0, 4 - level)
-        if board[level][x][y] == player
-        and not any(
-            [
-                board[level + 1][xi][yi]
-                for xi in range(max(0, x - 1), min(3 - level, x + 1))
-                for yi in range(max(0, y - 1), min(3 - level, y + 1))
-            ]
-        )
+        (i, 1 if new[0] >> i & 1 else 2 if new[1] >> i & 1 else 0)
+        for i in bits((old[0] ^ new[0]) | (old[1] ^ new[1]))
     ]
 
 
-def _legal_cat_move(board, player):
-    mv0 = _takeable(board, 0, player)
-    sp1 = _supported_empty(board, 1)
-    res = [
-        {
-            "cat": "move",
-            "x": s["x"],
-            "y": s["y"],
-            "level": s["level"],
-            "take_x": m["x"],
-            "take_y": m["y"],
-            "take_level": m["level"],
-        }
-        for s in sp1
-        for m in mv0
-        if m
-        not in [
-            {"x": xi, "y": yi, "level": 0}
-            for xi in [s["x"], s["x"] + 1]
-            for yi in [s["y"], s["y"] + 1]
-        ]
-    ]
-    mv1 = _takeable(board, 1, player)
-    sp2 = _supported_empty(board, 2)
-    res += [
-        {
-            "cat": "move",
-            "x": s["x"],
-            "y": s["y"],
-            "level": s["level"],
-            "take_x": m["x"],
-            "take_y": m["y"],
-            "take_level": m["level"],
-        }
-        for s in sp2
-        for m in mv1
-        if m
-        not in [
-            {"x": xi, "y": yi, "level": 1}
-            for xi in [s["x"], s["x"] + 1]
-            for yi in [s["y"], s["y"] + 1]
-        ]
-    ]
+def supported_empty_mask(occupied: int) -> int:
+    """
+    mask of empty cells that a token could be put on
+    """
+    res = LEVEL_MASKS[0] & ~occupied
+    for bit, support in _UPPER_CELLS:
+        if not occupied & bit and occupied & support == support:
+            res |= bit
     return res
 
 
-def is_on_board(board, level, x, y) -> bool:
+def takeable_mask(own: int, occupied: int) -> int:
     """
-    checks if coordinates are in board bounds
+    mask of player tokens (excluding top of pyramid) that have nothing on top of them
     """
-    try:
-        board[level][x][y]
-        return True
-    except IndexError:
-        return False
+    res = 0
+    for i in bits(own & LOWER_MASK):
+        if not COVER_MASKS[i] & occupied:
+            res |= 1 << i
+    return res
 
 
-def _legal_cat_square(board, player):
-    legal_put = [
-        m for i in [_supported_empty(board, level) for level in range(0, 3)] for m in i
-    ]
-    legal_square = [
-        m
-        for m in legal_put
-        if any(
-            [
-                3 == len(
-                    [
-                        1
-                        for (xi, yi) in [
-                            (m["x"], m["y"] - 1),
-                            (m["x"] + 1, m["y"] - 1),
-                            (m["x"] + 1, m["y"]),
-                        ]
-                        if is_on_board(board, m["level"], xi, yi)
-                        and board[m["level"]][xi][yi] == player
-                    ]
-                ),
-                3 == len(
-                    [
-                        1
-                        for (xi, yi) in [
-                            (m["x"] + 1, m["y"]),
-                            (m["x"] + 1, m["y"] + 1),
-                            (m["x"], m["y"] + 1),
-                        ]
-                        if is_on_board(board, m["level"], xi, yi)
-                        and board[m["level"]][xi][yi] == player
-                    ]
-                ),
-                3 == len(
-                    [
-                        1
-                        for (xi, yi) in [
-                            (m["x"], m["y"] + 1),
-                            (m["x"] - 1, m["y"] + 1),
-                            (m["x"] - 1, m["y"]),
-                        ]
-                        if is_on_board(board, m["level"], xi, yi)
-                        and board[m["level"]][xi][yi] == player
-                    ]
-                ),
-                3 == len(
-                    [
-                        1
-                        for (xi, yi) in [
-                            (m["x"] - 1, m["y"]),
-                            (m["x"] - 1, m["y"] - 1),
-                            (m["x"], m["y"] - 1),
-                        ]
-                        if is_on_board(board, m["level"], xi, yi)
-                        and board[m["level"]][xi][yi] == player
-                    ]
-                ),
-            ]
+def _uncovered(candidates: int, occupied: int) -> int:
+    res = 0
+    for i in bits(candidates):
+        if not COVER_MASKS[i] & occupied:
+            res |= 1 << i
+    return res
+
+
+class Move(NamedTuple):
+    """
+    Immutable, hashable move
+    - **cat**: put, move or square (see MoveMsg)
+    - **put**: index of cell token is put on
+    - **take**: index of cell token is taken from, -1 for put
+    - **take_sq**: index of second cell token is taken from, -1 if not used
+    """
+
+    cat: str
+    put: int
+    take: int = -1
+    take_sq: int = -1
+
+    def to_dict(self) -> dict:
+        """
+        move in json shape used by MoveMsg
+        """
+        level, x, y = CELL_COORDS[self.put]
+        res = {"cat": self.cat, "x": x, "y": y, "level": level}
+        if self.cat == "put":
+            return res
+        res["take_level"], res["take_x"], res["take_y"] = CELL_COORDS[self.take]
+        if self.cat == "square":
+            if self.take_sq == -1:
+                res["take_sq_level"], res["take_sq_x"], res["take_sq_y"] = -1, -1, -1
+            else:
+                (
+                    res["take_sq_level"],
+                    res["take_sq_x"],
+                    res["take_sq_y"],
+                ) = CELL_COORDS[self.take_sq]
+        return res
+
+    def to_int(self) -> int:
+        """
+        move packed into 16 bits: put, take + 1, take_sq + 1 (5 bits each), is square
+        """
+        return (
+            self.put
+            | (self.take + 1) << 5
+            | (self.take_sq + 1) << 10
+            | (self.cat == "square") << 15
         )
-    ]
-    res = []
-    for sq in legal_square:
-        bcp1 = deepcopy(board)
-        bcp1[sq["level"]][sq["x"]][sq["y"]] = player
-        takeable1 = [
-            m
-            for i in [_takeable(bcp1, level, player) for level in range(0, 3)]
-            for m in i
-        ]
-        res += [
-            {
-                "cat": "square",
-                "level": sq["level"],
-                "x": sq["x"],
-                "y": sq["y"],
-                "take_level": t["level"],
-                "take_x": t["x"],
-                "take_y": t["y"],
-                "take_sq_level": -1,
-                "take_sq_x": -1,
-                "take_sq_y": -1,
-            }
-            for t in takeable1
-        ]
-        for t in takeable1:
-            bcp2 = deepcopy(bcp1)
-            bcp2[t["level"]][t["x"]][t["y"]] = 0
-            takeable2 = [
-                m
-                for i in [_takeable(bcp2, level, player) for level in range(0, 3)]
-                for m in i
-            ]
-            res += [
-                {
-                    "cat": "square",
-                    "level": sq["level"],
-                    "x": sq["x"],
-                    "y": sq["y"],
-                    "take_level": t["level"],
-                    "take_x": t["x"],
-                    "take_y": t["y"],
-                    "take_sq_level": t2["level"],
-                    "take_sq_x": t2["x"],
-                    "take_sq_y": t2["y"],
-                }
-                for t2 in takeable2
-            ]
+
+    @classmethod
+    def from_int(cls, packed: int) -> "Move":
+        """
+        reverse of to_int, raises ValueError if **packed** isn't valid move
+        """
+        put, take, take_sq = packed & 31, (packed >> 5 & 31) - 1, (packed >> 10 & 31) - 1
+        if packed >> 15:
+            cat = "square"
+        elif take == -1:
+            cat = "put"
+        else:
+            cat = "move"
+        if (
+            packed >> 16
+            or put >= CELLS
+            or take >= CELLS
+            or take_sq >= CELLS
+            or (cat != "square" and take_sq != -1)
+            or (cat == "square" and take == -1)
+        ):
+            raise ValueError(f"invalid packed move: {packed}")
+        return cls(cat, put, take, take_sq)
+
+    @classmethod
+    def from_dict(cls, move: dict) -> "Move":
+        """
+        move from json shape used by MoveMsg,
+        raises ValueError if move is malformed or points outside of board
+        """
+        try:
+            cat = move["cat"]
+            put = _checked_cell(move["level"], move["x"], move["y"])
+            if cat == "put":
+                return cls(cat, put)
+            take = _checked_cell(move["take_level"], move["take_x"], move["take_y"])
+            if cat == "move":
+                return cls(cat, put, take)
+            if cat == "square":
+                if move["take_sq_level"] == -1:
+                    return cls(cat, put, take)
+                return cls(
+                    cat,
+                    put,
+                    take,
+                    _checked_cell(
+                        move["take_sq_level"], move["take_sq_x"], move["take_sq_y"]
+                    ),
+                )
+        except (KeyError, TypeError):
+            raise ValueError(f"malformed move: {move}")
+        raise ValueError(f"unknown move category: {cat}")
+
+
+def _checked_cell(level, x, y) -> int:
+    if not all(type(c) is int for c in (level, x, y)) or not is_on_board(None, level, x, y):
+        raise ValueError(f"cell out of board: {(level, x, y)}")
+    return cell_index(level, x, y)
+
+
+def bitboard_moves(bitboard: BitBoard, player: int) -> List[Move]:
+    """
+    legal moves of **player** (1 or 2)
+    """
+    own = bitboard[player - 1]
+    occupied = bitboard[0] | bitboard[1]
+    return _generate_moves(
+        own, occupied, supported_empty_mask(occupied), takeable_mask(own, occupied)
+    )
+
+
+def _generate_moves(own: int, occupied: int, empty: int, takeable: int) -> List[Move]:
+    res = [Move("put", i) for i in bits(empty)]
+
+    for level in (1, 2):
+        below = takeable & LEVEL_MASKS[level - 1]
+        for dst in bits(empty & LEVEL_MASKS[level]):
+            res += [Move("move", dst, t) for t in bits(below & ~SUPPORT_MASKS[dst])]
+
+    for sq in bits(empty & LOWER_MASK):
+        if not any(own & m == m for m in SQUARE_MASKS[sq]):
+            continue
+        sq_bit = 1 << sq
+        own1 = own | sq_bit
+        occupied1 = occupied | sq_bit
+        takeable1 = (takeable & ~SUPPORT_MASKS[sq]) | sq_bit
+        res += [Move("square", sq, t) for t in bits(takeable1)]
+        for t in bits(takeable1):
+            t_bit = 1 << t
+            occupied2 = occupied1 ^ t_bit
+            takeable2 = (takeable1 ^ t_bit) | _uncovered(
+                SUPPORT_MASKS[t] & own1, occupied2
+            )
+            res += [Move("square", sq, t, t2) for t2 in bits(takeable2)]
     return res
 
 
+def is_on_board(board, level, x, y) -> bool:
+    """
+    checks if coordinates are in board bounds
+    """
+    return 0 <= level < 4 and 0 <= x < LEVEL_SIZES[level] and 0 <= y < LEVEL_SIZES[level]
+
+
 def generate_empty_board() -> Board:
     """
     returns empty board - starting state of board
@@ -234,7 +332,459 @@ def legal_moves(board, turn) -> List[dict]:
     - **board**: board state
     - **turn**: game turn, used to determine whos turn it is
     """
-    res = _legal_cat_put(board)
-    res += _legal_cat_move(board, turn % 2 + 1)
-    res += _legal_cat_square(board, turn % 2 + 1)
-    return res
+    return [m.to_dict() for m in bitboard_moves(to_bitboard(board), turn % 2 + 1)]
+
+
+def legal_move_set(board, turn) -> FrozenSet[Move]:
+    """
+    same as legal_moves, but as set of Move for constant time validation
+    """
+    return frozenset(bitboard_moves(to_bitboard(board), turn % 2 + 1))
+
+
+def _symmetric_coords(sym: int, size: int, x: int, y: int) -> Tuple[int, int]:
+    n = size - 1
+    if sym >= 4:
+        x, y = y, x
+    for _ in range(0, sym % 4):
+        x, y = y, n - x
+    return x, y
+
+
+SYMMETRIES = 8
+"""
+number of dihedral symmetries of the pyramid, symmetry 0 is identity,
+1-3 are rotations, 4-7 are transposition followed by rotation
+"""
+
+SYMMETRY_PERMUTATIONS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(
+        cell_index(level, *_symmetric_coords(sym, LEVEL_SIZES[level], x, y))
+        for level, x, y in CELL_COORDS
+    )
+    for sym in range(0, SYMMETRIES)
+)
+"""
+for every symmetry, index of cell every cell is mapped to
+"""
+
+_INVERSE_SYMMETRIES = tuple(
+    next(
+        inv
+        for inv in range(0, SYMMETRIES)
+        if all(SYMMETRY_PERMUTATIONS[inv][p] == i for i, p in enumerate(perm))
+    )
+    for perm in SYMMETRY_PERMUTATIONS
+)
+
+_SYMMETRY_TABLES = tuple(
+    tuple(
+        tuple(sum(1 << perm[shift + i] for i in _BITS_TABLES[0][chunk]) for chunk in range(0, 1024))
+        for shift in (0, 10, 20)
+    )
+    for perm in SYMMETRY_PERMUTATIONS
+)
+
+
+def inverse_symmetry(sym: int) -> int:
+    """
+    symmetry that reverts **sym**
+    """
+    return _INVERSE_SYMMETRIES[sym]
+
+
+def transform_mask(mask: int, sym: int) -> int:
+    t0, t1, t2 = _SYMMETRY_TABLES[sym]
+    return t0[mask & 1023] | t1[mask >> 10 & 1023] | t2[mask >> 20]
+
+
+def transform_bitboard(bitboard: BitBoard, sym: int) -> BitBoard:
+    """
+    board transformed by symmetry **sym**
+    """
+    return transform_mask(bitboard[0], sym), transform_mask(bitboard[1], sym)
+
+
+def transform_move(move: Move, sym: int) -> Move:
+    """
+    move transformed by symmetry **sym**, transform_move(m, s) is legal in
+    transform_bitboard(b, s) if and only if m is legal in b
+    """
+    perm = SYMMETRY_PERMUTATIONS[sym]
+    return Move(
+        move.cat,
+        perm[move.put],
+        -1 if move.take == -1 else perm[move.take],
+        -1 if move.take_sq == -1 else perm[move.take_sq],
+    )
+
+
+def canonical_bitboard(bitboard: BitBoard) -> Tuple[BitBoard, int]:
+    """
+    canonical representative of board symmetry class and symmetry mapping board onto it
+    - all 8 symmetric boards have the same canonical representative
+    - transform_bitboard(bitboard, sym) == canonical
+    """
+    best, best_sym = None, 0
+    for sym in range(0, SYMMETRIES):
+        t0, t1, t2 = _SYMMETRY_TABLES[sym]
+        m1, m2 = bitboard
+        key = (
+            t0[m1 & 1023] | t1[m1 >> 10 & 1023] | t2[m1 >> 20]
+        ) | (t0[m2 & 1023] | t1[m2 >> 10 & 1023] | t2[m2 >> 20]) << CELLS
+        if best is None or key < best:
+            best, best_sym = key, sym
+    mask = (1 << CELLS) - 1
+    return (best & mask, best >> CELLS), best_sym
+
+
+def canonical_key(bitboard: BitBoard, player: int) -> int:
+    """
+    same as position_key, but equal for all symmetric boards
+    """
+    canonical, _ = canonical_bitboard(bitboard)
+    return position_key(canonical, player)
+
+
+def position_key(bitboard: BitBoard, player: int) -> int:
+    """
+    packed integer uniquely identifying board and player to move
+    """
+    return bitboard[0] | bitboard[1] << CELLS | player << 2 * CELLS
+
+
+_PACKED_MOVE = Struct("<H")
+
+# Move.to_int => move and its dict, shared by all legal lists (there are less than 1 << 16 moves)
+_interned: Dict[int, Tuple[Move, dict]] = {}
+
+
+def _intern(packed: int) -> Tuple[Move, dict]:
+    try:
+        return _interned[packed]
+    except KeyError:
+        move = Move.from_int(packed)
+        res = _interned[packed] = move, move.to_dict()
+        return res
+
+
+class LegalList(tuple):
+    """
+    Sorted legal moves of position with their forms sent to clients, built once per position,
+    so that messages listing them don't sort and convert moves again
+    - **dicts**: moves in json shape used by MoveMsg
+    - **packed**: moves as little endian 16 bit Move.to_int
+    moves and dicts are interned, list costs only its pointers and packed bytes
+    """
+
+    def __new__(cls, packed: bytes) -> "LegalList":
+        interned = [_intern(m) for m, in _PACKED_MOVE.iter_unpack(packed)]
+        res = super().__new__(cls, (move for move, _ in interned))
+        res.dicts = [move_dict for _, move_dict in interned]
+        res.packed = packed
+        return res
+
+    def __reduce__(self):
+        # only packed form crosses process boundary, unpickled list is interned again
+        return LegalList, (self.packed,)
+
+    @classmethod
+    def of(cls, moves: Iterable[Move]) -> "LegalList":
+        moves = sorted(moves)
+        return cls(Struct(f"<{len(moves)}H").pack(*(m.to_int() for m in moves)))
+
+
+def _untransformed(moves: LegalList, sym: int) -> LegalList:
+    """
+    moves of position transformed by **sym**, mapped back onto original position
+    """
+    if not sym:
+        return moves
+    inverse = inverse_symmetry(sym)
+    return LegalList.of(transform_move(m, inverse) for m in moves)
+
+
+class LegalMovesCache:
+    """
+    Bounded LRU cache of legal moves keyed by position_key, kept as LegalList,
+    so that it's the only copy of them the server holds
+    - **maxsize**: maximum number of cached positions
+    - **canonical**: key by canonical_key, so symmetric positions share one entry,
+        at cost of mapping moves back on every lookup
+    """
+
+    def __init__(self, maxsize: int = 1 << 16, canonical: bool = False) -> None:
+        self.maxsize = maxsize
+        self.canonical = canonical
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, LegalList]" = OrderedDict()
+
+    def get(self, board: Board, turn: int) -> FrozenSet[Move]:
+        """
+        same as legal_move_set, but served from cache if position was seen before
+        """
+        return self.get_bitboard(to_bitboard(board), turn % 2 + 1)
+
+    def _key(self, bitboard: BitBoard, player: int) -> Tuple[int, BitBoard, int]:
+        """
+        entry key, bitboard moves of entry are generated for and symmetry mapping position onto it
+        """
+        sym = 0
+        if self.canonical:
+            bitboard, sym = canonical_bitboard(bitboard)
+        return position_key(bitboard, player), bitboard, sym
+
+    def _store(self, key: int, moves: LegalList):
+        self._entries[key] = moves
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_bitboard(self, bitboard: BitBoard, player: int) -> FrozenSet[Move]:
+        return frozenset(self.get_list(bitboard, player))
+
+    def get_list(self, bitboard: BitBoard, player: int) -> LegalList:
+        """
+        legal moves of position in forms sent to clients, computed if position wasn't seen before
+        """
+        key, entry_bitboard, sym = self._key(bitboard, player)
+        try:
+            res = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            res = LegalList.of(bitboard_moves(entry_bitboard, player))
+            self._store(key, res)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return _untransformed(res, sym)
+
+    def lookup(self, bitboard: BitBoard, player: int) -> Optional[LegalList]:
+        """
+        cached legal moves or None, without computing them and without counting hit or miss
+        """
+        key, _, sym = self._key(bitboard, player)
+        res = self._entries.get(key)
+        return None if res is None else _untransformed(res, sym)
+
+    def put(self, bitboard: BitBoard, player: int, moves: Iterable[Move]):
+        """
+        add legal moves computed elsewhere (e.g. by bitboard_moves in other process)
+        """
+        key, _, sym = self._key(bitboard, player)
+        if sym:
+            moves = LegalList.of(transform_move(m, sym) for m in moves)
+        elif not isinstance(moves, LegalList):
+            moves = LegalList.of(moves)
+        self._store(key, moves)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        """
+        cache counters
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+legal_moves_cache = LegalMovesCache()
+"""
+cache shared by all game sessions
+"""
+
+
+STARTING_TOKENS = 15
+
+_zobrist_random = Random(0x5079105)
+ZOBRIST_CELLS: Tuple[Tuple[int, ...], Tuple[int, ...]] = tuple(
+    tuple(_zobrist_random.getrandbits(64) for _ in range(0, CELLS)) for _ in range(0, 2)
+)
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+
+def _move_steps(move: Move) -> Tuple[Tuple[bool, int], ...]:
+    """
+    move as sequence of (is_put, cell) single token steps
+    """
+    if move.cat == "put":
+        return ((True, move.put),)
+    if move.cat == "move":
+        return ((False, move.take), (True, move.put))
+    if move.take_sq == -1:
+        return ((True, move.put), (False, move.take))
+    return ((True, move.put), (False, move.take), (False, move.take_sq))
+
+
+class Position:
+    """
+    Mutable game position with incremental make/unmake
+    - **masks**: tokens of 1st and 2nd player as bitboard masks
+    - **turn**: game turn, same meaning as in GameSession (player to move is turn + 1)
+    - **tokens**: remaining tokens of 1st and 2nd player
+    - **hash**: zobrist hash of board and player to move
+    - **empty**: mask of empty cells token could be put on
+    - **removable**: mask of tokens below top that have nothing on top of them
+    """
+
+    def __init__(
+        self,
+        bitboard: BitBoard = (0, 0),
+        turn: int = 0,
+        tokens: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.masks: List[int] = list(bitboard)
+        self.turn = turn
+        if tokens is None:
+            tokens = [STARTING_TOKENS - bin(m).count("1") for m in bitboard]
+        self.tokens: List[int] = list(tokens)
+        occupied = bitboard[0] | bitboard[1]
+        self.occupied = occupied
+        self.empty = supported_empty_mask(occupied)
+        self.removable = _uncovered(occupied & LOWER_MASK, occupied)
+        self.hash = ZOBRIST_SIDE if self.player == 2 else 0
+        for p in (0, 1):
+            for i in bits(bitboard[p]):
+                self.hash ^= ZOBRIST_CELLS[p][i]
+        self._history: List[Move] = []
+
+    @classmethod
+    def from_board(
+        cls, board: Board, turn: int = 0, tokens: Optional[Sequence[int]] = None
+    ) -> "Position":
+        return cls(to_bitboard(board), turn, tokens)
+
+    @property
+    def player(self) -> int:
+        """
+        player to move (1 or 2)
+        """
+        return (self.turn + 1) % 2 + 1
+
+    @property
+    def bitboard(self) -> BitBoard:
+        return self.masks[0], self.masks[1]
+
+    @property
+    def key(self) -> int:
+        """
+        exact position_key of position
+        """
+        return position_key(self.bitboard, self.player)
+
+    @property
+    def canonical_key(self) -> int:
+        """
+        canonical_key of position, equal for all symmetric positions
+        """
+        return canonical_key(self.bitboard, self.player)
+
+    @property
+    def history(self) -> Tuple[Move, ...]:
+        """
+        moves made since position was created, in order
+        """
+        return tuple(self._history)
+
+    def board(self) -> Board:
+        """
+        position as nested list board
+        """
+        return from_bitboard(self.bitboard)
+
+    def copy(self) -> "Position":
+        res = Position.__new__(Position)
+        res.__dict__.update(self.__dict__)
+        res.masks = list(self.masks)
+        res.tokens = list(self.tokens)
+        res._history = list(self._history)
+        return res
+
+    def legal_moves(self) -> List[Move]:
+        """
+        legal moves of player to move, empty if player has no tokens left
+        """
+        p = self.player - 1
+        if self.tokens[p] == 0:
+            return []
+        own = self.masks[p]
+        return _generate_moves(own, self.occupied, self.empty, own & self.removable)
+
+    def _put(self, p: int, cell: int):
+        bit = 1 << cell
+        self.masks[p] |= bit
+        self.occupied |= bit
+        self.tokens[p] -= 1
+        self.hash ^= ZOBRIST_CELLS[p][cell]
+        occupied = self.occupied
+        empty = self.empty & ~bit
+        for above in bits(COVER_MASKS[cell]):
+            support = SUPPORT_MASKS[above]
+            if occupied & support == support:
+                empty |= 1 << above
+        self.empty = empty
+        self.removable &= ~SUPPORT_MASKS[cell]
+        if bit & LOWER_MASK:
+            self.removable |= bit
+
+    def _take(self, p: int, cell: int):
+        bit = 1 << cell
+        self.masks[p] ^= bit
+        self.occupied ^= bit
+        self.tokens[p] += 1
+        self.hash ^= ZOBRIST_CELLS[p][cell]
+        self.empty = (self.empty & ~COVER_MASKS[cell]) | bit
+        self.removable = (self.removable & ~bit) | _uncovered(
+            SUPPORT_MASKS[cell], self.occupied
+        )
+
+    def make(self, move: Move):
+        """
+        apply legal **move** of player to move
+        """
+        p = self.player - 1
+        self.turn += 1
+        self.hash ^= ZOBRIST_SIDE
+        for is_put, cell in _move_steps(move):
+            if is_put:
+                self._put(p, cell)
+            else:
+                self._take(p, cell)
+        self._history.append(move)
+
+    def make_stepwise(self, move: Move) -> Iterator[None]:
+        """
+        same as make, but yields after every single token put or taken
+        """
+        p = self.player - 1
+        self.turn += 1
+        self.hash ^= ZOBRIST_SIDE
+        self._history.append(move)
+        for is_put, cell in _move_steps(move):
+            if is_put:
+                self._put(p, cell)
+            else:
+                self._take(p, cell)
+            yield
+
+    def unmake(self) -> Move:
+        """
+        revert last made move and return it
+        """
+        move = self._history.pop()
+        p = self.turn % 2
+        for is_put, cell in reversed(_move_steps(move)):
+            if is_put:
+                self._take(p, cell)
+            else:
+                self._put(p, cell)
+        self.turn -= 1
+        self.hash ^= ZOBRIST_SIDE
+        return move
@@ -0,0 +1,165 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from common.pylos import (
+    CELL_COORDS,
+    CELLS,
+    COVER_MASKS,
+    LEVEL_MASKS,
+    LOWER_MASK,
+    SQUARE_MASKS,
+    SUPPORT_MASKS,
+    Board,
+    Move,
+)
+
+
+def _mask_row(mask: int) -> List[bool]:
+    return [bool(mask >> j & 1) for j in range(0, CELLS)]
+
+
+def _lower_cells() -> List[int]:
+    return [i for i in range(0, CELLS) if LOWER_MASK >> i & 1]
+
+
+def _batch_moves() -> Tuple[Move, ...]:
+    lower = _lower_cells()
+    puts = [Move("put", i) for i in range(0, CELLS)]
+    moves = [
+        Move("move", dst, src)
+        for level in (1, 2)
+        for dst in range(0, CELLS)
+        if LEVEL_MASKS[level] >> dst & 1
+        for src in range(0, CELLS)
+        if LEVEL_MASKS[level - 1] >> src & 1 and not SUPPORT_MASKS[dst] >> src & 1
+    ]
+    squares = [
+        Move("square", sq, t, t2)
+        for sq in lower
+        if SQUARE_MASKS[sq]
+        for t in lower
+        if not SUPPORT_MASKS[sq] >> t & 1
+        for t2 in [-1] + lower
+        # taking the square token back frees tokens it rested on
+        if t2 == -1 or t2 != t and (t == sq or not SUPPORT_MASKS[sq] >> t2 & 1)
+    ]
+    return tuple(puts + moves + squares)
+
+
+BATCH_MOVES: Tuple[Move, ...] = _batch_moves()
+"""
+every move that could be legal in some position, columns of batch_legal_moves mask
+"""
+BATCH_MOVE_INDEX: Dict[Move, int] = {m: i for i, m in enumerate(BATCH_MOVES)}
+
+# SUPPORT[i, j] - j is one of cells i rests on, COVER[i, j] - j rests on i
+_SUPPORT = np.array([_mask_row(m) for m in SUPPORT_MASKS], dtype=np.int16)
+_COVER = np.array([_mask_row(m) for m in COVER_MASKS], dtype=np.int16)
+_SUPPORT_COUNTS = _SUPPORT.sum(axis=1)
+_LOWER = np.array(_mask_row(LOWER_MASK))
+# SQUARES[q, i] - cell i belongs to q-th 2x2 square
+_SQUARES = np.array(
+    sorted(
+        {
+            tuple(_mask_row(m | 1 << i))
+            for i in range(0, CELLS)
+            for m in SQUARE_MASKS[i]
+        }
+    ),
+    dtype=np.int16,
+)
+
+_CAT = np.array([m.cat for m in BATCH_MOVES])
+_PUT = np.array([m.put for m in BATCH_MOVES])
+_TAKE = np.array([m.take for m in BATCH_MOVES])
+_PUTS = np.flatnonzero(_CAT == "put")
+_MOVES = np.flatnonzero(_CAT == "move")
+
+
+def _square_block(sq: int):
+    """
+    column range of square moves finishing square at **sq** with per column constants
+    """
+    cols = np.flatnonzero((_CAT == "square") & (_PUT == sq))
+    t = _TAKE[cols]
+    t2 = np.array([BATCH_MOVES[i].take_sq for i in cols])
+    single = t2 == -1
+    t2 = np.where(single, t, t2)
+    # second token is free when nothing is on top of it after square token is put and first token taken,
+    # square token counts only while it is still on board
+    t2_cover = np.where(t == sq, 0, _COVER[t2, sq]) - np.where(t == sq, 0, _COVER[t2, t])
+    return (
+        sq,
+        slice(cols[0], cols[-1] + 1),
+        t,
+        t2,
+        single,
+        t == sq,
+        t2 == sq,
+        _COVER[t, sq],
+        t2_cover,
+    )
+
+
+_SQUARE_BLOCKS = [_square_block(sq) for sq in sorted({m.put for m in BATCH_MOVES if m.cat == "square"})]
+
+
+def boards_to_array(boards: Sequence[Board]) -> np.ndarray:
+    """
+    nested list boards as (N, 30) array of cell values in bitboard cell order
+    """
+    return np.array(
+        [[board[level][x][y] for level, x, y in CELL_COORDS] for board in boards],
+        dtype=np.int8,
+    ).reshape(len(boards), CELLS)
+
+
+def batch_legal_moves(boards: np.ndarray, turns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    legal moves of many positions at once, agrees with legal_moves for every row
+    - **boards**: (N, 30) array of cell values (0 => empty, 1 => 1st player, 2 => 2nd player)
+        in bitboard cell order, see boards_to_array
+    - **turns**: (N,) array of game turns, same meaning as in legal_moves
+
+    returns (N, len(BATCH_MOVES)) bool mask of legal moves and (N,) array of their counts,
+    mask takes about 18kB per board, so very large batches should be chunked
+    """
+    boards = np.asarray(boards)
+    players = np.asarray(turns) % 2 + 1
+    own = boards == players[:, None]
+    occupied = boards != 0
+    occ = occupied.astype(np.int16)
+
+    empty = ~occupied & (occ @ _SUPPORT.T == _SUPPORT_COUNTS)
+    covers = occ @ _COVER.T
+    takeable = own & (covers == 0) & _LOWER
+    squares = own.astype(np.int16) @ _SQUARES.T == 3
+    forms_square = empty & _LOWER & (squares.astype(np.int16) @ _SQUARES > 0)
+
+    res = np.zeros((boards.shape[0], len(BATCH_MOVES)), dtype=bool)
+    res[:, _PUTS] = empty[:, _PUT[_PUTS]]
+    res[:, _MOVES] = empty[:, _PUT[_MOVES]] & takeable[:, _TAKE[_MOVES]]
+    counts = res[:, : _MOVES[-1] + 1].sum(axis=1)
+
+    # square moves only for boards where square could be finished at given cell,
+    # taken tokens are own or the one just put, with nothing on top after put
+    # (and after first take for second token)
+    for sq, cols, t, t2, single, t_is_sq, t2_is_sq, t_cover, t2_cover in _SQUARE_BLOCKS:
+        rows = np.flatnonzero(forms_square[:, sq])
+        if not len(rows):
+            continue
+        own_rows = own[rows]
+        covers_rows = covers[rows]
+        valid = (own_rows[:, t] | t_is_sq) & (covers_rows[:, t] + t_cover == 0)
+        valid &= single | (own_rows[:, t2] | t2_is_sq) & (covers_rows[:, t2] + t2_cover == 0)
+        res[rows, cols] = valid
+        counts[rows] += valid.sum(axis=1)
+    return res, counts
+
+
+def moves_from_mask(mask: np.ndarray) -> List[Move]:
+    """
+    moves of single row of batch_legal_moves mask
+    """
+    return [BATCH_MOVES[i] for i in np.flatnonzero(mask)]
@@ -0,0 +1,263 @@
+import sys
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from common.pylos import LOWER_MASK, SQUARE_MASKS, Move, Position, bits
+
+SEARCH_TIME = 1.0
+"""
+default seconds per move
+"""
+MAX_DEPTH = 64
+TT_SIZE = 1 << 20
+"""
+entries of transposition table, it is cleared when full
+"""
+TOKEN_VALUE = 100
+"""
+score of one token more than opponent
+"""
+THREAT_VALUE = 30
+"""
+score of every cell where player could finish square of their tokens
+"""
+WIN_SCORE = 1 << 20
+"""
+score of won position, minus plies to the win
+"""
+_WIN_BOUND = WIN_SCORE - 1000
+_CHECK_EVERY = 1023
+
+# transposition table entry bounds
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+# ordering of moves of same category: square taking 2 tokens back, square, stepping up, put
+_CATEGORY_ORDER = {"square": 1, "move": 2, "put": 3}
+
+
+class SearchResult(NamedTuple):
+    """
+    - **move**: best move found, None if there is no legal move
+    - **score**: score of position for player to move after **depth** plies
+    - **depth**: depth of last completed iteration
+    - **nodes**: positions visited
+    - **seconds**: time search took
+    """
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    seconds: float
+
+    @property
+    def nps(self) -> float:
+        """
+        nodes per second
+        """
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def plies_to_end(self) -> Optional[int]:
+        """
+        plies to end of game if search proved who wins (**score** sign tells who), None otherwise
+        """
+        if abs(self.score) > _WIN_BOUND:
+            return WIN_SCORE - abs(self.score)
+        return None
+
+
+class _Timeout(Exception):
+    pass
+
+
+def evaluate(position: Position) -> int:
+    """
+    static score of position for player to move: tokens in hand and squares they could finish
+    """
+    p = position.player - 1
+    score = (position.tokens[p] - position.tokens[1 - p]) * TOKEN_VALUE
+    masks = position.masks
+    for cell in bits(position.empty & LOWER_MASK):
+        for square in SQUARE_MASKS[cell]:
+            if masks[p] & square == square:
+                score += THREAT_VALUE
+                break
+            if masks[1 - p] & square == square:
+                score -= THREAT_VALUE
+                break
+    return score
+
+
+def _order_key(move: Move) -> Tuple[int, int]:
+    if move.cat == "square" and move.take_sq != -1:
+        return 0, -move.put
+    return _CATEGORY_ORDER[move.cat], -move.put
+
+
+def _to_tt(score: int, ply: int) -> int:
+    """
+    win scores are stored as distance from position, not from root
+    """
+    if score > _WIN_BOUND:
+        return score + ply
+    if score < -_WIN_BOUND:
+        return score - ply
+    return score
+
+
+def _from_tt(score: int, ply: int) -> int:
+    if score > _WIN_BOUND:
+        return score - ply
+    if score < -_WIN_BOUND:
+        return score + ply
+    return score
+
+
+class Searcher:
+    """
+    Alpha-beta (negamax) search with iterative deepening, transposition table
+    and move ordering (transposition table move, killer moves, squares before steps before puts),
+    deepens until **time_budget** seconds per move are spent or **max_depth** is reached;
+    keeps transposition table between moves, so one searcher should play one game.
+    Searcher is also common.match Bot
+    - **tt_size**: entries of transposition table, 0 disables it
+    """
+    def __init__(
+        self, time_budget: float = SEARCH_TIME, max_depth: int = MAX_DEPTH, tt_size: int = TT_SIZE
+    ) -> None:
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.tt_size = tt_size
+        # position hash => (depth, score, bound, best move)
+        self._tt: Dict[int, Tuple[int, int, int, Optional[Move]]] = {}
+        self._killers: List[List[Move]] = [[] for _ in range(0, MAX_DEPTH + 1)]
+        self._position = Position()
+        self._nodes = 0
+        self._deadline = 0.0
+
+    def __call__(self, position: Position, legal: Sequence[Move]) -> Move:
+        return self.search(position, legal).move
+
+    def search(
+        self, position: Position, legal: Optional[Sequence[Move]] = None, time_budget: Optional[float] = None
+    ) -> SearchResult:
+        """
+        best move of player to move among **legal** (all legal moves by default),
+        **position** is left as it was
+        - **time_budget**: overrides searcher's time budget for this move
+        """
+        start = perf_counter()
+        budget = self.time_budget if time_budget is None else time_budget
+        self._deadline = start + budget
+        self._position = position
+        self._nodes = 0
+        self._killers = [[] for _ in range(0, MAX_DEPTH + 1)]
+        moves = list(position.legal_moves() if legal is None else legal)
+        if not moves or position.tokens[position.player - 1] == 0:
+            return SearchResult(None, -WIN_SCORE, 0, 0, perf_counter() - start)
+        moves.sort(key=_order_key)
+        best, score, completed = moves[0], 0, 0
+        made = len(position.history)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, move = self._root(moves, depth)
+            except _Timeout:
+                while len(position.history) > made:
+                    position.unmake()
+                break
+            best, completed = move, depth
+            # best move first in next iteration
+            moves.remove(move)
+            moves.insert(0, move)
+            elapsed = perf_counter() - start
+            # next iteration takes several times longer, it wouldn't finish
+            if abs(score) > _WIN_BOUND or elapsed > budget / 2:
+                break
+        return SearchResult(best, score, completed, self._nodes, perf_counter() - start)
+
+    def _root(self, moves: List[Move], depth: int) -> Tuple[int, Move]:
+        position = self._position
+        alpha, best = -WIN_SCORE - 1, moves[0]
+        for move in moves:
+            position.make(move)
+            score = -self._negamax(depth - 1, -WIN_SCORE - 1, -alpha, 1)
+            position.unmake()
+            if score > alpha:
+                alpha, best = score, move
+        return alpha, best
+
+    def _negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self._nodes += 1
+        if not self._nodes & _CHECK_EVERY and perf_counter() > self._deadline:
+            raise _Timeout
+        position = self._position
+        if position.tokens[position.player - 1] == 0:
+            return ply - WIN_SCORE
+
+        entry = self._tt.get(position.hash) if self.tt_size else None
+        tt_move = None
+        if entry is not None:
+            tt_depth, tt_score, bound, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = _from_tt(tt_score, ply)
+                if (
+                    bound == _EXACT
+                    or (bound == _LOWER and tt_score >= beta)
+                    or (bound == _UPPER and tt_score <= alpha)
+                ):
+                    return tt_score
+
+        if depth == 0:
+            return evaluate(position)
+        moves = position.legal_moves()
+        if not moves:
+            return ply - WIN_SCORE
+        moves.sort(key=_order_key)
+        killers = self._killers[ply] if ply <= MAX_DEPTH else []
+        for first in killers + ([tt_move] if tt_move is not None else []):
+            if first in moves:
+                moves.remove(first)
+                moves.insert(0, first)
+
+        original_alpha = alpha
+        best_score, best_move = -WIN_SCORE - 1, None
+        for move in moves:
+            position.make(move)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if move not in killers and ply <= MAX_DEPTH:
+                            killers[:] = [move] + killers[:1]
+                        break
+
+        if self.tt_size:
+            if len(self._tt) >= self.tt_size:
+                self._tt.clear()
+            if best_score <= original_alpha:
+                bound = _UPPER
+            elif best_score >= beta:
+                bound = _LOWER
+            else:
+                bound = _EXACT
+            self._tt[position.hash] = (depth, _to_tt(best_score, ply), bound, best_move)
+        return best_score
+
+
+if __name__ == "__main__":
+    from common.match import random_bot, run_matches, score
+
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else SEARCH_TIME
+    position, searcher = Position(), Searcher(budget)
+    nodes, seconds = 0, 0.0
+    while position.legal_moves():
+        result = searcher.search(position)
+        nodes, seconds = nodes + result.nodes, seconds + result.seconds
+        print(f"turn {position.turn}: {result.move} score {result.score} depth {result.depth} "
+              f"{result.nodes} nodes {result.nps:.0f} nps")
+        position.make(result.move)
+    print(f"self-play: {len(position.history)} moves, {nodes / seconds:.0f} nps on average")
+    wins = score(run_matches(Searcher(budget / 10), random_bot, 20))
+    print(f"search vs random: {wins[0]} / {wins[1]}, {wins[2]} without winner")
@@ -0,0 +1,305 @@
+import mmap
+import os
+import sys
+from enum import Enum
+from random import Random
+from struct import Struct, error as StructError
+from time import perf_counter
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from common.match import Bot
+from common.pylos import (
+    CELLS,
+    BitBoard,
+    Move,
+    Position,
+    canonical_bitboard,
+    inverse_symmetry,
+    position_key,
+    transform_move,
+)
+from common.search import Searcher
+
+TABLEBASE_MAGIC = b"PYTB\x01"
+TABLEBASE_PATH = "pylos.pytb"
+BOOK_PLIES = 3
+"""
+openings up to this many plies from start are all in book
+"""
+BOOK_DEPTH = 6
+ENDGAME_EMPTY_CELLS = 6
+"""
+positions with at most this many empty cells in pyramid are endgames
+"""
+ENDGAME_DEPTH = 12
+ENDGAME_TIME = 2.0
+"""
+seconds of search spent on endgame position before it is left unsolved
+"""
+
+# magic, number of slots (power of 2), number of entries
+_HEADER = Struct("<5s3xQQ")
+# canonical position key (0 is empty slot), packed canonical move, plies to end
+_ENTRY = Struct("<QHh")
+_NO_MOVE = 0xFFFF
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class Result(str, Enum):
+    """
+    Result of position for player to move with best play
+    - **unknown**: position isn't solved, move is only recommended (opening book)
+    """
+    win = "win"
+    loss = "loss"
+    unknown = "unknown"
+
+
+class TablebaseEntry(NamedTuple):
+    """
+    - **move**: best move, None if player to move has no legal move
+    - **plies**: plies to end of game with best play, 0 if result is unknown
+    """
+    move: Optional[Move]
+    result: Result
+    plies: int
+
+
+def _slot(key: int, bits: int) -> int:
+    """
+    start of probing for **key** in table of 2 ** **bits** slots
+    """
+    return ((key * _HASH_MULTIPLIER) & _MASK64) >> (64 - bits)
+
+
+def _canonical_position(bitboard: BitBoard, player: int) -> Tuple[Position, int]:
+    """
+    canonical position of symmetry class and symmetry mapping **bitboard** onto it
+    """
+    canonical, sym = canonical_bitboard(bitboard)
+    return Position(canonical, turn=0 if player == 2 else 1), sym
+
+
+class Tablebase:
+    """
+    Read-only memory-mapped table of solved positions and book moves,
+    open addressing hash table keyed by canonical_key, so symmetric positions share one entry
+    and lookup costs one canonicalization and usually one probe; raises ValueError if **path**
+    isn't tablebase file
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self._slots, self._entries = _HEADER.unpack_from(self._map)
+        except StructError:
+            self._map.close()
+            raise ValueError(f"{path} is not tablebase")
+        if magic != TABLEBASE_MAGIC or len(self._map) != _HEADER.size + self._slots * _ENTRY.size:
+            self._map.close()
+            raise ValueError(f"{path} is not tablebase")
+        self._bits = self._slots.bit_length() - 1
+
+    def __len__(self) -> int:
+        return self._entries
+
+    def __getstate__(self) -> dict:
+        # mapping is opened again where tablebase is unpickled, e.g. in process pool worker
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["path"])
+
+    def lookup(self, bitboard: BitBoard, player: int) -> Optional[TablebaseEntry]:
+        """
+        entry of position, move mapped onto **bitboard**, None if position isn't in table
+        """
+        canonical, sym = canonical_bitboard(bitboard)
+        key = position_key(canonical, player)
+        mask = self._slots - 1
+        slot = _slot(key, self._bits)
+        while True:
+            stored, packed, plies = _ENTRY.unpack_from(self._map, _HEADER.size + slot * _ENTRY.size)
+            if stored == key:
+                break
+            if stored == 0:
+                return None
+            slot = (slot + 1) & mask
+        move = None
+        if packed != _NO_MOVE:
+            move = transform_move(Move.from_int(packed), inverse_symmetry(sym))
+        if plies > 0:
+            return TablebaseEntry(move, Result.win, plies)
+        if plies < 0:
+            return TablebaseEntry(move, Result.loss, -plies)
+        return TablebaseEntry(move, Result.unknown, 0)
+
+    def probe(self, position: Position) -> Optional[TablebaseEntry]:
+        return self.lookup(position.bitboard, position.player)
+
+    def close(self):
+        self._map.close()
+
+
+def open_tablebase(path: str = TABLEBASE_PATH) -> Optional[Tablebase]:
+    """
+    tablebase at **path**, None if there is no file or it isn't tablebase
+    """
+    try:
+        return Tablebase(path)
+    except (OSError, ValueError):
+        return None
+
+
+class TablebaseBot:
+    """
+    common.match Bot playing move from **tablebase** when position is in it,
+    otherwise move of **fallback** bot
+    """
+    def __init__(self, tablebase: Tablebase, fallback: Bot) -> None:
+        self.tablebase = tablebase
+        self.fallback = fallback
+
+    def __call__(self, position: Position, legal: Sequence[Move]) -> Move:
+        entry = self.tablebase.probe(position)
+        if entry is not None and entry.move in legal:
+            return entry.move
+        return self.fallback(position, legal)
+
+
+class TablebaseBuilder:
+    """
+    Collects entries of tablebase and writes its file
+    """
+    def __init__(self) -> None:
+        # canonical key => packed canonical move, plies to end (positive win, negative loss, 0 unknown)
+        self.entries: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, position: Position) -> bool:
+        return position.canonical_key in self.entries
+
+    def add(self, position: Position, entry: TablebaseEntry):
+        canonical, sym = canonical_bitboard(position.bitboard)
+        packed = _NO_MOVE if entry.move is None else transform_move(entry.move, sym).to_int()
+        plies = {Result.win: entry.plies, Result.loss: -entry.plies, Result.unknown: 0}[entry.result]
+        self.entries[position_key(canonical, position.player)] = packed, plies
+
+    def solve(self, position: Position, searcher: Searcher, book: bool = False) -> Optional[TablebaseEntry]:
+        """
+        search position and add it, unless it isn't solved and it isn't **book** position
+        """
+        canonical, sym = _canonical_position(position.bitboard, position.player)
+        result = searcher.search(canonical)
+        move = None if result.move is None else transform_move(result.move, inverse_symmetry(sym))
+        plies = result.plies_to_end
+        if plies is None:
+            entry = TablebaseEntry(move, Result.unknown, 0) if book else None
+        elif result.score > 0:
+            entry = TablebaseEntry(move, Result.win, plies)
+        else:
+            entry = TablebaseEntry(move, Result.loss, plies)
+        if entry is not None:
+            self.add(position, entry)
+        return entry
+
+    def pack(self) -> bytes:
+        slots = 1
+        # load factor at most 1/2 keeps probe sequences short
+        while slots < 2 * len(self.entries):
+            slots *= 2
+        bits = slots.bit_length() - 1
+        table = bytearray(slots * _ENTRY.size)
+        for key, (packed, plies) in self.entries.items():
+            slot = _slot(key, bits)
+            while _ENTRY.unpack_from(table, slot * _ENTRY.size)[0]:
+                slot = (slot + 1) & (slots - 1)
+            _ENTRY.pack_into(table, slot * _ENTRY.size, key, packed, plies)
+        return _HEADER.pack(TABLEBASE_MAGIC, slots, len(self.entries)) + bytes(table)
+
+    def write(self, path: str):
+        """
+        replace file at once, so open tablebase is never seen half written
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.pack())
+        os.replace(tmp, path)
+
+
+def book_positions(plies: int = BOOK_PLIES) -> List[Position]:
+    """
+    positions up to **plies** plies from start, one of every symmetry class
+    """
+    seen = set()
+    res, level = [], [Position()]
+    for depth in range(0, plies + 1):
+        following = []
+        for position in level:
+            key = position.canonical_key
+            if key in seen:
+                continue
+            seen.add(key)
+            res.append(position)
+            if depth < plies:
+                for move in position.legal_moves():
+                    child = position.copy()
+                    child.make(move)
+                    following.append(child)
+        level = following
+    return res
+
+
+def endgame_positions(
+    games: int, empty_cells: int = ENDGAME_EMPTY_CELLS, seed: int = 0
+) -> Iterator[Position]:
+    """
+    endgame positions of **games** random games, with at most **empty_cells** empty cells
+    and player to move having a move
+    """
+    rng = Random(seed)
+    for _ in range(0, games):
+        position = Position()
+        moves = position.legal_moves()
+        while moves:
+            if CELLS - bin(position.occupied).count("1") <= empty_cells:
+                yield position.copy()
+            position.make(rng.choice(moves))
+            moves = position.legal_moves()
+
+
+def build(
+    book_plies: int = BOOK_PLIES,
+    endgame_games: int = 1000,
+    book_depth: int = BOOK_DEPTH,
+    endgame_depth: int = ENDGAME_DEPTH,
+    endgame_time: float = ENDGAME_TIME,
+    seed: int = 0,
+) -> TablebaseBuilder:
+    """
+    opening book of all positions up to **book_plies** plies (searched **book_depth** plies deep)
+    and endgames of **endgame_games** random games solved by search to the end of game
+    """
+    builder = TablebaseBuilder()
+    book = Searcher(time_budget=float("inf"), max_depth=book_depth)
+    for position in book_positions(book_plies):
+        builder.solve(position, book, book=True)
+    endgame = Searcher(time_budget=endgame_time, max_depth=endgame_depth)
+    for position in endgame_positions(endgame_games, seed=seed):
+        if position not in builder:
+            builder.solve(position, endgame)
+    return builder
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else TABLEBASE_PATH
+    book_plies = int(sys.argv[2]) if len(sys.argv) > 2 else BOOK_PLIES
+    games = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    start = perf_counter()
+    builder = build(book_plies, games)
+    builder.write(path)
+    seconds = perf_counter() - start
+    print(f"{len(builder)} positions in {os.path.getsize(path)} bytes, built in {seconds:.0f}s")
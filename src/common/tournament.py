@@ -0,0 +1,144 @@
+from enum import Enum
+from math import ceil, log2
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+INITIAL_RATING = 1500.0
+ELO_K = 32.0
+"""
+max rating change of single game
+"""
+
+Pairing = Tuple[int, int]
+
+
+class TournamentFormat(str, Enum):
+    """
+    - **round_robin**: everybody plays everybody
+    - **swiss**: players with equal points play each other, nobody plays the same opponent twice
+        (while it is possible)
+    - **gauntlet**: first player plays all the others
+    """
+    round_robin = "round_robin"
+    swiss = "swiss"
+    gauntlet = "gauntlet"
+
+
+def expected_score(rating: float, opponent: float) -> float:
+    """
+    probability of player with **rating** beating **opponent**
+    """
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+
+def elo_change(winner: float, loser: float, k: float = ELO_K) -> float:
+    """
+    rating points winner gets and loser loses
+    """
+    return k * (1 - expected_score(winner, loser))
+
+
+def round_robin(players: Sequence[int], cycles: int = 1) -> List[List[Pairing]]:
+    """
+    rounds in which every player plays every other player **cycles** times and
+    nobody plays twice in the same round (circle method), with odd number of players
+    one player sits out every round
+    """
+    ring: List[Optional[int]] = list(players)
+    if len(ring) % 2:
+        ring.append(None)
+    rounds = []
+    for _ in range(0, cycles):
+        for _ in range(0, len(ring) - 1):
+            half = len(ring) // 2
+            rounds.append(
+                [
+                    (a, b)
+                    for a, b in zip(ring[:half], reversed(ring[half:]))
+                    if a is not None and b is not None
+                ]
+            )
+            ring.insert(1, ring.pop())
+    return rounds
+
+
+def gauntlet(players: Sequence[int], cycles: int = 1) -> List[List[Pairing]]:
+    """
+    rounds in which first player plays every other player **cycles** times,
+    all games of round are played at once
+    """
+    challenger, *opponents = players
+    return [[(challenger, opponent) for opponent in opponents] for _ in range(0, cycles)]
+
+
+def swiss_rounds(players_count: int) -> int:
+    """
+    default number of swiss rounds, enough to find single winner
+    """
+    return max(1, ceil(log2(max(players_count, 2))))
+
+
+class Standings:
+    """
+    Points of players in tournament, win is 1 point, bye is 1 point, game without result is 0 for both
+    """
+    def __init__(self, players: Iterable[int]) -> None:
+        self.players = list(players)
+        self.points: Dict[int, float] = {p: 0.0 for p in self.players}
+        self.wins: Dict[int, int] = {p: 0 for p in self.players}
+        self.loses: Dict[int, int] = {p: 0 for p in self.players}
+        self.opponents: Dict[int, List[int]] = {p: [] for p in self.players}
+        self.byes: Set[int] = set()
+
+    def add(self, player1: int, player2: int, winner: Optional[int]):
+        """
+        result of game, **winner** is None if game has no result
+        """
+        self.opponents[player1].append(player2)
+        self.opponents[player2].append(player1)
+        if winner is None:
+            return
+        loser = player2 if winner == player1 else player1
+        self.points[winner] += 1
+        self.wins[winner] += 1
+        self.loses[loser] += 1
+
+    def add_bye(self, player: int):
+        self.byes.add(player)
+        self.points[player] += 1
+
+    def played(self) -> Set[FrozenSet[int]]:
+        return {frozenset((p, o)) for p, opponents in self.opponents.items() for o in opponents}
+
+    def buchholz(self, player: int) -> float:
+        """
+        sum of opponents points, tie break
+        """
+        return sum(self.points[o] for o in self.opponents[player])
+
+    def ranking(self) -> List[int]:
+        """
+        players by points, then buchholz, then by order they were given in
+        """
+        order = {p: i for i, p in enumerate(self.players)}
+        return sorted(self.players, key=lambda p: (-self.points[p], -self.buchholz(p), order[p]))
+
+
+def swiss_pairings(standings: Standings) -> Tuple[List[Pairing], Optional[int]]:
+    """
+    pairings of next swiss round and player that gets bye (None if players count is even),
+    bye goes to lowest ranked player that didn't have one yet, then every player is paired
+    with highest ranked player they haven't played yet (or with the next one if they played all)
+    """
+    ranking = standings.ranking()
+    bye = None
+    if len(ranking) % 2:
+        bye = next((p for p in reversed(ranking) if p not in standings.byes), ranking[-1])
+        ranking.remove(bye)
+    played = standings.played()
+    pairings = []
+    while ranking:
+        player = ranking.pop(0)
+        opponent = next((o for o in ranking if frozenset((player, o)) not in played), ranking[0])
+        ranking.remove(opponent)
+        pairings.append((player, opponent))
+    return pairings, bye
@@ -0,0 +1,307 @@
+import json
+from datetime import datetime, timezone
+from enum import Enum
+from struct import Struct, error as StructError
+from typing import Iterator, List, Sequence, Tuple, Union
+from common.messages import (
+    BadMsgResp,
+    GameOverMsg,
+    GameStateDeltaMsg,
+    GameStateMsg,
+    MoveMsg,
+    Msg,
+    ResyncMsg,
+    YourMoveMsg,
+    msg_from_json,
+)
+from common.pylos import CELL_COORDS, CELLS, Board, LegalList, Move, cell_index, generate_empty_board
+
+
+class Encoding(str, Enum):
+    """
+    Websocket wire format
+    - **json**: json text frames (default)
+    - **binary**: compact binary frames, see encode
+    """
+    json = "json"
+    binary = "binary"
+
+
+class WireError(ValueError):
+    pass
+
+
+# type tag (first byte of every binary frame)
+TAGS = {
+    MoveMsg: 1,
+    GameStateMsg: 2,
+    YourMoveMsg: 3,
+    GameStateDeltaMsg: 4,
+    ResyncMsg: 5,
+    GameOverMsg: 6,
+    BadMsgResp: 7,
+}
+_TAG_TYPES = {tag: cls for cls, tag in TAGS.items()}
+
+_MOVE = Struct("<H")
+# seq, turn, tokens, board
+_STATE = Struct("<IIBBQ")
+# id, name length
+_PLAYER = Struct("<IB")
+# milliseconds left of players, _NO_CLOCK if not limited
+_CLOCKS = Struct("<ii")
+_NO_CLOCK = -1
+# seq, turn, tokens change, applied move (0xffff if none), changed cells count
+_DELTA = Struct("<IIbbHB")
+# winner id, winner tokens, name length
+_GAME_OVER = Struct("<IBB")
+_NO_MOVE = 0xFFFF
+EXPORT_MAGIC = b"PYLX\x01"
+"""
+first bytes of binary games export
+"""
+# id, player1 id, player2 id, winner id (0 if none), winner tokens,
+# started at, finished at (unix timestamps), name length, moves count
+_EXPORT_GAME = Struct("<IIIIBddHH")
+
+
+def pack_board(board: Board) -> int:
+    """
+    board as 60 bit integer, 2 bits per cell in bitboard cell order
+    """
+    return sum(board[level][x][y] << 2 * i for i, (level, x, y) in enumerate(CELL_COORDS))
+
+
+def unpack_board(packed: int) -> Board:
+    board = generate_empty_board()
+    for i, (level, x, y) in enumerate(CELL_COORDS):
+        board[level][x][y] = packed >> 2 * i & 3
+    return board
+
+
+def pack_moves(moves: Sequence[Move]) -> bytes:
+    """
+    moves as 2 bytes each (Move.to_int, little endian), for move logs
+    """
+    return Struct(f"<{len(moves)}H").pack(*(m.to_int() for m in moves))
+
+
+def unpack_moves(data: bytes) -> List[Move]:
+    """
+    reverse of pack_moves, raises WireError if **data** isn't packed moves
+    """
+    try:
+        return [Move.from_int(m) for m in Struct(f"<{len(data) // 2}H").unpack(data)]
+    except (StructError, ValueError) as e:
+        raise WireError("malformed move log") from e
+
+
+def pack_game(game: dict) -> bytes:
+    """
+    finished game in binary export: header, utf-8 name and packed move log,
+    **game** has fields of GameRecord and moves (as packed by pack_moves)
+    """
+    name = game["name"].encode()
+    return (
+        _EXPORT_GAME.pack(
+            game["id"],
+            game["player1_id"],
+            game["player2_id"],
+            game["winner_id"] or 0,
+            game["winner_tokens"],
+            game["started_at"].timestamp(),
+            game["finished_at"].timestamp(),
+            len(name),
+            len(game["moves"]) // 2,
+        )
+        + name
+        + game["moves"]
+    )
+
+
+def iter_games(data: bytes) -> Iterator[dict]:
+    """
+    games of binary export (EXPORT_MAGIC followed by pack_game records),
+    with moves unpacked, raises WireError if **data** isn't binary export
+    """
+    if not data.startswith(EXPORT_MAGIC):
+        raise WireError("not a games export")
+    offset = len(EXPORT_MAGIC)
+    while offset < len(data):
+        try:
+            fields = _EXPORT_GAME.unpack_from(data, offset)
+        except StructError as e:
+            raise WireError("malformed games export") from e
+        game_id, player1, player2, winner, tokens, started, finished, name_len, count = fields
+        offset += _EXPORT_GAME.size
+        name = data[offset: offset + name_len]
+        moves = data[offset + name_len: offset + name_len + 2 * count]
+        if len(name) != name_len or len(moves) != 2 * count:
+            raise WireError("truncated games export")
+        offset += name_len + 2 * count
+        yield {
+            "id": game_id,
+            "name": name.decode(errors="replace"),
+            "player1_id": player1,
+            "player2_id": player2,
+            "winner_id": winner or None,
+            "winner_tokens": tokens,
+            "started_at": datetime.fromtimestamp(started, timezone.utc),
+            "finished_at": datetime.fromtimestamp(finished, timezone.utc),
+            "moves_count": count,
+            "moves": unpack_moves(moves),
+        }
+
+
+def _pack_moves(moves: Sequence[Union[Move, dict]]) -> bytes:
+    if isinstance(moves, LegalList):
+        return _MOVE.pack(len(moves)) + moves.packed
+    packed = [m.to_int() if isinstance(m, Move) else Move.from_dict(m).to_int() for m in moves]
+    return Struct(f"<H{len(packed)}H").pack(len(packed), *packed)
+
+
+def _unpack_moves(data: bytes, offset: int) -> Tuple[List[dict], int]:
+    (count,) = _MOVE.unpack_from(data, offset)
+    offset += _MOVE.size
+    packed = Struct(f"<{count}H").unpack_from(data, offset)
+    return [Move.from_int(m).to_dict() for m in packed], offset + 2 * count
+
+
+def _encode_state(msg: GameStateMsg) -> bytes:
+    parts = [
+        _STATE.pack(msg.seq, msg.turn, *msg.tokens, pack_board(msg.board)),
+        bytes([len(msg.players_ids)]),
+    ]
+    for player_id, name in zip(msg.players_ids, msg.players_names):
+        raw = name.encode()
+        parts.append(_PLAYER.pack(player_id, len(raw)) + raw)
+    parts.append(_pack_moves(msg.legal))
+    parts.append(_CLOCKS.pack(*(_NO_CLOCK if clock is None else clock for clock in msg.clocks)))
+    return b"".join(parts)
+
+
+def _decode_state(cls, data: bytes) -> GameStateMsg:
+    seq, turn, tokens1, tokens2, board = _STATE.unpack_from(data, 1)
+    offset = 1 + _STATE.size
+    players_ids, players_names = [], []
+    for _ in range(0, data[offset]):
+        player_id, length = _PLAYER.unpack_from(data, offset + 1)
+        offset += _PLAYER.size
+        players_ids.append(player_id)
+        players_names.append(data[offset + 1: offset + 1 + length].decode())
+        offset += length
+    legal, offset = _unpack_moves(data, offset + 1)
+    clocks = _CLOCKS.unpack_from(data, offset)
+    return cls(
+        {
+            "seq": seq,
+            "turn": turn,
+            "players_ids": players_ids,
+            "players_names": players_names,
+            "tokens": [tokens1, tokens2],
+            "board": unpack_board(board),
+            "legal": legal,
+            "clocks": [None if clock == _NO_CLOCK else clock for clock in clocks],
+        }
+    )
+
+
+def _encode_delta(msg: GameStateDeltaMsg) -> bytes:
+    move = _NO_MOVE if msg.move is None else Move.from_dict(msg.move).to_int()
+    head = _DELTA.pack(msg.seq, msg.turn, *msg.tokens, move, len(msg.changed))
+    return head + bytes(
+        b for level, x, y, value in msg.changed for b in (cell_index(level, x, y), value)
+    )
+
+
+def _decode_delta(data: bytes) -> GameStateDeltaMsg:
+    seq, turn, tokens1, tokens2, move, count = _DELTA.unpack_from(data, 1)
+    offset = 1 + _DELTA.size
+    changed = []
+    for i in range(offset, offset + 2 * count, 2):
+        if data[i] >= CELLS:
+            raise WireError(f"invalid cell: {data[i]}")
+        changed.append([*CELL_COORDS[data[i]], data[i + 1]])
+    return GameStateDeltaMsg(
+        {
+            "seq": seq,
+            "turn": turn,
+            "changed": changed,
+            "tokens": [tokens1, tokens2],
+            "move": None if move == _NO_MOVE else Move.from_int(move).to_dict(),
+        }
+    )
+
+
+def encode(msg: Msg) -> bytes:
+    """
+    message as binary frame: type tag byte followed by message specific layout
+    - moves are Move.to_int packed into 2 bytes
+    - board is pack_board, 8 bytes
+    """
+    cls = type(msg)
+    tag = bytes([TAGS[cls]])
+    if cls is MoveMsg:
+        return tag + _MOVE.pack(msg.to_move().to_int())
+    if cls is GameStateMsg or cls is YourMoveMsg:
+        return tag + _encode_state(msg)
+    if cls is GameStateDeltaMsg:
+        return tag + _encode_delta(msg)
+    if cls is GameOverMsg:
+        raw = msg.winner_name.encode()
+        return tag + _GAME_OVER.pack(msg.winner_id, msg.winner_tokens, len(raw)) + raw
+    if cls is BadMsgResp:
+        return tag + msg.detail.encode()
+    return tag
+
+
+def decode(data: bytes) -> Msg:
+    """
+    binary frame casting to object representing msg of given type,
+    raises TypeError for unknown type and WireError for malformed frame
+    """
+    if not data or data[0] not in _TAG_TYPES:
+        raise TypeError
+    cls = _TAG_TYPES[data[0]]
+    try:
+        if cls is MoveMsg:
+            (move,) = _MOVE.unpack_from(data, 1)
+            return MoveMsg(Move.from_int(move).to_dict())
+        if cls is GameStateMsg or cls is YourMoveMsg:
+            return _decode_state(cls, data)
+        if cls is GameStateDeltaMsg:
+            return _decode_delta(data)
+        if cls is GameOverMsg:
+            winner_id, winner_tokens, length = _GAME_OVER.unpack_from(data, 1)
+            offset = 1 + _GAME_OVER.size
+            return GameOverMsg(
+                {
+                    "winner_id": winner_id,
+                    "winner_name": data[offset: offset + length].decode(),
+                    "winner_tokens": winner_tokens,
+                }
+            )
+        if cls is BadMsgResp:
+            return BadMsgResp({"detail": data[1:].decode()})
+        return cls({})
+    except (StructError, UnicodeDecodeError, IndexError, ValueError) as e:
+        raise WireError(f"malformed {cls.__name__} frame") from e
+
+
+def encode_msg(msg: Msg, encoding: Encoding) -> Union[str, bytes]:
+    """
+    message in given encoding, str for json, bytes for binary
+    """
+    if encoding == Encoding.binary:
+        return encode(msg)
+    return json.dumps(msg.to_dict())
+
+
+def decode_msg(data: Union[str, bytes], encoding: Encoding) -> Msg:
+    """
+    raises TypeError for unknown message type, ValueError (WireError, JSONDecodeError)
+    for malformed frame
+    """
+    if encoding == Encoding.binary:
+        return decode(data)
+    return msg_from_json(json.loads(data))
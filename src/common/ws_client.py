@@ -0,0 +1,116 @@
+from asyncio import StreamReader, StreamWriter, open_connection
+from typing import AsyncIterator, Union
+from urllib.parse import urlsplit
+from wsproto import ConnectionState, ConnectionType, WSConnection
+from wsproto.events import (
+    AcceptConnection,
+    BytesMessage,
+    CloseConnection,
+    Event,
+    Message,
+    Ping,
+    RejectConnection,
+    Request,
+    TextMessage,
+)
+
+READ_SIZE = 1 << 16
+
+Frame = Union[str, bytes]
+
+
+class ConnectionClosed(ConnectionError):
+    pass
+
+
+class WebSocketClient:
+    """
+    Minimal asyncio websocket client (wsproto over asyncio streams),
+    text frames are str, binary frames are bytes, pings are answered
+    """
+    def __init__(self, conn: WSConnection, reader: StreamReader, writer: StreamWriter) -> None:
+        self._conn = conn
+        self._reader = reader
+        self._writer = writer
+        self._events = self._read_events()
+
+    @classmethod
+    async def connect(cls, url: str) -> "WebSocketClient":
+        """
+        open websocket at **url** (ws://host:port/path?query), raises OSError
+        if server can't be reached, ConnectionClosed if it rejects handshake
+        """
+        parts = urlsplit(url)
+        reader, writer = await open_connection(parts.hostname, parts.port or 80)
+        client = cls(WSConnection(ConnectionType.CLIENT), reader, writer)
+        target = parts.path + ("?" + parts.query if parts.query else "")
+        client._write(Request(host=parts.netloc, target=target))
+        async for event in client._events:
+            if isinstance(event, AcceptConnection):
+                return client
+            if isinstance(event, RejectConnection):
+                break
+        writer.close()
+        raise ConnectionClosed(f"websocket handshake with {url} failed")
+
+    def _write(self, event: Event):
+        self._writer.write(self._conn.send(event))
+
+    async def _read_events(self) -> AsyncIterator[Event]:
+        """
+        events received from server, messages are complete
+        """
+        conn = self._conn
+        text, data = [], []
+        while True:
+            chunk = await self._reader.read(READ_SIZE)
+            conn.receive_data(chunk or None)
+            for event in conn.events():
+                if isinstance(event, Ping):
+                    self._write(event.response())
+                elif isinstance(event, Message):
+                    (text if isinstance(event, TextMessage) else data).append(event.data)
+                    if event.message_finished:
+                        if isinstance(event, TextMessage):
+                            yield TextMessage("".join(text))
+                        else:
+                            yield BytesMessage(b"".join(data))
+                        text, data = [], []
+                else:
+                    yield event
+            if not chunk:
+                return
+
+    async def send(self, frame: Frame):
+        """
+        raises ConnectionClosed if connection is closed
+        """
+        if self._conn.state != ConnectionState.OPEN:
+            raise ConnectionClosed
+        if isinstance(frame, bytes):
+            self._write(BytesMessage(frame))
+        else:
+            self._write(TextMessage(frame))
+        await self._writer.drain()
+
+    async def receive(self) -> Frame:
+        """
+        next message, raises ConnectionClosed when connection is closed
+        """
+        async for event in self._events:
+            if isinstance(event, (TextMessage, BytesMessage)):
+                return event.data
+            if isinstance(event, CloseConnection):
+                if self._conn.state == ConnectionState.REMOTE_CLOSING:
+                    self._write(event.response())
+                break
+        raise ConnectionClosed
+
+    async def close(self, code: int = 1000):
+        if self._conn.state == ConnectionState.OPEN:
+            self._write(CloseConnection(code=code))
+        self._writer.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._conn.state != ConnectionState.OPEN
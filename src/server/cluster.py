@@ -0,0 +1,101 @@
+import os
+from asyncio import FIRST_COMPLETED, create_task, wait
+from typing import Sequence
+from fastapi import WebSocket, WebSocketDisconnect
+from common.ws_client import ConnectionClosed, WebSocketClient
+
+
+class Cluster:
+    """
+    Game sessions sharded across worker processes, worker **index** owns games
+    with game_id % **workers** == **index**, connections to other games are proxied to their owner
+    - **urls**: websocket base url of every worker (e.g. ws://127.0.0.1:8001), indexed by worker
+    """
+    def __init__(self, index: int = 0, workers: int = 1, urls: Sequence[str] = ()) -> None:
+        if workers > 1 and len(urls) != workers:
+            raise ValueError("url of every worker is needed")
+        if not 0 <= index < workers:
+            raise ValueError(f"invalid worker index: {index}")
+        self.index = index
+        self.workers = workers
+        self.urls = list(urls)
+
+    @classmethod
+    def from_env(cls) -> "Cluster":
+        """
+        configured by PYLON_WORKERS (workers count), PYLON_WORKER (index of this worker)
+        and PYLON_WORKER_URLS (comma separated urls), single worker if not set
+        """
+        urls = os.environ.get("PYLON_WORKER_URLS", "")
+        return cls(
+            int(os.environ.get("PYLON_WORKER", 0)),
+            int(os.environ.get("PYLON_WORKERS", 1)),
+            [url.strip() for url in urls.split(",") if url.strip()],
+        )
+
+    @property
+    def sharded(self) -> bool:
+        return self.workers > 1
+
+    def owner(self, game_id: int) -> int:
+        return game_id % self.workers
+
+    def is_local(self, game_id: int) -> bool:
+        return self.owner(game_id) == self.index
+
+    def url(self, game_id: int) -> str:
+        return self.urls[self.owner(game_id)]
+
+
+async def proxy_websocket(websocket: WebSocket, url: str):
+    """
+    pass frames between **websocket** and websocket at **url** until either side closes
+    """
+    try:
+        upstream = await WebSocketClient.connect(url)
+    except OSError:
+        await websocket.close()
+        return
+    await websocket.accept()
+
+    async def downstream_to_upstream():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                await upstream.send(message["bytes"])
+            else:
+                await upstream.send(message["text"])
+
+    async def upstream_to_downstream():
+        while True:
+            frame = await upstream.receive()
+            if isinstance(frame, bytes):
+                await websocket.send_bytes(frame)
+            else:
+                await websocket.send_text(frame)
+
+    async def until_closed(forward):
+        try:
+            await forward()
+        except ConnectionClosed:
+            pass
+
+    tasks = [
+        create_task(until_closed(downstream_to_upstream)),
+        create_task(until_closed(upstream_to_downstream)),
+    ]
+    try:
+        await wait(tasks, return_when=FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await upstream.close()
+        try:
+            await websocket.close()
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+
+
+cluster = Cluster.from_env()
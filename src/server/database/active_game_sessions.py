@@ -1,52 +1,289 @@
-from common.messages import Msg
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import count
+from struct import Struct, error as StructError
+from time import monotonic
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from common.messages import Msg, Protocol
+from common.wire import Encoding
 from fastapi import WebSocket
-from server.database.game_session import GameSession, GameSessionState
+from server.cluster import Cluster, cluster
+from server.database.game_session import GameSession, GameSessionState, GameStatus, Pacing, TimeControl
+from server.database.lobby import Page, SharedLobby
+
+
+FINISHED_RETENTION = 600.0
+"""
+seconds finished game session stays listed (and accepts spectators) before it is evicted
+"""
+GRAM = 3
+PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+SNAPSHOT_MAGIC = b"PYLS\x02"
+_SNAPSHOT_LENGTH = Struct("<I")
+
+
+def _grams(text: str) -> Set[str]:
+    """
+    substrings of length GRAM, whole **text** if it is shorter
+    """
+    if len(text) <= GRAM:
+        return {text}
+    return {text[i: i + GRAM] for i in range(0, len(text) - GRAM + 1)}
+
+
+class NameIndex:
+    """
+    Substring index of game names, every name is indexed by its substrings of length GRAM,
+    so query is answered by intersecting few sets instead of scanning every name,
+    shorter queries scan only distinct grams
+    """
+    def __init__(self) -> None:
+        self._ids: Dict[str, Set[int]] = {}
+
+    def _keys(self, name: str) -> Set[str]:
+        return _grams(name)
+
+    def add(self, game_id: int, name: str):
+        for key in self._keys(name):
+            self._ids.setdefault(key, set()).add(game_id)
+
+    def remove(self, game_id: int, name: str):
+        for key in self._keys(name):
+            ids = self._ids[key]
+            ids.discard(game_id)
+            if not ids:
+                del self._ids[key]
+
+    def candidates(self, query: str) -> Set[int]:
+        """
+        ids of games whose names may contain **query**, exact for queries up to GRAM long
+        """
+        if len(query) < GRAM:
+            return set().union(*(ids for key, ids in self._ids.items() if query in key))
+        sets = sorted((self._ids.get(key, set()) for key in _grams(query)), key=len)
+        return sets[0].intersection(*sets[1:])
+
+
+def _page(states: Sequence[GameSessionState], ids: Sequence[int], cursor: int, limit: int) -> Page:
+    """
+    up to **limit** states of games with id greater than **cursor**, **ids** are sorted ids of **states**
+    and cursor of next page (None if this is the last one)
+    """
+    start = bisect_right(ids, cursor)
+    page = list(states[start: start + limit])
+    next_cursor = page[-1].game_id if start + limit < len(states) else None
+    return page, next_cursor
 
 
 class GameSessionsManager:
     """
     Proxy in game session communication
+    - **retention**: seconds after which finished game session is evicted
+    - **cluster**: if sharded, manager holds only games owned by its worker
+        (new games get ids owned by it) and lists games of all workers from SharedLobby
     """
-    def __init__(self) -> None:
-        self.games: list[GameSession] = []
+    def __init__(self, retention: float = FINISHED_RETENTION, cluster: Cluster = Cluster()) -> None:
+        self.retention = retention
+        self.cluster = cluster
+        # set on server shutdown, disconnected players don't resign then
+        self.closing = False
+        self.lobby: Optional[SharedLobby] = SharedLobby(cluster.index) if cluster.sharded else None
+        self.games: Dict[int, GameSession] = {}
+        self._by_name: Dict[str, GameSession] = {}
+        self._names = NameIndex()
+        self._ids = count(cluster.index, cluster.workers)
+        # id => time when game finished, in finishing order
+        self._finished: "OrderedDict[int, float]" = OrderedDict()
+        # status filter => (sorted ids, states), dropped whenever any session changes state
+        self._listings: Dict[Optional[GameStatus], Tuple[List[int], List[GameSessionState]]] = {}
 
-    def new_game(self, name: str) -> GameSessionState:
+    async def new_game(
+        self,
+        name: str,
+        pacing: Pacing = Pacing.realtime,
+        time_control: TimeControl = TimeControl(),
+        reserved: Optional[Sequence[int]] = None,
+    ) -> GameSessionState:
         """
-        raises NameError if there is already game with the same name
+        raises NameError if there is already game with the same name,
+        see GameSession for the rest of arguments
         """
-        conflicting_games = self.search_games(name)
-        if conflicting_games and len(
-            list(filter(lambda g: g.name == name, conflicting_games))
-        ):
+        self.evict_finished()
+        if name in self._by_name:
             raise NameError
-        id = len(self.games)
-        game = GameSession(id, name)
-        self.games.append(game)
+        game = GameSession(next(self._ids), name, pacing, self._on_state_change, time_control, reserved)
+        if self.lobby is not None:
+            await self.lobby.claim(game.state)
+        self.games[game.id] = game
+        self._by_name[name] = game
+        self._names.add(game.id, name)
+        self._listings.clear()
         return game.state
 
-    def search_games(self, name: str) -> GameSession:
-        return list(filter(lambda g: name in g.name, self.games))
+    def snapshot(self) -> bytes:
+        """
+        all not finished game sessions, see GameSession.snapshot
+        """
+        parts = [SNAPSHOT_MAGIC]
+        for game in self.games.values():
+            if not game.is_finished:
+                data = game.snapshot()
+                parts.append(_SNAPSHOT_LENGTH.pack(len(data)) + data)
+        return b"".join(parts)
+
+    async def restore(self, data: bytes) -> int:
+        """
+        add game sessions from snapshot, returns their number,
+        raises ValueError if **data** isn't snapshot
+        """
+        if not data.startswith(SNAPSHOT_MAGIC):
+            raise ValueError("not a game sessions snapshot")
+        # whole snapshot is checked before any session is restored (and starts its timers)
+        offset = len(SNAPSHOT_MAGIC)
+        games = []
+        while offset < len(data):
+            try:
+                (length,) = _SNAPSHOT_LENGTH.unpack_from(data, offset)
+            except StructError as e:
+                raise ValueError("truncated game sessions snapshot") from e
+            offset += _SNAPSHOT_LENGTH.size
+            if offset + length > len(data):
+                raise ValueError("truncated game sessions snapshot")
+            games.append(GameSession.unpack(data[offset: offset + length], self._on_state_change))
+            offset += length
+        restored = 0
+        for game in games:
+            if game.id in self.games or game.name in self._by_name:
+                continue
+            if self.lobby is not None:
+                await self.lobby.claim(game.state)
+            self.games[game.id] = game
+            self._by_name[game.name] = game
+            self._names.add(game.id, game.name)
+            game.await_players()
+            restored += 1
+        self._listings.clear()
+        if self.games:
+            # new ids after restored ones, still owned by this worker
+            last = max(self.games) // self.cluster.workers * self.cluster.workers + self.cluster.index
+            self._ids = count(last + self.cluster.workers, self.cluster.workers)
+        return restored
 
-    def list_games(self) -> GameSession:
-        return self.games
+    def _on_state_change(self, game: GameSession):
+        self._listings.clear()
+        if game.id not in self.games:
+            return
+        if game.is_finished:
+            self._finished[game.id] = monotonic()
+        if self.lobby is not None:
+            self.lobby.update(game.state)
 
-    async def connect(self, websocket: WebSocket, game_id: int, player_id: int):
+    def evict_finished(self, now: float = None):
+        """
+        forget game sessions finished more than **retention** seconds ago
+        """
+        deadline = (monotonic() if now is None else now) - self.retention
+        while self._finished:
+            game_id, finished = next(iter(self._finished.items()))
+            if finished > deadline:
+                break
+            del self._finished[game_id]
+            self._listings.clear()
+            game = self.games.pop(game_id)
+            del self._by_name[game.name]
+            self._names.remove(game_id, game.name)
+            if self.lobby is not None:
+                self.lobby.remove(game_id)
+
+    def get_game(self, game_id: int) -> GameSession:
+        """
+        raises IndexError if **game_id** doesnt corespond to any game
+        """
+        try:
+            return self.games[game_id]
+        except KeyError:
+            raise IndexError(game_id) from None
+
+    def search_games(self, name: str) -> List[GameSession]:
+        self.evict_finished()
+        if not name:
+            return self.list_games()
+        ids = self._names.candidates(name)
+        return [
+            game
+            for game in (self.games[game_id] for game_id in sorted(ids))
+            if name in game.name
+        ]
+
+    def list_games(self) -> List[GameSession]:
+        self.evict_finished()
+        return list(self.games.values())
+
+    def _listing(self, status: Optional[GameStatus]) -> Tuple[List[int], List[GameSessionState]]:
+        listing = self._listings.get(status)
+        if listing is None:
+            games = [g for g in self.games.values() if status is None or g.status == status]
+            listing = self._listings[status] = ([g.id for g in games], [g.state for g in games])
+        return listing
+
+    async def list_page(
+        self, cursor: int = -1, limit: int = PAGE_LIMIT, status: Optional[GameStatus] = None
+    ) -> Page:
+        """
+        states of games with id greater than **cursor** ordered by id, and cursor of next page,
+        served from snapshot rebuilt only after some session changed state
+        (or from SharedLobby if sharded)
+        - **status**: only games with this status, all if None
+        """
+        self.evict_finished()
+        if self.lobby is not None:
+            return await self.lobby.page(cursor, limit, status)
+        ids, states = self._listing(status)
+        return _page(states, ids, cursor, limit)
+
+    async def search_page(
+        self, name: str, cursor: int = -1, limit: int = PAGE_LIMIT, status: Optional[GameStatus] = None
+    ) -> Page:
+        """
+        like list_page, but only games that contain **name** in their names
+        """
+        if self.lobby is not None:
+            self.evict_finished()
+            return await self.lobby.page(cursor, limit, status, name)
+        games = [g for g in self.search_games(name) if status is None or g.status == status]
+        return _page([g.state for g in games], [g.id for g in games], cursor, limit)
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        game_id: int,
+        player_id: int,
+        protocol: Protocol = Protocol.full,
+        encoding: Encoding = Encoding.json,
+    ):
         """
         Throws IndexError if **game_id** doesnt corespond to any game
         """
-        await self.games[game_id].connect(websocket, player_id)
+        await self.get_game(game_id).connect(websocket, player_id, protocol, encoding)
 
     async def disconnect(self, websocket: WebSocket, game_id: int, player_id: int):
         """
-        Throws IndexError if **game_id** doesnt corespond to any game
+        Does nothing if game was already evicted, while closing player doesn't resign
         """
-        await self.games[game_id].disconnect(websocket, player_id)
+        game = self.games.get(game_id)
+        if game is None:
+            return
+        if self.closing:
+            game.detach(websocket)
+        else:
+            await game.disconnect(websocket, player_id)
 
     async def handle_msg(self, websocket: WebSocket, game_id: int, player_id: int, msg: Msg):
         """
         Throws IndexError if **game_id** doesnt corespond to any game
         """
-        await self.games[game_id].handle_msg(websocket, player_id, msg)
+        await self.get_game(game_id).handle_msg(websocket, player_id, msg)
 
 
-current_sessions = GameSessionsManager()
+current_sessions = GameSessionsManager(cluster=cluster)
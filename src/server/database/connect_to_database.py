@@ -3,5 +3,5 @@ from tortoise import Tortoise
 
 async def connectToDatabase():
     await Tortoise.init(
-        db_url="sqlite://db.sqlite3", modules={"models": ["models.user"]}
+        db_url="sqlite://db.sqlite3", modules={"models": ["models.user", "models.game", "models.lobby"]}
     )
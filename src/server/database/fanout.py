@@ -0,0 +1,256 @@
+from asyncio import Event, Task, create_task, gather, sleep, wait_for
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, Iterable, NamedTuple, Optional, Tuple, Union
+from common.messages import GameStateMsg, Msg, Protocol
+from common.wire import Encoding, encode_msg
+from fastapi import WebSocket
+
+
+SEND_TIMEOUT = 5.0
+"""
+seconds after which client that doesn't receive message is considered stuck and evicted
+"""
+SPECTATOR_QUEUE_SIZE = 64
+
+
+class Overflow(str, Enum):
+    """
+    What happens when spectator falls behind
+    - **drop_oldest**: oldest queued message is dropped when queue is full
+    - **coalesce**: new game state replaces all queued game states,
+        so only the latest board is sent
+    """
+    drop_oldest = "drop_oldest"
+    coalesce = "coalesce"
+
+
+class Format(NamedTuple):
+    """
+    What connection expects on the wire
+    """
+    protocol: Protocol = Protocol.full
+    encoding: Encoding = Encoding.json
+
+
+Frame = Union[str, bytes]
+
+
+class Payload:
+    """
+    Message in every protocol and encoding, each variant is serialized at most once
+    - **msg**: message for protocol=full
+    - **delta**: message for protocol=delta, if None **msg** is used
+    """
+    def __init__(self, msg: Msg, delta: Optional[Msg] = None) -> None:
+        self.replaceable = type(msg) is GameStateMsg
+        self._msgs = {Protocol.full: msg, Protocol.delta: msg if delta is None else delta}
+        self._frames: Dict[Tuple[int, Encoding], Frame] = {}
+
+    def frame(self, fmt: Format) -> Frame:
+        msg = self._msgs[fmt.protocol]
+        key = (id(msg), fmt.encoding)
+        try:
+            return self._frames[key]
+        except KeyError:
+            frame = self._frames[key] = encode_msg(msg, fmt.encoding)
+            return frame
+
+
+async def _send_frame(websocket: WebSocket, frame: Frame):
+    if type(frame) is bytes:
+        await wait_for(websocket.send_bytes(frame), SEND_TIMEOUT)
+    else:
+        await wait_for(websocket.send_text(frame), SEND_TIMEOUT)
+
+
+async def _close_quietly(websocket: WebSocket):
+    try:
+        await wait_for(websocket.close(), SEND_TIMEOUT)
+    except Exception:
+        pass
+
+
+class SpectatorFeed:
+    """
+    Bounded queue of serialized messages for single spectator, sent by its own task
+    - **delay**: seconds to wait before sending every message
+    - **on_evict**: called with feed when its client is stuck or gone
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        fmt: Format,
+        delay: float,
+        queue_size: int,
+        overflow: Overflow,
+        on_evict: Callable[["SpectatorFeed"], None],
+    ) -> None:
+        self.websocket = websocket
+        self.format = fmt
+        self.delay = delay
+        self.overflow = overflow
+        self.dropped = 0
+        self._pending: Deque[Tuple[Frame, bool]] = deque(maxlen=queue_size)
+        self._ready = Event()
+        self._closing = False
+        self._on_evict = on_evict
+        self._task: Task = create_task(self._run())
+
+    def push(self, payload: Payload):
+        """
+        queue message, full game states may be coalesced
+        """
+        frame = payload.frame(self.format)
+        replaceable = payload.replaceable and self.format.protocol == Protocol.full
+        if self.overflow == Overflow.coalesce and replaceable:
+            kept = [item for item in self._pending if not item[1]]
+            self.dropped += len(self._pending) - len(kept)
+            self._pending.clear()
+            self._pending.extend(kept)
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append((frame, replaceable))
+        self._ready.set()
+
+    def close(self):
+        """
+        close connection once all queued messages are sent
+        """
+        self._closing = True
+        self._ready.set()
+
+    def cancel(self):
+        # wait_for swallows cancellation when send completes at the same moment,
+        # task then finds nothing left to send and ends by itself
+        self._pending.clear()
+        self._closing = True
+        self._task.cancel()
+
+    async def _run(self):
+        try:
+            while True:
+                while not self._pending:
+                    if self._closing:
+                        await _close_quietly(self.websocket)
+                        return
+                    self._ready.clear()
+                    await self._ready.wait()
+                frame, _ = self._pending.popleft()
+                if self.delay:
+                    await sleep(self.delay)
+                await _send_frame(self.websocket, frame)
+        except Exception:
+            self._on_evict(self)
+            await _close_quietly(self.websocket)
+
+
+class Fanout:
+    """
+    Sends every message to many websockets, serializing it only once
+    - every connection gets message in its Format
+    - players get messages immediately and concurrently
+    - every spectator gets them through its own bounded SpectatorFeed,
+        so slow spectators never block the game
+    - clients that don't receive message in SEND_TIMEOUT are closed
+    """
+    def __init__(
+        self,
+        delay: float = 0,
+        queue_size: int = SPECTATOR_QUEUE_SIZE,
+        overflow: Overflow = Overflow.drop_oldest,
+    ) -> None:
+        self.delay = delay
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self._spectators: Dict[WebSocket, SpectatorFeed] = {}
+        self._formats: Dict[WebSocket, Format] = {}
+
+    @property
+    def spectators(self) -> Iterable[WebSocket]:
+        return self._spectators.keys()
+
+    def register(self, websocket: WebSocket, fmt: Format):
+        """
+        set format of player connection
+        """
+        self._formats[websocket] = fmt
+
+    def add_spectator(self, websocket: WebSocket, fmt: Format = Format()):
+        self._spectators[websocket] = SpectatorFeed(
+            websocket, fmt, self.delay, self.queue_size, self.overflow, self._evict
+        )
+
+    def remove(self, websocket: WebSocket):
+        """
+        forget connection, for spectators stop its feed
+        """
+        self._formats.pop(websocket, None)
+        feed = self._spectators.pop(websocket, None)
+        if feed is not None:
+            feed.cancel()
+
+    def _evict(self, feed: SpectatorFeed):
+        if self._spectators.get(feed.websocket) is feed:
+            del self._spectators[feed.websocket]
+
+    def format(self, websocket: WebSocket) -> Format:
+        feed = self._spectators.get(websocket)
+        if feed is not None:
+            return feed.format
+        return self._formats.get(websocket, Format())
+
+    async def send(self, websockets: Iterable[WebSocket], msg: Msg, delta: Optional[Msg] = None):
+        """
+        send message to **websockets** concurrently, stuck ones are closed
+        """
+        await self._send(websockets, Payload(msg, delta))
+
+    async def _send(self, websockets: Iterable[WebSocket], payload: Payload):
+        await gather(
+            *(
+                self._send_now(websocket, payload.frame(self.format(websocket)))
+                for websocket in websockets
+            )
+        )
+
+    async def _send_now(self, websocket: WebSocket, frame: Frame):
+        try:
+            await _send_frame(websocket, frame)
+        except Exception:
+            await _close_quietly(websocket)
+
+    def publish(self, msg: Msg, delta: Optional[Msg] = None):
+        """
+        queue message for all spectators
+        """
+        self._publish(Payload(msg, delta))
+
+    def _publish(self, payload: Payload):
+        for feed in self._spectators.values():
+            feed.push(payload)
+
+    async def broadcast(
+        self,
+        players: Iterable[WebSocket],
+        msg: Msg,
+        delta: Optional[Msg] = None,
+        intermediate: bool = False,
+    ):
+        """
+        send message to players and queue it for spectators
+        - **intermediate**: message is frame in the middle of move, players with
+            protocol=full don't get it, but players with protocol=delta need whole sequence
+        """
+        payload = Payload(msg, delta)
+        self._publish(payload)
+        if intermediate:
+            players = [p for p in players if self.format(p).protocol == Protocol.delta]
+        await self._send(players, payload)
+
+    def close_spectators(self):
+        """
+        close spectators connections once they receive all queued messages
+        """
+        for feed in self._spectators.values():
+            feed.close()
@@ -0,0 +1,92 @@
+import json
+from enum import Enum
+from typing import AsyncIterator, List
+from tortoise.queryset import QuerySet
+from common.pylos import Position
+from common.wire import EXPORT_MAGIC, pack_game, unpack_moves
+from server.database.models.game import GAME_RECORD_FIELDS
+
+
+EXPORT_CHUNK = 500
+"""
+games fetched from database at once, export holds at most this many games in memory
+"""
+
+
+class ExportFormat(str, Enum):
+    """
+    - **ndjson**: json object per line, moves as dicts
+    - **binary**: EXPORT_MAGIC followed by common.wire.pack_game records, see common.wire.iter_games
+    """
+    ndjson = "ndjson"
+    binary = "binary"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.binary: "application/octet-stream",
+}
+
+
+def _record(game: dict) -> dict:
+    record = {field: game[field] for field in GAME_RECORD_FIELDS}
+    record["started_at"] = game["started_at"].isoformat()
+    record["finished_at"] = game["finished_at"].isoformat()
+    return record
+
+
+def _line(obj: dict) -> bytes:
+    return json.dumps(obj).encode() + b"\n"
+
+
+async def iter_game_chunks(query: QuerySet, chunk: int = EXPORT_CHUNK) -> AsyncIterator[List[dict]]:
+    """
+    games of **query** with move logs in chunks, ordered by id,
+    every chunk is fetched by its own id range query (no offsets)
+    """
+    last = 0
+    while True:
+        games = await (
+            query.filter(id__gt=last).order_by("id").limit(chunk).values(*GAME_RECORD_FIELDS, "moves")
+        )
+        if games:
+            yield games
+        if len(games) < chunk:
+            return
+        last = games[-1]["id"]
+
+
+async def export_games(query: QuerySet, fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """
+    body of games export, single part per chunk of games
+    """
+    if fmt == ExportFormat.binary:
+        yield EXPORT_MAGIC
+    async for games in iter_game_chunks(query):
+        if fmt == ExportFormat.binary:
+            yield b"".join(pack_game(game) for game in games)
+        else:
+            yield b"".join(
+                _line({**_record(game), "moves": [m.to_dict() for m in unpack_moves(game["moves"])]})
+                for game in games
+            )
+
+
+async def replay_lines(game: dict) -> AsyncIterator[bytes]:
+    """
+    game replay as ndjson: game record, then state before first move
+    and state after every move
+    """
+    yield _line(_record(game))
+    position = Position()
+    yield _line({"turn": position.turn, "move": None, "board": position.board(), "tokens": position.tokens})
+    for move in unpack_moves(game["moves"]):
+        position.make(move)
+        yield _line(
+            {
+                "turn": position.turn,
+                "move": move.to_dict(),
+                "board": position.board(),
+                "tokens": position.tokens,
+            }
+        )
@@ -1,17 +1,83 @@
-from asyncio import sleep
-from typing import List, Dict
+from asyncio import Event, Task, create_task, sleep
+from enum import Enum
+from struct import Struct, error as StructError
+from time import monotonic
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
 from common.messages import (
     BadMsgResp,
     GameOverMsg,
+    GameStateDeltaMsg,
     GameStateMsg,
+    Protocol,
+    ResyncMsg,
     YourMoveMsg,
     MoveMsg,
     Msg,
 )
+from datetime import datetime
 from fastapi import WebSocket
 from pydantic import BaseModel
-from common.pylos import Board, generate_empty_board, legal_moves
-from server.database.models.user import Users, user_pydantic
+from tortoise import timezone
+from common.pylos import CELL_COORDS, LegalList, Move, Position, changed_cells
+from common.wire import Encoding, pack_moves, unpack_moves
+from server.database.fanout import Fanout, Format
+from server.database.models.game import Games
+from server.database.move_pool import legal_moves_pool, move_positions
+from server.database.user_stats import stats_writer, user_cache
+
+
+class Pacing(str, Enum):
+    """
+    How fast game session is played
+    - **realtime**: spectators see every token put or taken with delay for animation
+    - **turbo**: no delays, for bot vs bot matches
+    """
+    realtime = "realtime"
+    turbo = "turbo"
+
+
+FRAME_DELAY = 0.5
+"""
+delay between frames sent to spectators of realtime session, in seconds
+"""
+RECONNECT_WINDOW = 60.0
+"""
+seconds player of restored game session has to reconnect before they forfeit
+"""
+RECONNECT_GRACE = 30.0
+"""
+seconds player of started game may spend disconnected in total, over the whole game,
+before they forfeit
+"""
+
+# id, turbo pacing, started at (unix timestamp), seq, name length, players count,
+# move time, bank, banks left of players (_NO_LIMIT if not limited)
+_SNAPSHOT = Struct("<I?dIHBdddd")
+_NO_LIMIT = -1.0
+# player id, name length
+_SNAPSHOT_PLAYER = Struct("<IB")
+_NO_MOVES = LegalList.of(())
+
+
+class GameStatus(str, Enum):
+    """
+    - **open**: waiting for players
+    - **in_progress**: both players joined
+    - **finished**: game is over
+    """
+    open = "open"
+    in_progress = "in_progress"
+    finished = "finished"
+
+
+class TimeControl(BaseModel):
+    """
+    Time limits of players, player that exceeds any of them loses
+    - **move_time**: seconds for every single move, None => not limited
+    - **bank**: seconds for all moves of player together, None => not limited
+    """
+    move_time: Optional[float] = None
+    bank: Optional[float] = None
 
 
 class GameSessionState(BaseModel):
@@ -20,6 +86,9 @@ class GameSessionState(BaseModel):
     players_ids: List[int]
     players_names: List[str]
     is_finished: bool
+    pacing: Pacing
+    status: GameStatus
+    time_control: TimeControl = TimeControl()
 
 
 class GameSession:
@@ -27,56 +96,278 @@ class GameSession:
     Represents game session
     - **id**: session id (the same as game id)
     - **name**: session name
+    - **pacing**: realtime or turbo, players are never delayed,
+        only frames sent to spectators are
+    - **on_state_change**: called with session whenever its GameSessionState changes
+        (player joins, game ends)
+    - **time_control**: limits of players thinking time, clock of player runs
+        from YourMoveMsg to their MoveMsg, also while they are disconnected
+    - **reserved**: ids of the only players that may join as players, others join as spectators,
+        anybody may join if None
     """
-    def __init__(self, session_id: int, session_name: str) -> None:
+    def __init__(
+        self,
+        session_id: int,
+        session_name: str,
+        pacing: Pacing = Pacing.realtime,
+        on_state_change: Optional[Callable[["GameSession"], None]] = None,
+        time_control: TimeControl = TimeControl(),
+        reserved: Optional[Sequence[int]] = None,
+    ) -> None:
         self.id: int = session_id
         self.name: str = session_name
+        self.pacing = pacing
+        self.on_state_change = on_state_change
+        self.time_control = time_control
+        self.reserved = reserved
         self._players_ids: List[int] = []
         self._players_names: List[str] = []
-        self._players_connections: List[WebSocket] = []
+        # None while player is disconnected
+        self._players_connections: List[Optional[WebSocket]] = []
         self._connections: List[WebSocket] = []
-        self._turn: int = 0
-        self._tokens: List[int] = [15, 15]
-        self._board: Board = generate_empty_board()
+        # player index => task that forfeits the game if player doesn't reconnect
+        self._reconnect_timers: Dict[int, Task] = {}
+        # player index => seconds of RECONNECT_GRACE left, and since when they are disconnected
+        self._grace = [RECONNECT_GRACE, RECONNECT_GRACE]
+        self._absent_since: Dict[int, float] = {}
+        # player index => seconds left in bank, None if bank is not limited
+        self._banks: List[Optional[float]] = [time_control.bank, time_control.bank]
+        # task that ends the game when player on move runs out of time, and when their move started
+        self._clock: Optional[Task] = None
+        self._move_started: Optional[float] = None
+        # set while legal moves after accepted move are computed, no other move is accepted then
+        self._applying_move = False
+        self._fanout = Fanout(delay=FRAME_DELAY if pacing == Pacing.realtime else 0)
+        self._position = Position()
         self._next_legal = self._legal()
         self._is_finished = False
+        # player id of winner, None while game isn't finished or if it finished without result
+        self._winner_id: Optional[int] = None
+        # created by wait_finished
+        self._finished: Optional[Event] = None
+        self._state: Optional[GameSessionState] = None
+        self._started_at: Optional[datetime] = None
+        self._seq = 0
+        self._frame_bitboard = self._position.bitboard
+        self._frame_tokens = list(self._position.tokens)
 
-    async def connect(self, websocket: WebSocket, player_id: int):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        player_id: int,
+        protocol: Protocol = Protocol.full,
+        encoding: Encoding = Encoding.json,
+    ):
         """
         Connect to game session, if game is full (2 players), join as spectator
         - **websocket**: websocket used for connection
-        - **player_id**: id of player that connects, if **player_id** == 0 => join as spectator
+        - **player_id**: id of player that connects, if **player_id** == 0 => join as spectator,
+            disconnected player of started game that connects again gets their place back
+        - **protocol**: full or delta, with delta current GameStateMsg is sent right away
+        - **encoding**: json or binary frames
         """
         await websocket.accept()
+        fmt = Format(protocol, encoding)
+        self._fanout.register(websocket, fmt)
+        if protocol == Protocol.delta:
+            await self._fanout.send([websocket], self._state_msg())
+        self._connections.append(websocket)
         if player_id == 0:
-            self._connections.append(websocket)
+            self._fanout.add_spectator(websocket, fmt)
             return
-        if len(self._players_ids) < 2:
-            self._players_ids.append(player_id)
-            player_db = await user_pydantic.from_queryset_single(
-                Users.get(id=player_id)
-            )
-            self._players_names.append(player_db.dict()["username"])
-            self._players_connections.append(websocket)
-        self._connections.append(websocket)
+        slot = self._absent_player(player_id)
+        if slot is not None:
+            await self._rejoin(slot, websocket, protocol)
+            return
+        if len(self._players_ids) >= 2 or not self._may_join(player_id):
+            self._fanout.add_spectator(websocket, fmt)
+            return
+        self._players_ids.append(player_id)
+        self._players_names.append(await user_cache.username(player_id))
+        self._players_connections.append(websocket)
+        self._state_changed()
         if len(self._players_ids) >= 2:
             await self.__start_game()
 
+    def _may_join(self, player_id: int) -> bool:
+        if self.reserved is None:
+            return True
+        return player_id in self.reserved and player_id not in self._players_ids
+
+    def _absent_player(self, player_id: int) -> Optional[int]:
+        """
+        index of disconnected player with **player_id** in started game
+        """
+        if self._started_at is None or self._is_finished:
+            return None
+        for slot, (connection, slot_player_id) in enumerate(
+            zip(self._players_connections, self._players_ids)
+        ):
+            if connection is None and slot_player_id == player_id:
+                return slot
+        return None
+
+    async def _rejoin(self, slot: int, websocket: WebSocket, protocol: Protocol):
+        """
+        bind reconnected player to their place and resync them
+        """
+        self._players_connections[slot] = websocket
+        timer = self._reconnect_timers.pop(slot, None)
+        if timer is not None:
+            timer.cancel()
+        since = self._absent_since.pop(slot, None)
+        if since is not None:
+            self._grace[slot] = max(0.0, self._grace[slot] - (monotonic() - since))
+        if protocol == Protocol.full:
+            await self._fanout.send([websocket], self._state_msg())
+        if (self._position.turn + 1) % 2 == slot and not self._applying_move:
+            # clock of restored game starts when player on move is back
+            if self._move_started is None:
+                self._start_clock()
+            await self._send_your_move()
+
+    def detach(self, websocket: WebSocket) -> Optional[int]:
+        """
+        forget connection without resigning, returns index of player it belonged to
+        """
+        if websocket in self._connections:
+            self._connections.remove(websocket)
+        self._fanout.remove(websocket)
+        if websocket not in self._players_connections:
+            return None
+        slot = self._players_connections.index(websocket)
+        self._players_connections[slot] = None
+        return slot
+
     async def disconnect(self, websocket: WebSocket, player_id: int):
         """
-        Disconnect from game session, if game is not finished, player that leaves resignes the game
+        Disconnect from game session, player of started game keeps their place
+        and forfeits only if they don't reconnect within what is left of their RECONNECT_GRACE,
+        player waiting for opponent just leaves
+        """
+        slot = self.detach(websocket)
+        if slot is None or self._is_finished:
+            return
+        if self._started_at is None:
+            del self._players_ids[slot]
+            del self._players_names[slot]
+            del self._players_connections[slot]
+            self._state_changed()
+            return
+        self._absent_since[slot] = monotonic()
+        self.await_reconnect(slot, self._grace[slot])
+
+    def await_reconnect(self, slot: int, window: float = RECONNECT_WINDOW):
+        """
+        forfeit game of disconnected player **slot** if they don't reconnect in **window** seconds,
+        game where nobody reconnects is abandoned
+        """
+        self._reconnect_timers[slot] = create_task(self._forfeit_if_absent(slot, window))
+
+    async def _forfeit_if_absent(self, slot: int, window: float):
+        await sleep(window)
+        del self._reconnect_timers[slot]
+        if self._is_finished or self._players_connections[slot] is not None:
+            return
+        if self._players_connections[(slot + 1) % 2] is None:
+            await self.abandon()
+        else:
+            await self._end_game(winner_override=(slot + 1) % 2)
+
+    async def abandon(self):
+        """
+        finish game without result
+        """
+        if self._is_finished:
+            return
+        self._finish()
+        for connection in self._connected_players():
+            await connection.close()
+        self._fanout.close_spectators()
+
+    def _finish(self):
+        self._is_finished = True
+        self._cancel_timers()
+        self._state_changed()
+        if self._finished is not None:
+            self._finished.set()
+
+    async def wait_finished(self):
+        if self._finished is None:
+            self._finished = Event()
+        if not self._is_finished:
+            await self._finished.wait()
+
+    def _cancel_timers(self):
+        for timer in self._reconnect_timers.values():
+            timer.cancel()
+        self._reconnect_timers.clear()
+        if self._clock is not None:
+            self._clock.cancel()
+            self._clock = None
+
+    def _allowance(self, slot: int) -> Optional[float]:
+        """
+        seconds player **slot** has for their whole next move, None if not limited
         """
-        self._connections.remove(websocket)
-        if websocket in self._players_connections:
-            winner = 0 if self._players_connections[1] == websocket else 1
-            self._players_connections.remove(websocket)
-            await self._end_game(winner_override=winner)
+        limits = [t for t in (self.time_control.move_time, self._banks[slot]) if t is not None]
+        return min(limits) if limits else None
+
+    def _elapsed(self, slot: int) -> float:
+        """
+        seconds player **slot** has been thinking about current move
+        """
+        if self._move_started is None or (self._position.turn + 1) % 2 != slot:
+            return 0.0
+        return monotonic() - self._move_started
+
+    def _start_clock(self):
+        """
+        start clock of player on move
+        """
+        slot = (self._position.turn + 1) % 2
+        self._move_started = monotonic()
+        allowance = self._allowance(slot)
+        if allowance is not None:
+            self._clock = create_task(self._flag_if_late(slot, allowance))
+
+    def _stop_clock(self):
+        """
+        stop clock of player on move, charging time of their move to their bank
+        """
+        slot = (self._position.turn + 1) % 2
+        if self._clock is not None:
+            self._clock.cancel()
+            self._clock = None
+        if self._banks[slot] is not None:
+            self._banks[slot] = max(0.0, self._banks[slot] - self._elapsed(slot))
+        self._move_started = None
+
+    async def _flag_if_late(self, slot: int, seconds: float):
+        await sleep(seconds)
+        self._clock = None
+        await self._end_game(winner_override=(slot + 1) % 2)
+
+    def _clocks(self) -> List[Optional[int]]:
+        """
+        milliseconds each player has for their move (running down for player on move),
+        None if not limited
+        """
+        clocks = []
+        for slot in (0, 1):
+            allowance = self._allowance(slot)
+            if allowance is None:
+                clocks.append(None)
+            else:
+                clocks.append(max(0, int((allowance - self._elapsed(slot)) * 1000)))
+        return clocks
 
     async def __start_game(self):
-        await self._broadcast(self._state_msg())
-        await self._players_connections[(self._turn + 1) % 2].send_json(
-            self._your_move_msg().to_dict()
-        )
+        self._started_at = timezone.now()
+        state, _ = self._frame()
+        await self._broadcast(state)
+        self._start_clock()
+        await self._send_your_move()
 
     def _state_msg(self) -> GameStateMsg:
         """
@@ -84,12 +375,14 @@ class GameSession:
         """
         return GameStateMsg(
             {
-                "turn": self._turn,
+                "seq": self._seq,
+                "turn": self._position.turn,
                 "players_ids": self._players_ids,
                 "players_names": self._players_names,
-                "tokens": self._tokens,
-                "board": self._board,
-                "legal": self._legal(),
+                "tokens": list(self._position.tokens),
+                "board": self._position.board(),
+                "legal": self._legal_list(),
+                "clocks": self._clocks(),
             }
         )
 
@@ -99,172 +392,331 @@ class GameSession:
         """
         return YourMoveMsg(
             {
-                "turn": self._turn,
+                "seq": self._seq,
+                "turn": self._position.turn,
                 "players_ids": self._players_ids,
                 "players_names": self._players_names,
-                "tokens": self._tokens,
-                "board": self._board,
-                "legal": self._legal(),
+                "tokens": list(self._position.tokens),
+                "board": self._position.board(),
+                "legal": self._legal_list(),
+                "clocks": self._clocks(),
             }
         )
 
-    def _legal(self) -> List[Dict]:
+    def _frame(self) -> Tuple[GameStateMsg, GameStateDeltaMsg]:
+        """
+        next numbered game state, as GameStateMsg and as change since previous one
+        """
+        self._seq += 1
+        position = self._position
+        bitboard = position.bitboard
+        delta = GameStateDeltaMsg(
+            {
+                "seq": self._seq,
+                "turn": position.turn,
+                "changed": [
+                    [*CELL_COORDS[cell], value]
+                    for cell, value in changed_cells(self._frame_bitboard, bitboard)
+                ],
+                "tokens": [t - f for t, f in zip(position.tokens, self._frame_tokens)],
+                "move": None,
+            }
+        )
+        self._frame_bitboard = bitboard
+        self._frame_tokens = list(position.tokens)
+        return self._state_msg(), delta
+
+    def _legal(self) -> FrozenSet[Move]:
+        """
+        legal moves of player that should move now, set built from cached list for validating moves
+        """
+        return frozenset(self._legal_list())
+
+    def _legal_list(self) -> LegalList:
         """
-        legal moves of player that should move now
+        legal moves of player that should move now, as sent to clients
         """
-        if self._tokens[(self._turn + 1) % 2] == 0:
-            return []
-        return legal_moves(self._board, self._turn + 1)
+        position = self._position
+        if position.tokens[position.player - 1] == 0:
+            return _NO_MOVES
+        return legal_moves_pool.legal_list(position.bitboard, position.player)
 
-    async def _broadcast(self, msg: Msg):
+    async def _broadcast(self, msg: Msg, delta: Optional[Msg] = None):
         """
-        send message to all connected websockets (players and spectators)
+        send message to all connected websockets, players get it immediately,
+        spectators through their paced feeds
+        - **delta**: message sent instead of **msg** to connections with protocol=delta
         """
-        for connection in self._connections:
-            await connection.send_json(msg.to_dict())
+        await self._fanout.broadcast(self._connected_players(), msg, delta)
+
+    def _connected_players(self) -> List[WebSocket]:
+        return [c for c in self._players_connections if c is not None]
+
+    async def _send_your_move(self):
+        player_connection = self._players_connections[(self._position.turn + 1) % 2]
+        if player_connection is not None:
+            await self._fanout.send([player_connection], self._your_move_msg())
 
     async def handle_msg(self, websocket: WebSocket, player_id: int, msg: Msg):
+        if type(msg) is ResyncMsg:
+            await self._fanout.send([websocket], self._state_msg())
         if type(msg) is MoveMsg:
             if not self._is_authorized_for_move(websocket, player_id):
-                await websocket.send_json(
-                    BadMsgResp({"detail": "permission denied"}).to_dict()
-                )
+                await self._fanout.send([websocket], BadMsgResp({"detail": "permission denied"}))
                 return
             msg.__dict__.pop("type", None)
-            move = msg.__dict__
+            try:
+                move = msg.to_move()
+            except ValueError:
+                move = None
             if move not in self._next_legal:
-                await websocket.send_json(
-                    BadMsgResp({"detail": f"illegal move: {move}"}).to_dict()
+                await self._fanout.send(
+                    [websocket], BadMsgResp({"detail": f"illegal move: {msg.__dict__}"})
                 )
                 await self._end_game()
                 return
+            self._stop_clock()
             await self._update_state(move)
 
     async def _end_game(self, winner_override=None):
         if self._is_finished:
             return
-        self._is_finished = True
-        if winner_override:
+        if winner_override is not None:
             winner_id = winner_override
         else:
-            winner_id = self._turn % 2
+            winner_id = self._position.turn % 2
+        self._winner_id = self._players_ids[winner_id]
+        self._finish()
 
         await self._broadcast(
             GameOverMsg(
                 {
                     "winner_id": self._players_ids[winner_id],
                     "winner_name": self._players_names[winner_id],
-                    "winner_tokens": self._tokens[winner_id],
+                    "winner_tokens": self._position.tokens[winner_id],
                 }
             )
         )
-        winner = await user_pydantic.from_queryset_single(
-            Users.get(id=self._players_ids[winner_id])
+        stats_writer.record(
+            self._players_ids[winner_id], self._players_ids[(winner_id + 1) % 2], self._record(winner_id)
         )
-        loser = await user_pydantic.from_queryset_single(
-            Users.get(id=self._players_ids[(winner_id + 1) % 2])
-        )
-        winner = winner.dict()
-        winner["wins"] += 1
-        winner.pop("id", None)
-        loser = loser.dict()
-        loser["loses"] += 1
-        loser.pop("id", None)
-        await Users.filter(id=self._players_ids[winner_id]).update(**winner)
-        await Users.filter(id=self._players_ids[(winner_id + 1) % 2]).update(**loser)
-        for connection in self._connections:
+        for connection in self._connected_players():
             await connection.close()
+        self._fanout.close_spectators()
 
-    async def _update_state(self, move: Dict):
-        self._turn += 1
-        player = self._turn % 2
-
-        if move["cat"] == "put":
-            put_level = move["level"]
-            put_x = move["x"]
-            put_y = move["y"]
-            self._board[put_level][put_x][put_y] = player + 1
-            self._tokens[player] -= 1
-            await sleep(0.5)
-            await self._broadcast(self._state_msg())
-
-        if move["cat"] == "move":
-            take_level = move["take_level"]
-            take_x = move["take_x"]
-            take_y = move["take_y"]
-            assert self._board[take_level][take_x][take_y] == player + 1
-            self._board[take_level][take_x][take_y] = 0
-            self._tokens[player] += 1
-            await sleep(0.5)
-            await self._broadcast(self._state_msg())
-            put_level = move["level"]
-            put_x = move["x"]
-            put_y = move["y"]
-            self._board[put_level][put_x][put_y] = player + 1
-            self._tokens[player] -= 1
-            await sleep(0.5)
-            await self._broadcast(self._state_msg())
-
-        if move["cat"] == "square":
-            put_level = move["level"]
-            put_x = move["x"]
-            put_y = move["y"]
-            self._board[put_level][put_x][put_y] = player + 1
-            self._tokens[player] -= 1
-            await sleep(0.5)
-            await self._broadcast(self._state_msg())
-            take_level = move["take_level"]
-            take_x = move["take_x"]
-            take_y = move["take_y"]
-            assert self._board[take_level][take_x][take_y] == player + 1
-            self._board[take_level][take_x][take_y] = 0
-            self._tokens[player] += 1
-            await sleep(0.5)
-            await self._broadcast(self._state_msg())
-            if move["take_sq_level"] != -1:
-                take_sq_level = move["take_sq_level"]
-                take_sq_x = move["take_sq_x"]
-                take_sq_y = move["take_sq_y"]
-                assert self._board[take_sq_level][take_sq_x][take_sq_y] == player + 1
-                self._board[take_sq_level][take_sq_x][take_sq_y] = 0
-                self._tokens[player] += 1
-                await sleep(0.5)
-                await self._broadcast(self._state_msg())
+    async def _update_state(self, move: Move):
+        # positions after move missing in cache are computed outside event loop,
+        # game may end meanwhile (abandon, opponent's reconnect grace)
+        self._applying_move = True
+        try:
+            await legal_moves_pool.prefetch(move_positions(self._position, move))
+        finally:
+            self._applying_move = False
+        if self._is_finished:
+            return
+        frames = [self._frame() for _ in self._position.make_stepwise(move)]
+        for state, delta in frames[:-1]:
+            await self._fanout.broadcast(
+                self._connected_players(), state, delta, intermediate=True
+            )
 
         self._next_legal = self._legal()
-        await sleep(0.5)
-        await self._broadcast(self._state_msg())
-        await self._players_connections[(self._turn + 1) % 2].send_json(
-            self._your_move_msg().to_dict()
-        )
+        state, delta = frames[-1]
+        delta.move = move.to_dict()
+        await self._broadcast(state, delta)
+        self._start_clock()
+        await self._send_your_move()
         if len(self._next_legal) == 0:
             await self._end_game()
 
+    def _record(self, winner_id: int) -> Games:
+        """
+        not saved Games row of finished game
+        """
+        moves = self._position.history
+        finished_at = timezone.now()
+        return Games(
+            name=self.name,
+            player1_id=self._players_ids[0],
+            player2_id=self._players_ids[1],
+            winner_id=self._players_ids[winner_id],
+            winner_tokens=self._position.tokens[winner_id],
+            started_at=self._started_at or finished_at,
+            finished_at=finished_at,
+            moves_count=len(moves),
+            moves=pack_moves(moves),
+        )
+
     def _is_authorized_for_move(self, websocket: WebSocket, player_id: int) -> bool:
         """
         Check if player is authorized for move, its their turn and
         their websocket corresponds to websocket saved in game session
         """
-        current_turn = self._turn + 1
+        current_turn = self._position.turn + 1
         current_player = current_turn % 2
         return (
-            player_id == self._players_ids[current_player]
+            not self._applying_move
+            and player_id == self._players_ids[current_player]
             and websocket == self._players_connections[current_player]
         )
 
+    def snapshot(self) -> bytes:
+        """
+        session in compact binary form, players connections are not part of it
+        """
+        name = self.name.encode()
+        players = b"".join(
+            _SNAPSHOT_PLAYER.pack(player_id, len(raw)) + raw
+            for player_id, raw in zip(self._players_ids, (n.encode() for n in self._players_names))
+        )
+        started_at = 0.0 if self._started_at is None else self._started_at.timestamp()
+        banks = [
+            _NO_LIMIT if bank is None else max(0.0, bank - self._elapsed(slot))
+            for slot, bank in enumerate(self._banks)
+        ]
+        control = self.time_control
+        return (
+            _SNAPSHOT.pack(
+                self.id,
+                self.pacing == Pacing.turbo,
+                started_at,
+                self._seq,
+                len(name),
+                len(self._players_ids),
+                _NO_LIMIT if control.move_time is None else control.move_time,
+                _NO_LIMIT if control.bank is None else control.bank,
+                *banks,
+            )
+            + name
+            + players
+            + pack_moves(self._position.history)
+        )
+
+    @classmethod
+    def restore(
+        cls,
+        data: bytes,
+        on_state_change: Optional[Callable[["GameSession"], None]] = None,
+        reconnect_window: float = RECONNECT_WINDOW,
+    ) -> "GameSession":
+        """
+        session from snapshot, players of started game have **reconnect_window** seconds to connect again,
+        players waiting for opponent have to join again,
+        clock of player on move starts again when they reconnect,
+        raises ValueError if **data** isn't valid snapshot
+        """
+        session = cls.unpack(data, on_state_change)
+        session.await_players(reconnect_window)
+        return session
+
+    @classmethod
+    def unpack(
+        cls, data: bytes, on_state_change: Optional[Callable[["GameSession"], None]] = None
+    ) -> "GameSession":
+        """
+        session from snapshot without reconnect timers of its players (see await_players),
+        raises ValueError if **data** isn't valid snapshot
+        """
+        try:
+            return cls._unpack(data, on_state_change)
+        except (StructError, UnicodeDecodeError) as e:
+            raise ValueError("malformed game session snapshot") from e
+
+    def await_players(self, window: float = RECONNECT_WINDOW):
+        """
+        forfeit game of players of restored started game that don't reconnect in **window** seconds
+        """
+        if self._started_at is not None:
+            for slot in range(0, len(self._players_ids)):
+                self.await_reconnect(slot, window)
+
+    @classmethod
+    def _unpack(
+        cls, data: bytes, on_state_change: Optional[Callable[["GameSession"], None]]
+    ) -> "GameSession":
+        """
+        raises ValueError for truncated snapshot or illegal moves, struct.error or UnicodeDecodeError
+        for otherwise malformed one
+        """
+        (
+            session_id, turbo, started_at, seq, name_len, players, move_time, bank, *banks
+        ) = _SNAPSHOT.unpack_from(data)
+        offset = _SNAPSHOT.size
+        raw_name = data[offset: offset + name_len]
+        if len(raw_name) != name_len:
+            raise ValueError("truncated game session snapshot")
+        name = raw_name.decode()
+        offset += name_len
+        control = TimeControl(
+            move_time=None if move_time == _NO_LIMIT else move_time,
+            bank=None if bank == _NO_LIMIT else bank,
+        )
+        session = cls(session_id, name, Pacing.turbo if turbo else Pacing.realtime, on_state_change, control)
+        if not started_at:
+            return session
+        session._banks = [None if bank == _NO_LIMIT else bank for bank in banks]
+        for _ in range(0, players):
+            player_id, length = _SNAPSHOT_PLAYER.unpack_from(data, offset)
+            offset += _SNAPSHOT_PLAYER.size
+            session._players_ids.append(player_id)
+            raw_name = data[offset: offset + length]
+            if len(raw_name) != length:
+                raise ValueError("truncated game session snapshot")
+            session._players_names.append(raw_name.decode())
+            session._players_connections.append(None)
+            offset += length
+        for move in unpack_moves(data[offset:]):
+            if move not in session._position.legal_moves():
+                raise ValueError(f"illegal move in game session snapshot: {move}")
+            session._position.make(move)
+        session._started_at = datetime.fromtimestamp(started_at, timezone.get_default_timezone())
+        session._seq = seq
+        session._frame_bitboard = session._position.bitboard
+        session._frame_tokens = list(session._position.tokens)
+        session._next_legal = session._legal()
+        return session
+
+    def _state_changed(self):
+        self._state = None
+        if self.on_state_change is not None:
+            self.on_state_change(self)
+
+    @property
+    def is_finished(self) -> bool:
+        return self._is_finished
+
+    @property
+    def winner_id(self) -> Optional[int]:
+        return self._winner_id
+
+    @property
+    def status(self) -> GameStatus:
+        if self._is_finished:
+            return GameStatus.finished
+        if len(self._players_ids) < 2:
+            return GameStatus.open
+        return GameStatus.in_progress
+
     @property
     def state(self) -> GameSessionState:
         """
-        current game session state
+        current game session state, built once per state change
         - **game_id**: ...
         - **game_name**: ...
         - **players_ids**: ...
         - **players_names**: ...
+        - **status**: open, in_progress or finished
+        - **time_control**: ...
         """
-        return GameSessionState(
-            game_id=self.id,
-            game_name=self.name,
-            players_ids=self._players_ids,
-            players_names=self._players_names,
-            is_finished=self._is_finished
-        )
+        if self._state is None:
+            self._state = GameSessionState(
+                game_id=self.id,
+                game_name=self.name,
+                players_ids=self._players_ids,
+                players_names=self._players_names,
+                is_finished=self._is_finished,
+                pacing=self.pacing,
+                status=self.status,
+                time_control=self.time_control,
+            )
+        return self._state
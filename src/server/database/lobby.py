@@ -0,0 +1,109 @@
+import logging
+from asyncio import Task, ensure_future, get_running_loop
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from tortoise.exceptions import IntegrityError
+from server.database.game_session import GameSessionState, GameStatus
+from server.database.models.lobby import LobbyGames
+
+logger = logging.getLogger(__name__)
+
+Page = Tuple[List[GameSessionState], Optional[int]]
+Write = Callable[[], Awaitable]
+
+WRITE_ATTEMPTS = 3
+"""
+times lobby write of game is tried before it is given up
+"""
+WRITE_RETRY_DELAY = 1.0
+"""
+seconds failed lobby write waits before it is tried again
+"""
+
+
+class SharedLobby:
+    """
+    Lobby shared by all workers of sharded server, stored in LobbyGames table of common database
+    (local stand-in for shared store), every worker writes states of games it owns
+    and reads states of all games
+    - **worker**: index of this worker
+    - failed update or remove is logged and tried again, unless newer write of the game came meanwhile
+    """
+    def __init__(self, worker: int) -> None:
+        self.worker = worker
+        self._writes: Set[Task] = set()
+        # game id => its latest write
+        self._latest: Dict[int, Write] = {}
+
+    async def reset(self):
+        """
+        forget games of this worker left from its previous run
+        """
+        await LobbyGames.filter(worker=self.worker).delete()
+
+    async def claim(self, state: GameSessionState):
+        """
+        add new game, raises NameError if any worker has game with the same name
+        """
+        try:
+            await LobbyGames.create(
+                id=state.game_id,
+                worker=self.worker,
+                name=state.game_name,
+                status=state.status.value,
+                state=state.dict(),
+            )
+        except IntegrityError:
+            raise NameError(state.game_name) from None
+
+    def _write(self, game_id: int, write: Write, attempt: int = 1):
+        self._latest[game_id] = write
+        task = ensure_future(write())
+        self._writes.add(task)
+        task.add_done_callback(lambda done: self._written(game_id, write, attempt, done))
+
+    def _written(self, game_id: int, write: Write, attempt: int, task: Task):
+        self._writes.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if self._latest.get(game_id) is not write:
+            # newer state of game is being written
+            return
+        if error is None:
+            del self._latest[game_id]
+            return
+        if attempt >= WRITE_ATTEMPTS:
+            del self._latest[game_id]
+            logger.error("lobby write of game %s given up", game_id, exc_info=error)
+            return
+        logger.warning("lobby write of game %s failed, attempt %s", game_id, attempt, exc_info=error)
+        get_running_loop().call_later(WRITE_RETRY_DELAY, self._retry, game_id, write, attempt + 1)
+
+    def _retry(self, game_id: int, write: Write, attempt: int):
+        if self._latest.get(game_id) is write:
+            self._write(game_id, write, attempt)
+
+    def update(self, state: GameSessionState):
+        """
+        publish changed game state, doesn't wait for database
+        """
+        self._write(
+            state.game_id,
+            lambda: LobbyGames.filter(id=state.game_id).update(status=state.status.value, state=state.dict()),
+        )
+
+    def remove(self, game_id: int):
+        self._write(game_id, lambda: LobbyGames.filter(id=game_id).delete())
+
+    async def page(
+        self, cursor: int, limit: int, status: Optional[GameStatus] = None, name: Optional[str] = None
+    ) -> Page:
+        """
+        same as GameSessionsManager.list_page (or search_page if **name** is given), for games of all workers
+        """
+        query = LobbyGames.filter(id__gt=cursor)
+        if status is not None:
+            query = query.filter(status=status.value)
+        if name is not None:
+            query = query.filter(name__contains=name)
+        rows = await query.order_by("id").limit(limit + 1).values_list("state", flat=True)
+        states = [GameSessionState(**state) for state in rows[:limit]]
+        return states, states[-1].game_id if len(rows) > limit else None
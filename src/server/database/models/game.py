@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+from tortoise import fields, models
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+
+class Games(models.Model):
+    """
+    Finished game, moves are packed by common.wire.pack_moves (2 bytes per move),
+    so whole game is single row
+    """
+    id = fields.IntField(pk=True)
+    name = fields.TextField()
+    player1 = fields.ForeignKeyField("models.Users", related_name="games_as_first")
+    player2 = fields.ForeignKeyField("models.Users", related_name="games_as_second")
+    winner = fields.ForeignKeyField("models.Users", related_name="games_won", null=True)
+    winner_tokens = fields.IntField(default=0)
+    started_at = fields.DatetimeField()
+    finished_at = fields.DatetimeField(index=True)
+    moves_count = fields.IntField()
+    moves = fields.BinaryField()
+
+    class Meta:
+        # id breaks ties of games finished at the same time, so (finished_at, id) is page cursor
+        ordering = ["-finished_at", "-id"]
+        # games of player by date
+        indexes = (("player1_id", "finished_at"), ("player2_id", "finished_at"))
+
+
+class GameRecord(BaseModel):
+    """
+    Games row without move log
+    """
+    id: int
+    name: str
+    player1_id: int
+    player2_id: int
+    winner_id: Optional[int]
+    winner_tokens: int
+    started_at: datetime
+    finished_at: datetime
+    moves_count: int
+
+
+GAME_RECORD_FIELDS = tuple(GameRecord.__fields__)
+
+
+def games_query(
+    player_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    until_id: Optional[int] = None,
+) -> QuerySet:
+    """
+    finished games, newest first
+    - **player_id**: only games this player played
+    - **since**, **until**: only games finished in this time range
+    - **until_id**: with **until**, also games finished at **until** with id lower than this,
+        so that (finished_at, id) of last game is cursor of next page
+    """
+    query = Games.all()
+    if player_id is not None:
+        query = query.filter(Q(player1_id=player_id) | Q(player2_id=player_id))
+    if since is not None:
+        query = query.filter(finished_at__gte=since)
+    if until is not None and until_id is not None:
+        query = query.filter(Q(finished_at__lt=until) | Q(finished_at=until, id__lt=until_id))
+    elif until is not None:
+        query = query.filter(finished_at__lt=until)
+    return query
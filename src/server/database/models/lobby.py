@@ -0,0 +1,15 @@
+from tortoise import fields, models
+
+
+class LobbyGames(models.Model):
+    """
+    Game sessions of all workers, shared lobby of sharded server (see server.cluster),
+    unique name makes game names unique across workers
+    """
+    id = fields.IntField(pk=True, generated=False)
+    # index of worker that owns the game
+    worker = fields.IntField(index=True)
+    name = fields.CharField(max_length=255, unique=True)
+    status = fields.CharField(max_length=16, index=True)
+    # GameSessionState as json
+    state = fields.JSONField()
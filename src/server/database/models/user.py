@@ -1,6 +1,9 @@
 from tortoise import fields, models
 from tortoise.contrib.pydantic import pydantic_model_creator
 
+# models are imported without common on path (create_schema.py), keep equal to common.tournament
+INITIAL_RATING = 1500.0
+
 
 class Users(models.Model):
     id = fields.IntField(pk=True)
@@ -13,3 +16,13 @@ class Users(models.Model):
 
 
 user_pydantic = pydantic_model_creator(Users, name="user")
+
+
+class Ratings(models.Model):
+    """
+    Elo rating of player, changed by tournament games
+    """
+    id = fields.IntField(pk=True)
+    user = fields.OneToOneField("models.Users", related_name="rating")
+    rating = fields.FloatField(default=INITIAL_RATING)
+    games = fields.IntField(default=0)
@@ -0,0 +1,110 @@
+import os
+from asyncio import get_running_loop
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Iterable, List, Optional, Tuple
+from common.pylos import (
+    BitBoard,
+    LegalList,
+    LegalMovesCache,
+    Move,
+    Position,
+    bitboard_moves,
+    legal_moves_cache,
+)
+
+
+class PoolKind(str, Enum):
+    """
+    Where legal moves missing in cache are computed
+    - **inline**: in event loop, when they are needed (for debugging)
+    - **thread**: in thread pool, event loop isn't blocked but shares GIL with it
+    - **process**: in process pool, runs in parallel with event loop
+    """
+    inline = "inline"
+    thread = "thread"
+    process = "process"
+
+
+def _moves_of(positions: List[Tuple[BitBoard, int]]) -> List[LegalList]:
+    """
+    legal moves of positions, sorted and in forms sent to clients
+    """
+    return [LegalList.of(bitboard_moves(bitboard, player)) for bitboard, player in positions]
+
+
+def move_positions(position: Position, move: Move) -> List[Tuple[BitBoard, int]]:
+    """
+    (bitboard, player to move) after every single token step of **move**,
+    position is left as it was
+    """
+    position = position.copy()
+    return [(position.bitboard, position.player) for _ in position.make_stepwise(move)]
+
+
+class LegalMovesPool:
+    """
+    Computes legal moves of positions in executor, sorted and serialized as sent to clients,
+    so that one game's expensive position doesn't delay all other sessions;
+    **cache** is the only store of computed lists
+    - **kind**: inline, thread or process
+    - **workers**: executor size, executor's default if None
+    """
+    def __init__(
+        self,
+        kind: PoolKind = PoolKind.thread,
+        workers: Optional[int] = None,
+        cache: LegalMovesCache = legal_moves_cache,
+    ) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.cache = cache
+        # created on first use
+        self._executor: Optional[Executor] = None
+
+    @classmethod
+    def from_env(cls) -> "LegalMovesPool":
+        """
+        configured by PYLON_MOVE_POOL (inline, thread or process) and PYLON_MOVE_WORKERS,
+        thread if not set
+        """
+        workers = os.environ.get("PYLON_MOVE_WORKERS")
+        return cls(
+            PoolKind(os.environ.get("PYLON_MOVE_POOL", PoolKind.thread)), int(workers) if workers else None
+        )
+
+    def legal_list(self, bitboard: BitBoard, player: int) -> LegalList:
+        """
+        legal moves of position prefetched before, computed in event loop if they aren't
+        """
+        return self.cache.get_list(bitboard, player)
+
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == PoolKind.process:
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="legal-moves")
+        return self._executor
+
+    async def prefetch(self, positions: Iterable[Tuple[BitBoard, int]]):
+        """
+        make sure legal lists of **positions** are ready, missing ones are computed
+        in single executor call (inline pool leaves them to be computed when needed)
+        """
+        if self.kind == PoolKind.inline:
+            return
+        missing = list(dict.fromkeys(p for p in positions if self.cache.lookup(*p) is None))
+        if not missing:
+            return
+        lists = await get_running_loop().run_in_executor(self.executor(), _moves_of, missing)
+        for (bitboard, player), legal in zip(missing, lists):
+            self.cache.put(bitboard, player, legal)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+legal_moves_pool = LegalMovesPool.from_env()
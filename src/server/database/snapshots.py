@@ -0,0 +1,99 @@
+import logging
+import os
+from asyncio import Task, get_running_loop, sleep
+from typing import Optional
+from server.cluster import Cluster
+from server.database.active_game_sessions import GameSessionsManager
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = 5.0
+"""
+seconds between snapshots of running game sessions
+"""
+
+
+def snapshot_path(cluster: Cluster) -> str:
+    """
+    file with snapshot of game sessions, separate for every worker of sharded server
+    """
+    if cluster.sharded:
+        return f"sessions.{cluster.index}.snapshot"
+    return "sessions.snapshot"
+
+
+def _write_file(path: str, data: bytes):
+    """
+    replace file at once, so crash while writing never leaves broken snapshot
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class SessionSnapshots:
+    """
+    Periodically saves game sessions of **manager** to file, so that they survive server restart,
+    file is written outside of event loop and only when it would change
+    """
+    def __init__(
+        self, manager: GameSessionsManager, path: str, interval: float = SNAPSHOT_INTERVAL
+    ) -> None:
+        self.manager = manager
+        self.path = path
+        self.interval = interval
+        self._saved: Optional[bytes] = None
+        self._task: Optional[Task] = None
+
+    async def load(self) -> int:
+        """
+        restore game sessions from file, returns their number,
+        snapshot written by other version of server (or damaged one) is ignored
+        """
+        loop = get_running_loop()
+        data = await loop.run_in_executor(None, _read_file, self.path)
+        if not data:
+            return 0
+        self._saved = data
+        try:
+            return await self.manager.restore(data)
+        except ValueError as e:
+            logger.warning("game sessions snapshot %s ignored: %s", self.path, e)
+            return 0
+
+    async def save(self):
+        data = self.manager.snapshot()
+        if data == self._saved:
+            return
+        await get_running_loop().run_in_executor(None, _write_file, self.path, data)
+        self._saved = data
+
+    def start(self):
+        if self._task is None:
+            self._task = get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """
+        stop periodic saving and save current state
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.save()
+
+    async def _run(self):
+        while True:
+            await sleep(self.interval)
+            try:
+                await self.save()
+            except OSError:
+                pass
@@ -0,0 +1,307 @@
+import logging
+from asyncio import Event, Semaphore, Task, TimeoutError, create_task, gather, wait_for
+from itertools import count
+from typing import Dict, List, Optional, Sequence
+from pydantic import BaseModel
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+from common.tournament import (
+    Pairing,
+    Standings,
+    TournamentFormat,
+    elo_change,
+    gauntlet,
+    round_robin,
+    swiss_pairings,
+    swiss_rounds,
+)
+from server.database.active_game_sessions import GameSessionsManager, current_sessions
+from server.database.game_session import GameSession, GameSessionState, Pacing, TimeControl
+from server.database.models.user import Ratings, Users
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = 64
+"""
+default max number of games of single tournament played at once
+"""
+MATCH_TIMEOUT = 300.0
+"""
+default seconds after which not finished tournament game is abandoned (e.g. bot never connected)
+"""
+POLL_TIMEOUT = 30.0
+"""
+default seconds games_of waits for games of player
+"""
+# names tried for single game, when names are taken by games created by hand
+_NAME_ATTEMPTS = 10
+
+
+class StandingsRow(BaseModel):
+    player_id: int
+    points: float
+    wins: int
+    loses: int
+    buchholz: float
+    # None until ratings are loaded
+    rating: Optional[float]
+
+
+class TournamentState(BaseModel):
+    """
+    - **round**: number of rounds started so far
+    - **rounds**: number of rounds of whole tournament
+    - **games_played**: finished games, including games without result
+    - **failed**: tournament stopped on error, standings are of games played until then
+    - **standings**: players ordered by points, then buchholz
+    """
+    tournament_id: int
+    name: str
+    format: TournamentFormat
+    players_ids: List[int]
+    round: int
+    rounds: int
+    games_played: int
+    is_finished: bool
+    failed: bool
+    standings: List[StandingsRow]
+
+
+class PlayerRating(BaseModel):
+    player_id: int
+    username: str
+    rating: float
+    games: int
+
+
+class Tournament:
+    """
+    Plays pairings of tournament **format** among **players**, round after round,
+    as turbo game sessions reserved for paired players, up to **concurrency** games at once,
+    Elo ratings of players are updated after every round
+    - **rounds**: number of swiss rounds, default is enough to find single winner
+    - **cycles**: how many times pairings of round robin or gauntlet are repeated
+    - **match_timeout**: seconds after which not finished game is abandoned without result
+    """
+    def __init__(
+        self,
+        tournament_id: int,
+        name: str,
+        format: TournamentFormat,
+        players: Sequence[int],
+        sessions: GameSessionsManager,
+        time_control: TimeControl = TimeControl(),
+        rounds: Optional[int] = None,
+        cycles: int = 1,
+        concurrency: int = CONCURRENCY,
+        match_timeout: float = MATCH_TIMEOUT,
+    ) -> None:
+        self.id = tournament_id
+        self.name = name
+        self.format = format
+        self.players = list(players)
+        self.sessions = sessions
+        self.time_control = time_control
+        self.match_timeout = match_timeout
+        if format == TournamentFormat.swiss:
+            self._rounds: Optional[List[List[Pairing]]] = None
+            self.rounds = rounds or swiss_rounds(len(self.players))
+        elif format == TournamentFormat.gauntlet:
+            self._rounds = gauntlet(self.players, cycles)
+            self.rounds = len(self._rounds)
+        else:
+            self._rounds = round_robin(self.players, cycles)
+            self.rounds = len(self._rounds)
+        self.round = 0
+        self.games_played = 0
+        self.standings = Standings(self.players)
+        self.ratings: Dict[int, float] = {}
+        # player id => [rating change, rated games] not written to database yet
+        self._rating_changes: Dict[int, List[float]] = {}
+        self._slots = Semaphore(concurrency)
+        self._games_ids = count()
+        # player id => not finished games of player
+        self._games: Dict[int, Dict[int, GameSession]] = {p: {} for p in self.players}
+        # set and replaced whenever games of players change
+        self._changed = Event()
+        self._is_finished = False
+        self.failed = False
+        self._task: Optional[Task] = None
+
+    def start(self):
+        self._task = create_task(self._run())
+
+    async def _run(self):
+        try:
+            ratings = [await Ratings.get_or_create(user_id=player) for player in self.players]
+            self.ratings = {rating.user_id: rating.rating for rating, _ in ratings}
+            for round_index in range(0, self.rounds):
+                self.round = round_index + 1
+                if self._rounds is None:
+                    pairings, bye = swiss_pairings(self.standings)
+                    if bye is not None:
+                        self.standings.add_bye(bye)
+                else:
+                    pairings = self._rounds[round_index]
+                await gather(*(self._play(player1, player2) for player1, player2 in pairings))
+                await self._write_ratings()
+        except Exception:
+            logger.exception("tournament %s failed in round %s", self.id, self.round)
+            self.failed = True
+        finally:
+            self._is_finished = True
+            self._notify()
+
+    async def _play(self, player1: int, player2: int):
+        async with self._slots:
+            state = await self._new_game(player1, player2)
+            game = self.sessions.get_game(state.game_id)
+            self._games[player1][game.id] = game
+            self._games[player2][game.id] = game
+            self._notify()
+            try:
+                await wait_for(game.wait_finished(), self.match_timeout)
+            except TimeoutError:
+                await game.abandon()
+            del self._games[player1][game.id]
+            del self._games[player2][game.id]
+            self._notify()
+        self._add_result(player1, player2, game.winner_id)
+
+    async def _new_game(self, player1: int, player2: int) -> GameSessionState:
+        """
+        turbo game reserved for players, names taken by other games are skipped
+        """
+        for _ in range(0, _NAME_ATTEMPTS):
+            name = f"{self.name} #{self.id}.{next(self._games_ids)}"
+            try:
+                return await self.sessions.new_game(
+                    name, Pacing.turbo, self.time_control, reserved=(player1, player2)
+                )
+            except NameError:
+                logger.warning("tournament %s: game name %r is taken", self.id, name)
+        raise RuntimeError(f"no free game name for tournament {self.id}")
+
+    def _add_result(self, player1: int, player2: int, winner: Optional[int]):
+        self.games_played += 1
+        self.standings.add(player1, player2, winner)
+        if winner is None:
+            return
+        loser = player2 if winner == player1 else player1
+        change = elo_change(self.ratings[winner], self.ratings[loser])
+        for player, delta in ((winner, change), (loser, -change)):
+            self.ratings[player] += delta
+            pending = self._rating_changes.setdefault(player, [0.0, 0])
+            pending[0] += delta
+            pending[1] += 1
+
+    async def _write_ratings(self):
+        changes, self._rating_changes = self._rating_changes, {}
+        if not changes:
+            return
+        # increments, so that tournaments running at once don't overwrite each other
+        async with in_transaction():
+            for player, (delta, games) in changes.items():
+                await Ratings.filter(user_id=player).update(
+                    rating=F("rating") + delta, games=F("games") + games
+                )
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = Event()
+
+    async def games_of(self, player_id: int, timeout: float = POLL_TIMEOUT) -> List[GameSessionState]:
+        """
+        not finished games of player, waits until player has some, tournament finishes
+        or **timeout** seconds pass (then returns empty list),
+        raises KeyError if player doesn't play in tournament
+        """
+        games = self._games[player_id]
+        try:
+            await wait_for(self._wait_games(games), timeout)
+        except TimeoutError:
+            pass
+        return [game.state for game in games.values()]
+
+    async def _wait_games(self, games: Dict[int, GameSession]):
+        while not games and not self._is_finished:
+            await self._changed.wait()
+
+    @property
+    def state(self) -> TournamentState:
+        return TournamentState(
+            tournament_id=self.id,
+            name=self.name,
+            format=self.format,
+            players_ids=self.players,
+            round=self.round,
+            rounds=self.rounds,
+            games_played=self.games_played,
+            is_finished=self._is_finished,
+            failed=self.failed,
+            standings=[
+                StandingsRow(
+                    player_id=player,
+                    points=self.standings.points[player],
+                    wins=self.standings.wins[player],
+                    loses=self.standings.loses[player],
+                    buchholz=self.standings.buchholz(player),
+                    rating=self.ratings.get(player),
+                )
+                for player in self.standings.ranking()
+            ],
+        )
+
+
+class TournamentsManager:
+    """
+    Running and finished tournaments, their games are game sessions of **sessions**,
+    on sharded server every worker runs its own tournaments (with ids it owns, like games)
+    """
+    def __init__(self, sessions: GameSessionsManager) -> None:
+        self.sessions = sessions
+        self.tournaments: Dict[int, Tournament] = {}
+        self._ids = count(sessions.cluster.index, sessions.cluster.workers)
+
+    async def new_tournament(
+        self, name: str, format: TournamentFormat, players: Sequence[int], **options
+    ) -> TournamentState:
+        """
+        start tournament, raises ValueError if there are less than 2 players,
+        some player appears twice or doesn't exist, see Tournament for **options**
+        """
+        if len(players) < 2 or len(set(players)) != len(players):
+            raise ValueError("at least 2 distinct players are needed")
+        if await Users.filter(id__in=players).count() != len(players):
+            raise ValueError("some players don't exist")
+        tournament = Tournament(next(self._ids), name, format, players, self.sessions, **options)
+        self.tournaments[tournament.id] = tournament
+        tournament.start()
+        return tournament.state
+
+    def get_tournament(self, tournament_id: int) -> Tournament:
+        """
+        raises IndexError if **tournament_id** doesnt corespond to any tournament
+        """
+        try:
+            return self.tournaments[tournament_id]
+        except KeyError:
+            raise IndexError(tournament_id) from None
+
+
+async def ratings(limit: int) -> List[PlayerRating]:
+    """
+    best rated players
+    """
+    rows = await Ratings.all().order_by("-rating").limit(limit).values(
+        "user_id", "user__username", "rating", "games"
+    )
+    return [
+        PlayerRating(
+            player_id=row["user_id"], username=row["user__username"], rating=row["rating"], games=row["games"]
+        )
+        for row in rows
+    ]
+
+
+current_tournaments = TournamentsManager(current_sessions)
@@ -0,0 +1,181 @@
+import logging
+from asyncio import Event, Task, TimeoutError, create_task, sleep, wait_for
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+from server.database.models.game import Games
+from server.database.models.user import Users
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0
+"""
+max seconds stats update waits in memory before it is written to database
+"""
+FLUSH_BATCH = 256
+"""
+number of users or games with pending updates that triggers flush before FLUSH_INTERVAL passes
+"""
+FLUSH_ATTEMPTS = 5
+"""
+failed flushes in row after which games are saved one by one, those that can't be saved are dropped
+"""
+MAX_FLUSH_BACKOFF = 60.0
+"""
+max seconds failed flush waits before it is retried
+"""
+
+
+class UserCache:
+    """
+    LRU cache of usernames by user id, usernames never change so entries never go stale
+    """
+    def __init__(self, maxsize: int = 1 << 16) -> None:
+        self.maxsize = maxsize
+        self._names: "OrderedDict[int, str]" = OrderedDict()
+
+    def put(self, user_id: int, username: str):
+        self._names[user_id] = username
+        self._names.move_to_end(user_id)
+        if len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+    async def username(self, user_id: int) -> str:
+        """
+        raises tortoise DoesNotExist if there is no user with **user_id**
+        """
+        try:
+            self._names.move_to_end(user_id)
+            return self._names[user_id]
+        except KeyError:
+            user = await Users.get(id=user_id)
+            self.put(user.id, user.username)
+            return user.username
+
+
+class StatsWriter:
+    """
+    Write-behind queue of wins/loses increments and finished games records
+    - updates are summed per user in memory and written in batches
+        as atomic F() increments, at most **flush_interval** seconds late
+    - users with equal increments share single UPDATE
+    - games are inserted by single bulk INSERT in the same transaction
+    - failed flush is retried later and later, after FLUSH_ATTEMPTS failures in row
+        games are saved separately, so that single bad row doesn't block all writes
+    """
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, batch: int = FLUSH_BATCH) -> None:
+        self.flush_interval = flush_interval
+        self.batch = batch
+        # user id => [wins, loses]
+        self._pending: Dict[int, List[int]] = {}
+        self._games: List[Games] = []
+        # flushes failed in row
+        self.failures = 0
+        # created by start, inside running event loop
+        self._dirty: Optional[Event] = None
+        self._full: Optional[Event] = None
+        self._task: Optional[Task] = None
+
+    def record(self, winner_id: int, loser_id: int, game: Optional[Games] = None):
+        """
+        queue result of finished game
+        - **game**: not saved record of the game
+        """
+        self._pending.setdefault(winner_id, [0, 0])[0] += 1
+        self._pending.setdefault(loser_id, [0, 0])[1] += 1
+        if game is not None:
+            self._games.append(game)
+        self._wake()
+
+    def _wake(self):
+        if self._task is None:
+            return
+        self._dirty.set()
+        if max(len(self._pending), len(self._games)) >= self.batch:
+            self._full.set()
+
+    async def flush(self):
+        """
+        write all pending updates, they are kept for next flush if writing fails
+        """
+        pending, self._pending = self._pending, {}
+        games, self._games = self._games, []
+        if self._task is not None:
+            self._dirty.clear()
+            self._full.clear()
+        if not pending and not games:
+            return
+        groups: Dict[Tuple[int, int], List[int]] = {}
+        for user_id, (wins, loses) in pending.items():
+            groups.setdefault((wins, loses), []).append(user_id)
+        separately = self.failures >= FLUSH_ATTEMPTS
+        try:
+            async with in_transaction():
+                for (wins, loses), ids in groups.items():
+                    await Users.filter(id__in=ids).update(
+                        wins=F("wins") + wins, loses=F("loses") + loses
+                    )
+                if games and not separately:
+                    await Games.bulk_create(games)
+        except Exception:
+            self._games[:0] = games
+            for user_id, (wins, loses) in pending.items():
+                counts = self._pending.setdefault(user_id, [0, 0])
+                counts[0] += wins
+                counts[1] += loses
+            self.failures += 1
+            self._wake()
+            raise
+        self.failures = 0
+        if separately:
+            await self._save_separately(games)
+
+    async def _save_separately(self, games: List[Games]):
+        """
+        save games one by one, games that fail even alone are dropped
+        """
+        for game in games:
+            try:
+                await game.save()
+            except Exception:
+                logger.exception(
+                    "game %r of players %s and %s dropped, it can't be saved",
+                    game.name,
+                    game.player1_id,
+                    game.player2_id,
+                )
+
+    def start(self):
+        if self._task is None:
+            self._dirty = Event()
+            self._full = Event()
+            self._task = create_task(self._run())
+
+    async def close(self):
+        """
+        stop background flushing and write what is left
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._dirty = self._full = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            try:
+                await wait_for(self._full.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("stats flush failed %s times in row", self.failures, exc_info=True)
+                # database may be down or overloaded, don't retry right away
+                await sleep(min(self.flush_interval * 2 ** self.failures, MAX_FLUSH_BACKOFF))
+
+
+user_cache = UserCache()
+stats_writer = StatsWriter()
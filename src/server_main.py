@@ -1,22 +1,49 @@
-from common.messages import BadMsgResp, MoveMsgError, msg_from_json
+from common.messages import BadMsgResp, Msg, MoveMsgError, Protocol
+from common.pylos import legal_moves_cache
+from common.tournament import TournamentFormat
+from common.wire import Encoding, decode_msg, encode_msg
 from fastapi import (
     FastAPI,
     HTTPException,
+    Query,
+    Response,
     WebSocket,
     WebSocketDisconnect,
 )
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-from server.database.game_session import GameSessionState
+from fastapi.responses import StreamingResponse
+from datetime import datetime
+from typing import List, Optional
+from server.database.game_session import GameSessionState, GameStatus, Pacing, TimeControl
 
 from tortoise.contrib.fastapi import register_tortoise
 
+from server.database.game_export import MEDIA_TYPES, ExportFormat, export_games, replay_lines
+from server.database.models.game import GAME_RECORD_FIELDS, GameRecord, Games, games_query
 from server.database.models.user import Users, user_pydantic
+from server.database.user_stats import stats_writer, user_cache
 
-from server.database.active_game_sessions import current_sessions
+from server.cluster import cluster, proxy_websocket
+from server.database.active_game_sessions import (
+    MAX_PAGE_LIMIT,
+    PAGE_LIMIT,
+    Page,
+    current_sessions,
+)
+from server.database.move_pool import legal_moves_pool
+from server.database.snapshots import SessionSnapshots, snapshot_path
+from server.database.tournaments import (
+    CONCURRENCY,
+    MATCH_TIMEOUT,
+    PlayerRating,
+    TournamentState,
+    current_tournaments,
+    ratings,
+)
 
 
 app = FastAPI()
+session_snapshots = SessionSnapshots(current_sessions, snapshot_path(cluster))
 
 origins = ["*"]
 
@@ -26,88 +53,328 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+
+# registered before tortoise, so that pending stats are flushed before connections are closed
+@app.on_event("startup")
+async def start_stats_writer():
+    stats_writer.start()
+
+
+@app.on_event("shutdown")
+async def save_sessions():
+    # players connections are closed by shutdown, they can reconnect after restart
+    current_sessions.closing = True
+    await session_snapshots.close()
+    await stats_writer.close()
+    legal_moves_pool.close()
+
+
 register_tortoise(
     app,
     db_url="sqlite://db.sqlite3",
-    modules={"models": ["server.database.models.user"]},
+    modules={
+        "models": [
+            "server.database.models.user",
+            "server.database.models.game",
+            "server.database.models.lobby",
+        ]
+    },
     generate_schemas=True,
     add_exception_handlers=True,
 )
 
 
+# registered after tortoise, database is ready
+@app.on_event("startup")
+async def restore_sessions():
+    if current_sessions.lobby is not None:
+        await current_sessions.lobby.reset()
+    await session_snapshots.load()
+    session_snapshots.start()
+
+
 @app.post("/player/new/{username}", response_model=user_pydantic)
 async def player_new(username: str):
     """
     Create new player
     """
     user = await Users.create(username=username)
+    user_cache.put(user.id, user.username)
     return await user_pydantic.from_tortoise_orm(user)
 
 
 @app.get("/player/list", response_model=List[user_pydantic])
 async def player_list():
     """
-    list players
+    list players, stats of just finished games are written first
     """
+    await stats_writer.flush()
     return await user_pydantic.from_queryset(Users.all())
 
 
+@app.get("/player/ratings", response_model=List[PlayerRating])
+async def player_ratings(limit: int = Query(PAGE_LIMIT, gt=0, le=MAX_PAGE_LIMIT)):
+    """
+    Players by Elo rating from tournament games, best first
+    """
+    return await ratings(limit)
+
+
 @app.post("/game/new", response_model=GameSessionState)
-async def game_new(name: str):
+async def game_new(
+    name: str,
+    pacing: Pacing = Pacing.realtime,
+    move_time: Optional[float] = Query(None, gt=0),
+    bank: Optional[float] = Query(None, gt=0),
+):
     """
     Create new game and returns it's state
 
     - **name**: game name should be unique
+    - **pacing**: realtime (animated for spectators) or turbo (no delays, for bot matches)
+    - **move_time**: seconds player has for every move, not limited by default
+    - **bank**: seconds player has for all their moves, not limited by default,
+        player that runs out of time loses
     """
     try:
-        return current_sessions.new_game(name)
+        return await current_sessions.new_game(name, pacing, TimeControl(move_time=move_time, bank=bank))
     except NameError:
-        return HTTPException(code=409, detail="game with this name already exists!")
+        raise HTTPException(status_code=409, detail="game with this name already exists!")
+
+
+def _paged(response: Response, page: Page) -> List[GameSessionState]:
+    states, next_cursor = page
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return states
 
 
 @app.get("/game/search/{name}", response_model=List[GameSessionState])
-async def search_games(name: str):
+async def search_games(
+    name: str,
+    response: Response,
+    cursor: int = -1,
+    limit: int = Query(PAGE_LIMIT, gt=0, le=MAX_PAGE_LIMIT),
+    status: Optional[GameStatus] = None,
+):
     """
-    List all games that contain **name** in their names
+    List games that contain **name** in their names, ordered by id
     - **name**: substring of game name to search
+    - **cursor**, **limit**, **status**: see /game/list
     """
-    return list(map(lambda g: g.state, current_sessions.search_games(name)))
+    return _paged(response, await current_sessions.search_page(name, cursor, limit, status))
 
 
 @app.get("/game/list", response_model=List[GameSessionState])
-def game_list():
+async def game_list(
+    response: Response,
+    cursor: int = -1,
+    limit: int = Query(PAGE_LIMIT, gt=0, le=MAX_PAGE_LIMIT),
+    status: Optional[GameStatus] = None,
+):
+    """
+    List games ordered by id, one page at a time
+    - **cursor**: list games with id greater than cursor, to get next page pass
+        value of X-Next-Cursor header (it is missing on last page)
+    - **limit**: max number of games on page
+    - **status**: only open, in_progress or finished games
+    """
+    return _paged(response, await current_sessions.list_page(cursor, limit, status))
+
+
+@app.get("/game/records", response_model=List[GameRecord])
+async def game_records(
+    player_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    until_id: Optional[int] = None,
+    limit: int = Query(PAGE_LIMIT, gt=0, le=MAX_PAGE_LIMIT),
+):
+    """
+    Finished games, newest first, without move logs
+    - **player_id**: only games of this player
+    - **since**, **until**: only games finished in this time range, to get next page
+        pass finished_at and id of last game as **until** and **until_id**
+        (games finished at the same time are ordered by id)
+    """
+    await stats_writer.flush()
+    return await games_query(player_id, since, until, until_id).limit(limit).values(*GAME_RECORD_FIELDS)
+
+
+@app.get("/game/records/{record_id}/replay")
+async def game_replay(record_id: int):
+    """
+    Stream replay of finished game as ndjson: game record, then board and tokens
+    before first move and after every move
+    """
+    await stats_writer.flush()
+    game = await Games.filter(id=record_id).first().values(*GAME_RECORD_FIELDS, "moves")
+    if game is None:
+        raise HTTPException(status_code=404, detail=f"there is no game record with id = {record_id}!")
+    return StreamingResponse(replay_lines(game), media_type=MEDIA_TYPES[ExportFormat.ndjson])
+
+
+@app.get("/game/export")
+async def game_export(
+    format: ExportFormat = ExportFormat.ndjson,
+    player_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    until_id: Optional[int] = None,
+):
     """
-    List all games
+    Stream finished games with move logs, in constant memory regardless of their number
+    - **format**: ndjson (game record with list of moves per line)
+        or binary (see common.wire.iter_games for reading it)
+    - **player_id**, **since**, **until**, **until_id**: see /game/records
     """
-    return list(map(lambda g: g.state, current_sessions.list_games()))
+    await stats_writer.flush()
+    return StreamingResponse(
+        export_games(games_query(player_id, since, until, until_id), format), media_type=MEDIA_TYPES[format]
+    )
+
+
+@app.post("/tournament/new", response_model=TournamentState)
+async def tournament_new(
+    name: str,
+    players_ids: List[int] = Query(...),
+    format: TournamentFormat = TournamentFormat.round_robin,
+    rounds: Optional[int] = Query(None, gt=0),
+    cycles: int = Query(1, gt=0),
+    concurrency: int = Query(CONCURRENCY, gt=0),
+    match_timeout: float = Query(MATCH_TIMEOUT, gt=0),
+    move_time: Optional[float] = Query(None, gt=0),
+    bank: Optional[float] = Query(None, gt=0),
+):
+    """
+    Start tournament of registered players, its games are turbo games only paired players can join
+
+    - **players_ids**: players of tournament, for gauntlet the first one plays all the others
+    - **format**: round_robin, swiss or gauntlet
+    - **rounds**: number of swiss rounds, by default enough to find single winner
+    - **cycles**: how many times round robin or gauntlet pairings are played
+    - **concurrency**: max number of games played at once
+    - **match_timeout**: seconds after which game is abandoned without result
+    - **move_time**, **bank**: time control of games, see /game/new
+    """
+    try:
+        return await current_tournaments.new_tournament(
+            name,
+            format,
+            players_ids,
+            rounds=rounds,
+            cycles=cycles,
+            concurrency=concurrency,
+            match_timeout=match_timeout,
+            time_control=TimeControl(move_time=move_time, bank=bank),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/tournament/{tournament_id}", response_model=TournamentState)
+async def tournament_state(tournament_id: int):
+    """
+    Progress and standings of tournament
+    """
+    try:
+        return current_tournaments.get_tournament(tournament_id).state
+    except IndexError:
+        raise HTTPException(status_code=404, detail=f"there is no tournament with id = {tournament_id}!")
+
+
+@app.get("/tournament/{tournament_id}/games", response_model=List[GameSessionState])
+async def tournament_games(tournament_id: int, player_id: int):
+    """
+    Not finished games of player in tournament, waits until player has some,
+    tournament is over or POLL_TIMEOUT seconds pass, so empty list means tournament is over
+    only if /tournament/{tournament_id} says so; bot connects to every game it gets
+    and asks again when they finish
+
+    on sharded server ask the worker that created the tournament
+    """
+    try:
+        return await current_tournaments.get_tournament(tournament_id).games_of(player_id)
+    except (IndexError, KeyError):
+        raise HTTPException(
+            status_code=404, detail=f"player {player_id} doesn't play tournament {tournament_id}!"
+        )
+
+
+@app.get("/stats/legal_moves_cache")
+def legal_moves_cache_stats():
+    """
+    Hit/miss counters of legal moves cache shared by all games
+    """
+    return legal_moves_cache.info()
+
+
+async def _send_msg(websocket: WebSocket, msg: Msg, encoding: Encoding):
+    if encoding == Encoding.binary:
+        await websocket.send_bytes(encode_msg(msg, encoding))
+    else:
+        await websocket.send_text(encode_msg(msg, encoding))
 
 
 @app.websocket("/game/connect")
-async def connect_to_game(websocket: WebSocket, game_id: int, player_id: int = None):
+async def connect_to_game(
+    websocket: WebSocket,
+    game_id: int,
+    player_id: int = None,
+    protocol: Protocol = Protocol.full,
+    encoding: Encoding = Encoding.json,
+):
     """
     Connect to game
     - **player_id** id of player that joins, if **player_id**==0 join as spectator
     - **game_id**: id of game to join
+    - **protocol**: full (every state is GameStateMsg) or delta
+        (GameStateMsg on connect, then GameStateDeltaMsg, send ResyncMsg on sequence gap)
+    - **encoding**: json (text frames) or binary (binary frames, see common.wire),
+        used in both directions
+
+    on sharded server connection to game owned by other worker is proxied to it
     """
+    if not cluster.is_local(game_id):
+        await proxy_websocket(websocket, f"{cluster.url(game_id)}/game/connect?{websocket.url.query}")
+        return
     try:
-        await current_sessions.connect(websocket, game_id, player_id)
+        await current_sessions.connect(websocket, game_id, player_id, protocol, encoding)
     except IndexError:
-        return HTTPException(code=404, detail=f"there is no game with id = {game_id}!")
+        # exception raised in websocket route isn't turned into response, handshake is rejected instead
+        # (policy violation)
+        await websocket.close(code=1008)
+        return
+    frame = "bytes" if encoding == Encoding.binary else "text"
     try:
         while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get(frame)
+            if data is None:
+                await _send_msg(
+                    websocket, BadMsgResp({"detail": f"expected {frame} frame"}), encoding
+                )
+                continue
             try:
-                json_msg = await websocket.receive_json()
-                msg = msg_from_json(json_msg)
-                await current_sessions.handle_msg(websocket, game_id, player_id, msg)
+                msg = decode_msg(data, encoding)
             except TypeError:
-                await websocket.send_json(
-                    BadMsgResp({"detail": f"unknown msg type: {json_msg}"}).to_dict()
+                await _send_msg(
+                    websocket, BadMsgResp({"detail": f"unknown msg type: {data}"}), encoding
                 )
-            except MoveMsgError:
-                await websocket.send_json(
-                    BadMsgResp({"detail": f"MoveMsg bad data: {json_msg}"}).to_dict()
+                continue
+            except (MoveMsgError, ValueError, KeyError):
+                await _send_msg(
+                    websocket, BadMsgResp({"detail": f"MoveMsg bad data: {data}"}), encoding
                 )
+                continue
+            await current_sessions.handle_msg(websocket, game_id, player_id, msg)
     except WebSocketDisconnect:
+        pass
+    finally:
+        # player's seat must not stay bound to this connection, whatever ended it
         await current_sessions.disconnect(websocket, game_id, player_id)
@@ -0,0 +1,176 @@
+import unittest
+from asyncio import Event
+from unittest.mock import patch
+
+import bot_sdk
+from bot_sdk import Bot, BotClient, legal_moves
+from common.messages import GameOverMsg, MoveMsg, ResyncMsg, YourMoveMsg
+from common.pylos import LegalList, Position
+from common.wire import Encoding, decode_msg, encode_msg
+from common.ws_client import ConnectionClosed
+
+GAME_OVER = GameOverMsg({"winner_id": 1, "winner_name": "bot", "winner_tokens": 3})
+
+
+def your_move():
+    position = Position()
+    return YourMoveMsg(
+        {
+            "seq": 1,
+            "turn": position.turn,
+            "players_ids": [1, 2],
+            "players_names": ["bot", "other"],
+            "tokens": list(position.tokens),
+            "board": position.board(),
+            "legal": LegalList.of(position.legal_moves()),
+        }
+    )
+
+
+class FakeWebSocket:
+    """
+    Connection delivering **frames**, then closed by server, or silent if **hang**
+    """
+    def __init__(self, frames, hang=False) -> None:
+        self.frames = list(frames)
+        self.hang = hang
+        self.sent = []
+        self.closed = False
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def receive(self):
+        if self.frames:
+            return self.frames.pop(0)
+        if self.hang:
+            await Event().wait()
+        raise ConnectionClosed
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class FirstMoveBot(Bot):
+    def __init__(self) -> None:
+        self.results = []
+
+    async def choose(self, state):
+        return legal_moves(state)[0]
+
+    def game_over(self, msg):
+        self.results.append(msg)
+
+
+class FailingBot(Bot):
+    async def choose(self, state):
+        raise RuntimeError("bot bug")
+
+
+class TestBotClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.connections = []
+        self.urls = []
+
+    def serve(self, *connections):
+        """
+        WebSocketClient.connect returning **connections** one after another,
+        OSError in place of connection is raised
+        """
+        self.connections = list(connections)
+
+        async def connect(url):
+            self.urls.append(url)
+            connection = self.connections.pop(0)
+            if isinstance(connection, Exception):
+                raise connection
+            return connection
+
+        patcher = patch.object(bot_sdk.WebSocketClient, "connect", connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, bot=FirstMoveBot, encoding=Encoding.json):
+        return BotClient(bot, 1, encoding=encoding, reconnect_delay=0)
+
+    async def test_play(self):
+        for encoding in Encoding:
+            with self.subTest(encoding=encoding):
+                websocket = FakeWebSocket([encode_msg(msg, encoding) for msg in (your_move(), GAME_OVER)])
+                self.serve(websocket)
+                result = await self.client(encoding=encoding).play(7)
+                self.assertEqual(result.to_dict(), GAME_OVER.to_dict())
+                self.assertIn(f"game_id=7&player_id=1&encoding={encoding.value}", self.urls[-1])
+                move = decode_msg(websocket.sent[0], encoding)
+                self.assertIs(type(move), MoveMsg)
+                self.assertEqual(move.to_move(), sorted(Position().legal_moves())[0])
+                self.assertTrue(websocket.closed)
+
+    async def test_reconnect(self):
+        frames = [encode_msg(your_move(), Encoding.json)]
+        self.serve(
+            OSError("refused"),
+            FakeWebSocket(frames),
+            FakeWebSocket(frames + [encode_msg(GAME_OVER, Encoding.json)]),
+        )
+        bots = []
+
+        def bot():
+            bots.append(FirstMoveBot())
+            return bots[-1]
+
+        self.assertEqual((await self.client(bot).play(7)).winner_id, 1)
+        self.assertEqual(len(self.urls), 3)
+        # the same bot plays the whole game
+        self.assertEqual(len(bots), 1)
+        self.assertEqual(len(bots[0].results), 1)
+
+    async def test_gives_up(self):
+        self.serve(*[OSError("refused")] * (bot_sdk.MAX_RECONNECTS + 1))
+        self.assertIsNone(await self.client().play(7))
+        self.assertEqual(len(self.urls), bot_sdk.MAX_RECONNECTS + 1)
+
+    @patch("bot_sdk.RESYNC_TIMEOUT", 0.05)
+    async def test_finished_while_away(self):
+        # nothing comes after reconnect, game is over
+        self.serve(FakeWebSocket([encode_msg(your_move(), Encoding.json)]), FakeWebSocket([], hang=True))
+        self.assertIsNone(await self.client().play(7))
+        self.assertEqual(len(self.urls), 2)
+
+    async def test_resync_on_bad_frame(self):
+        websocket = FakeWebSocket(["not json", encode_msg(GAME_OVER, Encoding.json)])
+        self.serve(websocket)
+        self.assertEqual((await self.client().play(7)).winner_id, 1)
+        self.assertEqual(websocket.sent, [encode_msg(ResyncMsg({}), Encoding.json)])
+
+    async def test_failing_bot(self):
+        frames = [encode_msg(your_move(), Encoding.json), encode_msg(GAME_OVER, Encoding.json)]
+        self.serve(FakeWebSocket(frames), FakeWebSocket(frames))
+        bots = iter([FailingBot(), FirstMoveBot()])
+        with self.assertLogs("bot_sdk", "ERROR"):
+            results = await self.client(lambda: next(bots)).play_many([7, 8])
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1].winner_id, 1)
+
+    async def test_tournament(self):
+        self.serve(FakeWebSocket([encode_msg(GAME_OVER, Encoding.json)]))
+        # games of player: one game, then nothing until poll timeout, then nothing as tournament is over
+        responses = {
+            "games": [[{"game_id": 7}], [], []],
+            "state": [{"is_finished": False}, {"is_finished": True}],
+        }
+        asked = []
+
+        def get_json(url):
+            asked.append(url)
+            return responses["games" if "/games?" in url else "state"].pop(0)
+
+        with patch.object(bot_sdk, "_get_json", get_json):
+            await self.client().play_tournament(3)
+        self.assertEqual(len(self.urls), 1)
+        self.assertTrue(asked[0].startswith("http://127.0.0.1:8000/tournament/3/games?player_id=1"))
+        self.assertEqual(responses, {"games": [], "state": []})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from common.match import MAX_MOVES, Match, Outcome, random_bot, run_matches, score
+from common.pylos import Move, Position
+
+
+def first_move_bot(position, legal):
+    return legal[0]
+
+
+def illegal_bot(position, legal):
+    return Move("put", 29)
+
+
+def failing_bot(position, legal):
+    raise RuntimeError
+
+
+class TestMatch(unittest.TestCase):
+    def test_rules(self):
+        for result in run_matches(random_bot, first_move_bot, 20, processes=0):
+            position = Position()
+            for move in result.moves:
+                self.assertIn(move, position.legal_moves())
+                position.make(move)
+            self.assertEqual(result.outcome, Outcome.no_moves)
+            self.assertEqual(position.legal_moves(), [])
+            # bot to move lost
+            loser_slot = (position.turn + 1) % 2
+            winner_slot = 1 - loser_slot
+            self.assertEqual(result.winner, winner_slot if result.first == 1 else loser_slot)
+            self.assertEqual(result.winner_tokens, position.tokens[winner_slot])
+
+    def test_second_bot_moves_first(self):
+        result = Match(illegal_bot, first_move_bot).play()
+        self.assertEqual(result.first, 1)
+        self.assertEqual(len(result.moves), 1)
+        self.assertEqual(result.winner, 1)
+        self.assertEqual(result.outcome, Outcome.illegal_move)
+
+    def test_error(self):
+        result = Match(first_move_bot, failing_bot).play()
+        self.assertEqual((result.winner, result.outcome, result.moves), (0, Outcome.error, ()))
+
+    def test_max_moves(self):
+        result = Match(random_bot, random_bot, max_moves=3).play()
+        self.assertEqual((result.winner, result.outcome, len(result.moves)), (None, Outcome.max_moves, 3))
+        self.assertGreater(MAX_MOVES, 100)
+
+    def test_alternate(self):
+        results = list(run_matches(first_move_bot, failing_bot, 4, processes=0))
+        self.assertEqual([r.first for r in results], [1, 0, 1, 0])
+        self.assertEqual(score(results), [4, 0, 0])
+
+    def test_pool_reproducible(self):
+        local = list(run_matches(random_bot, random_bot, 30, processes=0, seed=5, chunk=8))
+        pooled = list(run_matches(random_bot, random_bot, 30, processes=2, seed=5, chunk=8))
+        self.assertEqual(local, pooled)
+        self.assertEqual(len(local), 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from common.messages import GameStateDeltaMsg, GameStateMsg
+from common.pylos import generate_empty_board
+
+
+def state(seq: int) -> GameStateMsg:
+    return GameStateMsg(
+        {
+            "seq": seq,
+            "turn": 0,
+            "players_ids": [1, 2],
+            "players_names": ["a", "b"],
+            "tokens": [15, 15],
+            "board": generate_empty_board(),
+            "legal": [],
+        }
+    )
+
+
+def delta(seq: int) -> GameStateDeltaMsg:
+    return GameStateDeltaMsg(
+        {
+            "seq": seq,
+            "turn": 1,
+            "changed": [[0, 1, 2, 2]],
+            "tokens": [0, -1],
+            "move": None,
+        }
+    )
+
+
+class TestGameStateDelta(unittest.TestCase):
+    def test_apply(self):
+        s = state(3)
+        self.assertTrue(delta(4).apply(s))
+        self.assertEqual(s.seq, 4)
+        self.assertEqual(s.turn, 1)
+        self.assertEqual(s.tokens, [15, 14])
+        self.assertEqual(s.board[0][1][2], 2)
+
+    def test_gap(self):
+        s = state(3)
+        self.assertFalse(delta(5).apply(s))
+        self.assertEqual(s.seq, 3)
+        self.assertEqual(s.board, generate_empty_board())
+
+    def test_stale_ignored(self):
+        s = state(3)
+        self.assertTrue(delta(3).apply(s))
+        self.assertEqual(s.tokens, [15, 15])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,547 @@
+import pickle
+import random
+import unittest
+from copy import deepcopy
+
+from common.pylos import (
+    SYMMETRIES,
+    Board,
+    LegalList,
+    LegalMovesCache,
+    Move,
+    Position,
+    bitboard_moves,
+    bits,
+    canonical_bitboard,
+    canonical_key,
+    cell_index,
+    from_bitboard,
+    generate_empty_board,
+    inverse_symmetry,
+    is_on_board,
+    legal_move_set,
+    legal_moves,
+    position_key,
+    to_bitboard,
+    transform_bitboard,
+    transform_move,
+)
+
+
+# straightforward nested list implementation of move generation, kept as reference
+
+
+def _supported_empty(board: Board, level):
+    if level == 0:
+        return [
+            {"x": x, "y": y, "level": 0}
+            for x in range(0, 4)
+            for y in range(0, 4)
+            if board[0][x][y] == 0
+        ]
+
+    return [
+        {"x": x, "y": y, "level": level}
+        for x in range(0, 4 - level)
+        for y in range(0, 4 - level)
+        if board[level][x][y] == 0
+        and all(
+            [
+                board[level - 1][xi][yi]
+                for xi in range(x, x + 2)
+                for yi in range(y, y + 2)
+            ]
+        )
+    ]
+
+
+def _legal_cat_put(board):
+    s = [
+        m for i in [_supported_empty(board, level) for level in range(0, 4)] for m in i
+    ]
+    for p in s:
+        p["cat"] = "put"
+    return s
+
+
+def _takeable(board, level, player):
+    return [
+        {"x": x, "y": y, "level": level}
+        for x in range(0, 4 - level)
+        for y in range(0, 4 - level)
+        if board[level][x][y] == player
+        and not any(
+            [
+                board[level + 1][xi][yi]
+                for xi in range(max(0, x - 1), min(3 - level, x + 1))
+                for yi in range(max(0, y - 1), min(3 - level, y + 1))
+            ]
+        )
+    ]
+
+
+def _legal_cat_move(board, player):
+    mv0 = _takeable(board, 0, player)
+    sp1 = _supported_empty(board, 1)
+    res = [
+        {
+            "cat": "move",
+            "x": s["x"],
+            "y": s["y"],
+            "level": s["level"],
+            "take_x": m["x"],
+            "take_y": m["y"],
+            "take_level": m["level"],
+        }
+        for s in sp1
+        for m in mv0
+        if m
+        not in [
+            {"x": xi, "y": yi, "level": 0}
+            for xi in [s["x"], s["x"] + 1]
+            for yi in [s["y"], s["y"] + 1]
+        ]
+    ]
+    mv1 = _takeable(board, 1, player)
+    sp2 = _supported_empty(board, 2)
+    res += [
+        {
+            "cat": "move",
+            "x": s["x"],
+            "y": s["y"],
+            "level": s["level"],
+            "take_x": m["x"],
+            "take_y": m["y"],
+            "take_level": m["level"],
+        }
+        for s in sp2
+        for m in mv1
+        if m
+        not in [
+            {"x": xi, "y": yi, "level": 1}
+            for xi in [s["x"], s["x"] + 1]
+            for yi in [s["y"], s["y"] + 1]
+        ]
+    ]
+    return res
+
+
+def _legal_cat_square(board, player):
+    legal_put = [
+        m for i in [_supported_empty(board, level) for level in range(0, 3)] for m in i
+    ]
+    legal_square = [
+        m
+        for m in legal_put
+        if any(
+            [
+                3 == len(
+                    [
+                        1
+                        for (xi, yi) in [
+                            (m["x"], m["y"] - 1),
+                            (m["x"] + 1, m["y"] - 1),
+                            (m["x"] + 1, m["y"]),
+                        ]
+                        if is_on_board(board, m["level"], xi, yi)
+                        and board[m["level"]][xi][yi] == player
+                    ]
+                ),
+                3 == len(
+                    [
+                        1
+                        for (xi, yi) in [
+                            (m["x"] + 1, m["y"]),
+                            (m["x"] + 1, m["y"] + 1),
+                            (m["x"], m["y"] + 1),
+                        ]
+                        if is_on_board(board, m["level"], xi, yi)
+                        and board[m["level"]][xi][yi] == player
+                    ]
+                ),
+                3 == len(
+                    [
+                        1
+                        for (xi, yi) in [
+                            (m["x"], m["y"] + 1),
+                            (m["x"] - 1, m["y"] + 1),
+                            (m["x"] - 1, m["y"]),
+                        ]
+                        if is_on_board(board, m["level"], xi, yi)
+                        and board[m["level"]][xi][yi] == player
+                    ]
+                ),
+                3 == len(
+                    [
+                        1
+                        for (xi, yi) in [
+                            (m["x"] - 1, m["y"]),
+                            (m["x"] - 1, m["y"] - 1),
+                            (m["x"], m["y"] - 1),
+                        ]
+                        if is_on_board(board, m["level"], xi, yi)
+                        and board[m["level"]][xi][yi] == player
+                    ]
+                ),
+            ]
+        )
+    ]
+    res = []
+    for sq in legal_square:
+        bcp1 = deepcopy(board)
+        bcp1[sq["level"]][sq["x"]][sq["y"]] = player
+        takeable1 = [
+            m
+            for i in [_takeable(bcp1, level, player) for level in range(0, 3)]
+            for m in i
+        ]
+        res += [
+            {
+                "cat": "square",
+                "level": sq["level"],
+                "x": sq["x"],
+                "y": sq["y"],
+                "take_level": t["level"],
+                "take_x": t["x"],
+                "take_y": t["y"],
+                "take_sq_level": -1,
+                "take_sq_x": -1,
+                "take_sq_y": -1,
+            }
+            for t in takeable1
+        ]
+        for t in takeable1:
+            bcp2 = deepcopy(bcp1)
+            bcp2[t["level"]][t["x"]][t["y"]] = 0
+            takeable2 = [
+                m
+                for i in [_takeable(bcp2, level, player) for level in range(0, 3)]
+                for m in i
+            ]
+            res += [
+                {
+                    "cat": "square",
+                    "level": sq["level"],
+                    "x": sq["x"],
+                    "y": sq["y"],
+                    "take_level": t["level"],
+                    "take_x": t["x"],
+                    "take_y": t["y"],
+                    "take_sq_level": t2["level"],
+                    "take_sq_x": t2["x"],
+                    "take_sq_y": t2["y"],
+                }
+                for t2 in takeable2
+            ]
+    return res
+
+
+def reference_legal_moves(board, turn):
+    res = _legal_cat_put(board)
+    res += _legal_cat_move(board, turn % 2 + 1)
+    res += _legal_cat_square(board, turn % 2 + 1)
+    return res
+
+
+def random_board(rng: random.Random, fill: float):
+    """
+    random board respecting pyramid support rules (not necessarily reachable in game)
+    """
+    board = generate_empty_board()
+    for level in range(0, 4):
+        for x in range(0, 4 - level):
+            for y in range(0, 4 - level):
+                supported = level == 0 or all(
+                    board[level - 1][xi][yi]
+                    for xi in range(x, x + 2)
+                    for yi in range(y, y + 2)
+                )
+                if supported and rng.random() < fill:
+                    board[level][x][y] = rng.choice([1, 2])
+    return board
+
+
+def random_boards(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [random_board(rng, rng.choice([0.2, 0.5, 0.7, 0.9])) for _ in range(count)]
+
+
+def as_set(moves):
+    return sorted(tuple(sorted(m.items())) for m in moves)
+
+
+class TestBitboard(unittest.TestCase):
+    def test_cell_index_layout(self):
+        self.assertEqual(cell_index(0, 0, 0), 0)
+        self.assertEqual(cell_index(0, 3, 3), 15)
+        self.assertEqual(cell_index(1, 0, 0), 16)
+        self.assertEqual(cell_index(2, 1, 1), 28)
+        self.assertEqual(cell_index(3, 0, 0), 29)
+
+    def test_bits(self):
+        self.assertEqual(bits(0), ())
+        self.assertEqual(bits((1 << 30) - 1), tuple(range(0, 30)))
+        for mask in random.Random(0).sample(range(0, 1 << 30), 100):
+            self.assertEqual(bits(mask), tuple(i for i in range(0, 30) if mask >> i & 1))
+
+    def test_bitboard_round_trip(self):
+        for board in random_boards(200):
+            self.assertEqual(from_bitboard(to_bitboard(board)), board)
+
+    def test_is_on_board(self):
+        board = generate_empty_board()
+        self.assertTrue(is_on_board(board, 1, 2, 2))
+        self.assertFalse(is_on_board(board, 1, 3, 0))
+        self.assertFalse(is_on_board(board, 0, -1, 0))
+        self.assertFalse(is_on_board(board, 4, 0, 0))
+
+    def test_empty_board(self):
+        board = generate_empty_board()
+        self.assertEqual(as_set(legal_moves(board, 0)), as_set(reference_legal_moves(board, 0)))
+        self.assertEqual(len(legal_moves(board, 0)), 16)
+
+    def test_matches_reference(self):
+        for i, board in enumerate(random_boards(500)):
+            for turn in (i, i + 1):
+                self.assertEqual(
+                    as_set(legal_moves(board, turn)),
+                    as_set(reference_legal_moves(board, turn)),
+                )
+
+    def test_square_does_not_wrap_around_edges(self):
+        board = generate_empty_board()
+        board[0][3][0] = 2
+        board[0][3][3] = 2
+        board[0][0][3] = 2
+        self.assertFalse([m for m in legal_moves(board, 1) if m["cat"] == "square"])
+
+
+class TestMove(unittest.TestCase):
+    def test_dict_round_trip(self):
+        for i, board in enumerate(random_boards(200)):
+            for move in legal_moves(board, i):
+                self.assertEqual(Move.from_dict(move).to_dict(), move)
+
+    def test_legal_move_set(self):
+        for i, board in enumerate(random_boards(200)):
+            moves = legal_moves(board, i)
+            legal = legal_move_set(board, i)
+            self.assertEqual(len(legal), len(moves))
+            self.assertEqual(legal, frozenset(Move.from_dict(m) for m in moves))
+
+    def test_hashable_and_comparable(self):
+        move = Move.from_dict({"cat": "move", "x": 1, "y": 0, "level": 1,
+                               "take_x": 3, "take_y": 3, "take_level": 0})
+        self.assertEqual(move, Move("move", cell_index(1, 1, 0), cell_index(0, 3, 3)))
+        self.assertIn(move, {move})
+
+    def test_square_single_take(self):
+        move = {"cat": "square", "x": 0, "y": 0, "level": 0, "take_x": 0, "take_y": 0,
+                "take_level": 0, "take_sq_x": -1, "take_sq_y": -1, "take_sq_level": -1}
+        self.assertEqual(Move.from_dict(move), Move("square", 0, 0))
+        self.assertEqual(Move.from_dict(move).to_dict(), move)
+
+    def test_malformed(self):
+        for move in [
+            {"cat": "put", "x": 3, "y": 0, "level": 1},
+            {"cat": "put", "x": -1, "y": 0, "level": 0},
+            {"cat": "put", "x": 0, "y": 0, "level": 4},
+            {"cat": "put", "x": "0", "y": 0, "level": 0},
+            {"cat": "jump", "x": 0, "y": 0, "level": 0, "take_x": 0, "take_y": 0, "take_level": 0},
+            {"cat": "move", "x": 0, "y": 0, "level": 1},
+            {"x": 0, "y": 0, "level": 0},
+        ]:
+            with self.assertRaises(ValueError):
+                Move.from_dict(move)
+
+
+class TestLegalMovesCache(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = LegalMovesCache()
+        board = generate_empty_board()
+        self.assertEqual(cache.get(board, 1), legal_move_set(board, 1))
+        self.assertEqual(cache.get(board, 1), legal_move_set(board, 1))
+        self.assertEqual(cache.get(board, 2), legal_move_set(board, 2))
+        self.assertEqual(cache.info(), {"hits": 1, "misses": 2, "size": 2, "maxsize": cache.maxsize})
+
+    def test_matches_uncached(self):
+        cache = LegalMovesCache(maxsize=50)
+        boards = random_boards(100)
+        for _ in range(2):
+            for i, board in enumerate(boards):
+                self.assertEqual(cache.get(board, i), legal_move_set(board, i))
+        self.assertLessEqual(cache.info()["size"], 50)
+
+    def test_lru_eviction(self):
+        cache = LegalMovesCache(maxsize=2)
+        a, b, c = random_boards(3, seed=1)
+        cache.get(a, 0)
+        cache.get(b, 0)
+        cache.get(a, 0)
+        cache.get(c, 0)
+        cache.get(a, 0)
+        self.assertEqual(cache.hits, 2)
+        cache.get(b, 0)
+        self.assertEqual(cache.misses, 4)
+
+    def test_canonical(self):
+        cache = LegalMovesCache(canonical=True)
+        board = random_boards(1, seed=3)[0]
+        bitboard = to_bitboard(board)
+        for sym in range(0, SYMMETRIES):
+            symmetric = transform_bitboard(bitboard, sym)
+            self.assertEqual(
+                cache.get(from_bitboard(symmetric), 0), frozenset(bitboard_moves(symmetric, 1))
+            )
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, SYMMETRIES - 1)
+
+    def test_lookup_and_put(self):
+        bitboard = to_bitboard(random_boards(1, seed=4)[0])
+        for canonical in (False, True):
+            cache = LegalMovesCache(canonical=canonical)
+            symmetric = transform_bitboard(bitboard, 5)
+            self.assertIsNone(cache.lookup(symmetric, 2))
+            cache.put(symmetric, 2, bitboard_moves(symmetric, 2))
+            self.assertEqual(cache.lookup(symmetric, 2), tuple(sorted(bitboard_moves(symmetric, 2))))
+            if canonical:
+                self.assertEqual(cache.lookup(bitboard, 2), tuple(sorted(bitboard_moves(bitboard, 2))))
+            self.assertEqual(cache.get_bitboard(symmetric, 2), frozenset(bitboard_moves(symmetric, 2)))
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_legal_list(self):
+        moves = bitboard_moves(to_bitboard(random_boards(1, seed=5)[0]), 1)
+        legal = LegalList.of(moves)
+        self.assertEqual(legal, tuple(sorted(moves)))
+        self.assertEqual(legal.dicts, [m.to_dict() for m in legal])
+        self.assertEqual(len(legal.packed), 2 * len(legal))
+        # moves and dicts are shared with every other list, also one that crossed process boundary
+        for other in (LegalList.of(reversed(legal)), pickle.loads(pickle.dumps(legal))):
+            self.assertEqual(other, legal)
+            self.assertTrue(all(a is b for a, b in zip(other, legal)))
+            self.assertTrue(all(a is b for a, b in zip(other.dicts, legal.dicts)))
+        self.assertEqual(LegalList.of(()), ())
+
+    def test_position_key_unique(self):
+        boards = random_boards(300, seed=2)
+        keys = {position_key(to_bitboard(b), p) for b in boards for p in (1, 2)}
+        distinct = {(str(b), p) for b in boards for p in (1, 2)}
+        self.assertEqual(len(keys), len(distinct))
+
+
+class TestSymmetry(unittest.TestCase):
+    def test_group(self):
+        bitboard = to_bitboard(random_boards(1, seed=4)[0])
+        boards = {transform_bitboard(bitboard, sym) for sym in range(0, SYMMETRIES)}
+        for sym in range(0, SYMMETRIES):
+            self.assertEqual(
+                transform_bitboard(transform_bitboard(bitboard, sym), inverse_symmetry(sym)),
+                bitboard,
+            )
+            for other in boards:
+                self.assertIn(transform_bitboard(other, sym), boards)
+
+    def test_support_preserved(self):
+        for board in random_boards(100, seed=5):
+            bitboard = to_bitboard(board)
+            for sym in range(0, SYMMETRIES):
+                symmetric = from_bitboard(transform_bitboard(bitboard, sym))
+                self.assertEqual(len(legal_moves(symmetric, 1)), len(legal_moves(board, 1)))
+
+    def test_canonical_form(self):
+        for board in random_boards(100, seed=6):
+            bitboard = to_bitboard(board)
+            canonical, sym = canonical_bitboard(bitboard)
+            self.assertEqual(transform_bitboard(bitboard, sym), canonical)
+            for other in range(0, SYMMETRIES):
+                symmetric = transform_bitboard(bitboard, other)
+                self.assertEqual(canonical_bitboard(symmetric)[0], canonical)
+                self.assertEqual(canonical_key(symmetric, 2), canonical_key(bitboard, 2))
+
+    def test_moves_map_to_canonical(self):
+        for board in random_boards(100, seed=7):
+            bitboard = to_bitboard(board)
+            canonical, sym = canonical_bitboard(bitboard)
+            moves = bitboard_moves(bitboard, 2)
+            self.assertEqual(
+                {transform_move(m, sym) for m in moves}, set(bitboard_moves(canonical, 2))
+            )
+            self.assertEqual(
+                {transform_move(transform_move(m, sym), inverse_symmetry(sym)) for m in moves},
+                set(moves),
+            )
+
+
+def random_game(rng: random.Random, max_moves: int = 60):
+    position = Position()
+    for _ in range(0, max_moves):
+        moves = position.legal_moves()
+        if not moves:
+            break
+        position.make(rng.choice(moves))
+    return position
+
+
+class TestPosition(unittest.TestCase):
+    def assert_consistent(self, position: Position):
+        fresh = Position(position.bitboard, position.turn, position.tokens)
+        for attr in ("masks", "tokens", "occupied", "empty", "removable", "hash"):
+            self.assertEqual(getattr(position, attr), getattr(fresh, attr), attr)
+
+    def test_initial(self):
+        position = Position()
+        self.assertEqual(position.board(), generate_empty_board())
+        self.assertEqual(position.tokens, [15, 15])
+        self.assertEqual(position.player, 2)
+        self.assertEqual(set(position.legal_moves()), legal_move_set(generate_empty_board(), 1))
+
+    def test_make_matches_reference(self):
+        rng = random.Random(8)
+        for _ in range(0, 20):
+            position = Position()
+            for _ in range(0, 60):
+                moves = position.legal_moves()
+                self.assertEqual(
+                    as_set(m.to_dict() for m in moves),
+                    as_set(reference_legal_moves(position.board(), position.turn + 1))
+                    if position.tokens[position.player - 1] else [],
+                )
+                if not moves:
+                    break
+                position.make(rng.choice(moves))
+                self.assert_consistent(position)
+
+    def test_unmake_restores(self):
+        rng = random.Random(9)
+        for _ in range(0, 20):
+            position = random_game(rng, rng.randrange(0, 40))
+            before = position.copy()
+            moves = position.legal_moves()
+            for move in rng.sample(moves, min(10, len(moves))):
+                position.make(move)
+                self.assertEqual(position.unmake(), move)
+                for attr in ("masks", "tokens", "turn", "occupied", "empty", "removable", "hash"):
+                    self.assertEqual(getattr(position, attr), getattr(before, attr), attr)
+
+    def test_make_stepwise(self):
+        rng = random.Random(10)
+        position = random_game(rng, 30)
+        stepwise = position.copy()
+        move = rng.choice(position.legal_moves())
+        position.make(move)
+        steps = list(stepwise.make_stepwise(move))
+        expected = {"put": 1, "move": 2}.get(move.cat, 2 if move.take_sq == -1 else 3)
+        self.assertEqual(len(steps), expected)
+        self.assertEqual(stepwise.board(), position.board())
+        self.assertEqual(stepwise.hash, position.hash)
+
+    def test_tokens_from_board(self):
+        board = generate_empty_board()
+        board[0][0][0] = 1
+        board[0][0][1] = 2
+        board[0][1][1] = 2
+        self.assertEqual(Position.from_board(board).tokens, [14, 13])
+
+
+if __name__ == "__main__":
+    unittest.main()
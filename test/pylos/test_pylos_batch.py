@@ -0,0 +1,57 @@
+import unittest
+
+from common.pylos import Move, generate_empty_board, legal_move_set
+
+from .test_pylos import random_boards
+
+try:
+    import numpy as np
+    from common.pylos_batch import (
+        BATCH_MOVE_INDEX,
+        BATCH_MOVES,
+        batch_legal_moves,
+        boards_to_array,
+        moves_from_mask,
+    )
+except ImportError:
+    np = None
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestBatchLegalMoves(unittest.TestCase):
+    def test_move_space(self):
+        self.assertEqual(len(BATCH_MOVE_INDEX), len(BATCH_MOVES))
+        self.assertIn(Move("put", 29), BATCH_MOVE_INDEX)
+
+    def test_matches_scalar(self):
+        boards = random_boards(400, seed=11) + [generate_empty_board()]
+        turns = np.arange(len(boards))
+        mask, counts = batch_legal_moves(boards_to_array(boards), turns)
+        self.assertEqual(mask.shape, (len(boards), len(BATCH_MOVES)))
+        for board, turn, row, count in zip(boards, turns, mask, counts):
+            legal = legal_move_set(board, int(turn))
+            self.assertEqual(set(moves_from_mask(row)), legal)
+            self.assertEqual(count, len(legal))
+
+    def test_square_token_taken_first(self):
+        # taking the token that finished square back frees tokens below it for second take
+        board = [
+            [[1, 0, 1, 1], [2, 2, 1, 1], [1, 1, 2, 2], [1, 1, 2, 2]],
+            [[0, 0, 0], [1, 1, 2], [0, 1, 0]],
+            [[0, 0], [0, 0]],
+            [[0]],
+        ]
+        legal = legal_move_set(board, 84)
+        self.assertIn(Move("square", 22, 22, 12), legal)
+        mask, counts = batch_legal_moves(boards_to_array([board]), np.array([84]))
+        self.assertEqual(set(moves_from_mask(mask[0])), legal)
+        self.assertEqual(counts[0], len(legal))
+
+    def test_empty_batch(self):
+        mask, counts = batch_legal_moves(boards_to_array([]), np.zeros(0, dtype=int))
+        self.assertEqual(mask.shape, (0, len(BATCH_MOVES)))
+        self.assertEqual(counts.shape, (0,))
+
+
+if __name__ == "__main__":
+    unittest.main()
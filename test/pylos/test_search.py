@@ -0,0 +1,71 @@
+import random
+import unittest
+
+from common.match import random_bot, run_matches, score
+from common.pylos import LEVEL_OFFSETS, Move, Position
+from common.search import WIN_SCORE, Searcher, evaluate
+
+
+def minimax(position, depth, ply=1):
+    moves = position.legal_moves()
+    if not moves:
+        return ply - WIN_SCORE
+    if depth == 0:
+        return evaluate(position)
+    best = -WIN_SCORE
+    for move in moves:
+        position.make(move)
+        best = max(best, -minimax(position, depth - 1, ply + 1))
+        position.unmake()
+    return best
+
+
+def random_position(moves, seed):
+    rng = random.Random(seed)
+    position = Position()
+    for _ in range(0, moves):
+        position.make(rng.choice(position.legal_moves()))
+    return position
+
+
+class TestSearch(unittest.TestCase):
+    def test_minimax_score(self):
+        for seed in range(0, 4):
+            position = random_position(12, seed)
+            for depth in (1, 2):
+                result = Searcher(time_budget=60, max_depth=depth, tt_size=0).search(position)
+                self.assertEqual(result.depth, depth)
+                self.assertEqual(result.score, minimax(position, depth))
+                self.assertIn(result.move, position.legal_moves())
+
+    def test_finds_win(self):
+        # whole pyramid but top filled, 2nd player to move has last token
+        lower = (1 << LEVEL_OFFSETS[3]) - 1
+        first = sum(1 << i for i in range(0, 29, 2))
+        position = Position((first, lower & ~first), turn=0)
+        self.assertEqual(position.tokens, [0, 1])
+        result = Searcher(time_budget=60, max_depth=4).search(position)
+        self.assertEqual(result.move, Move("put", 29))
+        self.assertEqual(result.score, WIN_SCORE - 1)
+
+    def test_timeout_keeps_position(self):
+        position = random_position(6, 1)
+        hash_, masks, history = position.hash, list(position.masks), position.history
+        result = Searcher(time_budget=0.05).search(position)
+        self.assertEqual((position.hash, position.masks, position.history), (hash_, masks, history))
+        self.assertIn(result.move, position.legal_moves())
+        self.assertGreater(result.nodes, 0)
+        self.assertGreater(result.nps, 0)
+
+    def test_restricted_legal(self):
+        position = Position()
+        legal = position.legal_moves()[5:7]
+        self.assertIn(Searcher(time_budget=60, max_depth=2)(position, legal), legal)
+
+    def test_beats_random(self):
+        wins = score(run_matches(Searcher(time_budget=60, max_depth=2), random_bot, 4, processes=0))
+        self.assertEqual(wins, [4, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
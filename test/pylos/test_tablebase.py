@@ -0,0 +1,107 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from common.match import random_bot
+from common.pylos import SYMMETRIES, Position, transform_bitboard
+from common.tablebase import (
+    Result,
+    Tablebase,
+    TablebaseBot,
+    TablebaseBuilder,
+    book_positions,
+    build,
+    endgame_positions,
+    open_tablebase,
+)
+
+
+def first_move_bot(position, legal):
+    return legal[0]
+
+
+class TestTablebase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.dir.name, "test.pytb")
+        cls.builder = build(book_plies=2, endgame_games=5, book_depth=2, endgame_depth=8, endgame_time=1.0)
+        cls.builder.write(cls.path)
+        cls.tablebase = Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.dir.cleanup()
+
+    def test_book_positions(self):
+        self.assertEqual([len(book_positions(plies)) for plies in range(0, 3)], [1, 4, 37])
+
+    def test_symmetric_lookup(self):
+        self.assertEqual(len(self.tablebase), len(self.builder))
+        for position in book_positions(2):
+            entry = self.tablebase.probe(position)
+            self.assertIn(entry.move, position.legal_moves())
+            position.make(entry.move)
+            after = position.canonical_key
+            position.unmake()
+            for sym in range(0, SYMMETRIES):
+                symmetric = Position(transform_bitboard(position.bitboard, sym), position.turn)
+                symmetric_entry = self.tablebase.probe(symmetric)
+                self.assertEqual(symmetric_entry._replace(move=None), entry._replace(move=None))
+                # symmetric position may have more equally good moves, they lead to the same position
+                self.assertIn(symmetric_entry.move, symmetric.legal_moves())
+                symmetric.make(symmetric_entry.move)
+                self.assertEqual(symmetric.canonical_key, after)
+                if sym == 0:
+                    self.assertEqual(symmetric_entry.move, entry.move)
+
+    def test_solved_endgames(self):
+        solved = 0
+        for position in endgame_positions(5):
+            entry = self.tablebase.probe(position)
+            if entry is None:
+                continue
+            solved += 1
+            self.assertIn(entry.result, (Result.win, Result.loss))
+            self.assertIn(entry.move, position.legal_moves())
+            position.make(entry.move)
+            reply = self.tablebase.probe(position)
+            if not position.legal_moves():
+                self.assertEqual((entry.result, entry.plies), (Result.win, 1))
+            elif reply is not None:
+                self.assertNotEqual(reply.result, entry.result)
+                self.assertEqual(reply.plies, entry.plies - 1)
+        self.assertGreater(solved, 0)
+
+    def test_missing(self):
+        position = Position()
+        for _ in range(0, 4):
+            position.make(position.legal_moves()[0])
+        self.assertIsNone(self.tablebase.probe(position))
+        with open(self.path + ".empty", "wb") as f:
+            f.write(TablebaseBuilder().pack())
+        self.assertIsNone(Tablebase(self.path + ".empty").probe(Position()))
+
+    def test_not_tablebase(self):
+        broken = os.path.join(self.dir.name, "broken.pytb")
+        with open(broken, "wb") as f:
+            f.write(b"PYLS\x02" + bytes(40))
+        self.assertRaises(ValueError, Tablebase, broken)
+        self.assertIsNone(open_tablebase(broken))
+        self.assertIsNone(open_tablebase(os.path.join(self.dir.name, "missing.pytb")))
+
+    def test_bot(self):
+        bot = pickle.loads(pickle.dumps(TablebaseBot(self.tablebase, first_move_bot)))
+        position = Position()
+        legal = position.legal_moves()
+        self.assertEqual(bot(position, legal), self.tablebase.probe(position).move)
+        for _ in range(0, 4):
+            position.make(random_bot(position, position.legal_moves()))
+        legal = position.legal_moves()
+        self.assertEqual(bot(position, legal), legal[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
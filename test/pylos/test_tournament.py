@@ -0,0 +1,70 @@
+import unittest
+from itertools import combinations
+
+from common.tournament import (
+    Standings,
+    elo_change,
+    expected_score,
+    gauntlet,
+    round_robin,
+    swiss_pairings,
+    swiss_rounds,
+)
+
+
+class TestPairings(unittest.TestCase):
+    def assertRoundsValid(self, rounds):
+        for pairings in rounds:
+            players = [p for pairing in pairings for p in pairing]
+            self.assertEqual(len(players), len(set(players)))
+
+    def test_round_robin(self):
+        for n in range(2, 10):
+            players = list(range(1, n + 1))
+            rounds = round_robin(players, cycles=2)
+            self.assertRoundsValid(rounds)
+            games = sorted(tuple(sorted(p)) for pairings in rounds for p in pairings)
+            self.assertEqual(games, sorted(2 * list(combinations(players, 2))))
+
+    def test_gauntlet(self):
+        rounds = gauntlet([5, 1, 2, 3])
+        self.assertEqual(rounds, [[(5, 1), (5, 2), (5, 3)]])
+
+    def test_swiss(self):
+        players = list(range(1, 8))
+        standings = Standings(players)
+        for _ in range(0, swiss_rounds(len(players))):
+            pairings, bye = swiss_pairings(standings)
+            self.assertRoundsValid([pairings + [(bye,)]])
+            self.assertEqual(len(pairings), 3)
+            self.assertNotIn(bye, standings.byes)
+            for player1, player2 in pairings:
+                self.assertNotIn(frozenset((player1, player2)), standings.played())
+                standings.add(player1, player2, min(player1, player2))
+            standings.add_bye(bye)
+        self.assertEqual(standings.ranking()[0], 1)
+        self.assertEqual(standings.points[1], 3)
+
+    def test_standings(self):
+        standings = Standings([1, 2, 3])
+        standings.add(1, 2, 2)
+        standings.add(2, 3, None)
+        standings.add(3, 1, 3)
+        self.assertEqual(standings.points, {1: 0, 2: 1, 3: 1})
+        self.assertEqual(standings.loses, {1: 2, 2: 0, 3: 0})
+        self.assertEqual(standings.buchholz(3), 1)
+        self.assertEqual(standings.ranking(), [2, 3, 1])
+
+
+class TestElo(unittest.TestCase):
+    def test_expected(self):
+        self.assertAlmostEqual(expected_score(1500, 1500), 0.5)
+        self.assertAlmostEqual(expected_score(1900, 1500), 10 / 11)
+
+    def test_change(self):
+        self.assertAlmostEqual(elo_change(1500, 1500), 16)
+        self.assertLess(elo_change(1900, 1500), elo_change(1500, 1900))
+
+
+if __name__ == "__main__":
+    unittest.main()
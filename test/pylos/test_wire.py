@@ -0,0 +1,173 @@
+import json
+import random
+import unittest
+from datetime import datetime, timezone
+from typing import Iterator
+
+from common.messages import (
+    BadMsgResp,
+    GameOverMsg,
+    GameStateDeltaMsg,
+    GameStateMsg,
+    MoveMsg,
+    ResyncMsg,
+    YourMoveMsg,
+)
+from common.pylos import BitBoard, Move, Position, bitboard_moves, from_bitboard
+from common.wire import (
+    EXPORT_MAGIC,
+    Encoding,
+    WireError,
+    decode,
+    decode_msg,
+    encode,
+    encode_msg,
+    iter_games,
+    pack_game,
+    pack_moves,
+    unpack_moves,
+)
+
+
+def game_positions(seed: int) -> Iterator[Position]:
+    rng = random.Random(seed)
+    position = Position()
+    while True:
+        yield position
+        moves = position.legal_moves()
+        if not moves:
+            return
+        position = position.copy()
+        position.make(rng.choice(moves))
+
+
+def state_msg(cls, position: Position) -> GameStateMsg:
+    return cls(
+        {
+            "seq": 7,
+            "turn": position.turn,
+            "players_ids": [3, 1000000],
+            "players_names": ["alice", "żółw"],
+            "tokens": list(position.tokens),
+            "board": position.board(),
+            "legal": [m.to_dict() for m in sorted(position.legal_moves())],
+            "clocks": [29500, None],
+        }
+    )
+
+
+class TestWire(unittest.TestCase):
+    def assertRoundTrip(self, msg):
+        data = encode(msg)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(decode(data).to_dict(), json.loads(json.dumps(msg.to_dict())))
+        self.assertEqual(decode_msg(encode_msg(msg, Encoding.json), Encoding.json).to_dict(), msg.to_dict())
+
+    def test_move_int(self):
+        for position in game_positions(3):
+            for move in position.legal_moves():
+                self.assertEqual(Move.from_int(move.to_int()), move)
+                self.assertLess(move.to_int(), 1 << 16)
+
+    def test_move_int_invalid(self):
+        for value in (-1, 1 << 16, 31):
+            with self.assertRaises(ValueError):
+                Move.from_int(value)
+
+    def test_move_log(self):
+        *_, position = game_positions(7)
+        data = pack_moves(position.history)
+        self.assertEqual(len(data), 2 * len(position.history))
+        self.assertEqual(unpack_moves(data), list(position.history))
+        self.assertEqual(unpack_moves(b""), [])
+        for data in (b"\x01", b"\x1f\x00"):
+            with self.assertRaises(WireError):
+                unpack_moves(data)
+
+    def test_games_export(self):
+        *_, position = game_positions(11)
+        when = datetime(2022, 3, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+        games = [
+            {
+                "id": i + 1,
+                "name": f"gra {i} ż",
+                "player1_id": 4,
+                "player2_id": 9,
+                "winner_id": None if i else 9,
+                "winner_tokens": 2,
+                "started_at": when,
+                "finished_at": when,
+                "moves_count": len(position.history),
+                "moves": pack_moves(position.history),
+            }
+            for i in range(0, 3)
+        ]
+        data = EXPORT_MAGIC + b"".join(pack_game(game) for game in games)
+        expected = [{**game, "moves": list(position.history)} for game in games]
+        self.assertEqual(list(iter_games(data)), expected)
+        self.assertEqual(list(iter_games(EXPORT_MAGIC)), [])
+        for bad in (b"", data[1:], data[:-1], data[:len(EXPORT_MAGIC) + 3]):
+            with self.assertRaises(WireError):
+                list(iter_games(bad))
+
+    def test_messages(self):
+        for position in game_positions(5):
+            self.assertRoundTrip(state_msg(GameStateMsg, position))
+            self.assertRoundTrip(state_msg(YourMoveMsg, position))
+            for move in position.legal_moves()[:5]:
+                self.assertRoundTrip(MoveMsg(move.to_dict()))
+        self.assertRoundTrip(ResyncMsg({}))
+        self.assertRoundTrip(BadMsgResp({"detail": "illegal move"}))
+        self.assertRoundTrip(GameOverMsg({"winner_id": 12, "winner_name": "bob", "winner_tokens": 3}))
+        for move in (None, Move("square", 0, 1, 2).to_dict()):
+            self.assertRoundTrip(
+                GameStateDeltaMsg(
+                    {
+                        "seq": 9,
+                        "turn": 4,
+                        "changed": [[0, 1, 2, 2], [3, 0, 0, 0]],
+                        "tokens": [-1, 2],
+                        "move": move,
+                    }
+                )
+            )
+
+    def test_state_size(self):
+        position = Position()
+        data = encode(state_msg(GameStateMsg, position))
+        self.assertLess(len(data) * 10, len(encode_msg(state_msg(GameStateMsg, position), Encoding.json)))
+
+    def test_state_with_moves(self):
+        # server puts Move objects in state messages, they encode the same as dicts
+        for position in game_positions(5):
+            for cls in (GameStateMsg, YourMoveMsg):
+                msg = state_msg(cls, position)
+                with_moves = cls({**msg.to_dict(), "legal": sorted(position.legal_moves())})
+                self.assertEqual(encode(with_moves), encode(msg))
+                self.assertEqual(encode_msg(with_moves, Encoding.json), encode_msg(msg, Encoding.json))
+                self.assertRoundTrip(with_moves)
+
+    def test_malformed(self):
+        with self.assertRaises(TypeError):
+            decode(b"")
+        with self.assertRaises(TypeError):
+            decode(b"\xff")
+        data = encode(state_msg(GameStateMsg, Position()))
+        for cut in (1, 5, len(data) - 1):
+            with self.assertRaises(WireError):
+                decode(data[:cut])
+        with self.assertRaises(WireError):
+            decode(bytes([1]) + (31).to_bytes(2, "little"))
+        with self.assertRaises(ValueError):
+            decode_msg("{", Encoding.json)
+
+    def test_board(self):
+        bitboard: BitBoard = (0b101, 0b1010)
+        position = Position(bitboard)
+        decoded = decode(encode(state_msg(GameStateMsg, position)))
+        self.assertEqual(decoded.board, from_bitboard(bitboard))
+        self.assertEqual(len(bitboard_moves(bitboard, 1)), len(position.legal_moves()))
+
+
+if __name__ == "__main__":
+    unittest.main()
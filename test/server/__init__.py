@@ -0,0 +1,8 @@
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+sys.path.insert(0, SRC)
+# this package is imported as "server" too (test directory is top level of discovery),
+# so server modules are looked up in src/server as well
+__path__.append(os.path.join(SRC, "server"))
@@ -0,0 +1,55 @@
+import json
+import random
+
+from common.messages import MoveMsg
+from common.wire import Encoding, decode_msg
+from server.database.user_stats import user_cache
+
+
+class FakeWebSocket:
+    """
+    Records what server sends, json frames are decoded to dicts, binary frames to messages
+    """
+    def __init__(self) -> None:
+        self.sent = []
+        self.accepted = False
+        self.closed = False
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, data: str):
+        self.sent.append(json.loads(data))
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(decode_msg(data, Encoding.binary).to_dict())
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+    def types(self):
+        return [msg["type"] for msg in self.sent]
+
+
+async def start_game(manager, name, players=(1, 2), **kwargs):
+    """
+    new game of **manager** joined by **players**, returns session and players websockets
+    """
+    for player_id in players:
+        user_cache.put(player_id, f"player {player_id}")
+    state = await manager.new_game(name, **kwargs)
+    websockets = [FakeWebSocket() for _ in players]
+    for websocket, player_id in zip(websockets, players):
+        await manager.connect(websocket, state.game_id, player_id)
+    return manager.games[state.game_id], websockets
+
+
+async def play(session, websockets, moves, seed=0):
+    """
+    make **moves** random legal moves through session's message handling
+    """
+    rng = random.Random(seed)
+    for _ in range(0, moves):
+        slot = (session._position.turn + 1) % 2
+        move = rng.choice(sorted(session._next_legal))
+        await session.handle_msg(websockets[slot], session._players_ids[slot], MoveMsg.from_move(move))
@@ -0,0 +1,102 @@
+import unittest
+from time import monotonic
+
+from server.database.active_game_sessions import GameSessionsManager, NameIndex
+from server.database.game_session import GameStatus
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex()
+        for game_id, name in enumerate(["alpha", "alpine", "beta", "al"]):
+            self.index.add(game_id, name)
+
+    def test_candidates(self):
+        self.assertEqual(self.index.candidates("alp"), {0, 1})
+        self.assertEqual(self.index.candidates("lpha"), {0})
+        self.assertEqual(self.index.candidates("al"), {0, 1, 3})
+        self.assertEqual(self.index.candidates("a"), {0, 1, 2, 3})
+        self.assertEqual(self.index.candidates("gamma"), set())
+
+    def test_candidates_are_superset(self):
+        # every gram of query matches, but not in this order
+        self.index.add(4, "phalph")
+        self.assertIn(4, self.index.candidates("alpha"))
+
+    def test_remove(self):
+        self.index.remove(0, "alpha")
+        self.assertEqual(self.index.candidates("alp"), {1})
+        self.assertEqual(self.index.candidates("pha"), set())
+
+
+class TestEviction(unittest.IsolatedAsyncioTestCase):
+    async def test_finished_game_is_evicted(self):
+        manager = GameSessionsManager(retention=10)
+        finished = await manager.new_game("finished")
+        running = await manager.new_game("running")
+        await manager.games[finished.game_id].abandon()
+
+        manager.evict_finished(monotonic() + 5)
+        self.assertEqual([g.id for g in manager.search_games("finished")], [finished.game_id])
+
+        manager.evict_finished(monotonic() + 11)
+        self.assertEqual(list(manager.games), [running.game_id])
+        self.assertEqual(manager.search_games("finished"), [])
+        self.assertRaises(IndexError, manager.get_game, finished.game_id)
+        # name is free again
+        await manager.new_game("finished")
+
+    async def test_duplicate_name(self):
+        manager = GameSessionsManager()
+        await manager.new_game("game")
+        with self.assertRaises(NameError):
+            await manager.new_game("game")
+
+
+class TestPages(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.manager = GameSessionsManager()
+        for i in range(0, 6):
+            await self.manager.new_game(f"game {i}" if i % 2 else f"match {i}")
+
+    async def pages(self, limit, **kwargs):
+        ids, cursor = [], -1
+        while True:
+            page, cursor = await self.manager.list_page(cursor, limit, **kwargs)
+            ids.append([state.game_id for state in page])
+            if cursor is None:
+                return ids
+
+    async def test_pages(self):
+        self.assertEqual(await self.pages(4), [[0, 1, 2, 3], [4, 5]])
+        # no empty page after page that ends exactly at last game
+        self.assertEqual(await self.pages(3), [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(await self.pages(10), [[0, 1, 2, 3, 4, 5]])
+
+    async def test_cursor_edges(self):
+        self.assertEqual(await self.manager.list_page(5, 10), ([], None))
+        self.assertEqual(await self.manager.list_page(100, 10), ([], None))
+        # cursor of game that was evicted meanwhile
+        await self.manager.games[2].abandon()
+        self.manager.evict_finished(monotonic() + self.manager.retention + 1)
+        page, cursor = await self.manager.list_page(2, 2)
+        self.assertEqual(([s.game_id for s in page], cursor), ([3, 4], 4))
+
+    async def test_listing_follows_state_changes(self):
+        await self.pages(10)
+        await self.manager.games[1].abandon()
+        await self.manager.new_game("game 6")
+        self.assertEqual(await self.pages(2, status=GameStatus.open), [[0, 2], [3, 4], [5, 6]])
+        self.assertEqual(await self.pages(10, status=GameStatus.finished), [[1]])
+
+    async def test_search_pages(self):
+        page, cursor = await self.manager.search_page("game", -1, 2)
+        self.assertEqual(([s.game_id for s in page], cursor), ([1, 3], 3))
+        page, cursor = await self.manager.search_page("game", cursor, 2)
+        self.assertEqual(([s.game_id for s in page], cursor), ([5], None))
+        page, _ = await self.manager.search_page("", -1, 10, GameStatus.open)
+        self.assertEqual(len(page), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
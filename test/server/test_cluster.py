@@ -0,0 +1,129 @@
+import unittest
+from asyncio import Event, wait_for
+from unittest.mock import patch
+
+from common.ws_client import ConnectionClosed, WebSocketClient
+from server.cluster import Cluster, proxy_websocket
+
+URLS = ["ws://127.0.0.1:8001", "ws://127.0.0.1:8002", "ws://127.0.0.1:8003"]
+
+
+class Upstream:
+    """
+    Connection to owner worker delivering **frames**, then closed by it, or silent if **hang**
+    """
+    def __init__(self, frames=(), hang=False) -> None:
+        self.frames = list(frames)
+        self.hang = hang
+        self.sent = []
+        self.closed = False
+
+    async def send(self, frame):
+        self.sent.append(frame)
+
+    async def receive(self):
+        if self.frames:
+            return self.frames.pop(0)
+        if self.hang:
+            await Event().wait()
+        raise ConnectionClosed
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class Downstream:
+    """
+    Client connection sending **messages** (ASGI receive events), then silent
+    """
+    def __init__(self, messages=()) -> None:
+        self.messages = list(messages)
+        self.sent = []
+        self.accepted = False
+        self.closed = False
+
+    async def accept(self):
+        self.accepted = True
+
+    async def receive(self):
+        if self.messages:
+            return self.messages.pop(0)
+        await Event().wait()
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+class TestCluster(unittest.TestCase):
+    def test_owner(self):
+        cluster = Cluster(1, 3, URLS)
+        self.assertTrue(cluster.sharded)
+        self.assertEqual([cluster.owner(game_id) for game_id in range(0, 6)], [0, 1, 2, 0, 1, 2])
+        self.assertTrue(cluster.is_local(4))
+        self.assertFalse(cluster.is_local(5))
+        self.assertEqual(cluster.url(5), URLS[2])
+        self.assertFalse(Cluster().sharded)
+        self.assertTrue(Cluster().is_local(7))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Cluster(0, 3, URLS[:2])
+        with self.assertRaises(ValueError):
+            Cluster(3, 3, URLS)
+
+    def test_from_env(self):
+        env = {"PYLON_WORKERS": "3", "PYLON_WORKER": "2", "PYLON_WORKER_URLS": " , ".join(URLS)}
+        with patch.dict("os.environ", env):
+            cluster = Cluster.from_env()
+        self.assertEqual((cluster.index, cluster.workers, cluster.urls), (2, 3, URLS))
+        with patch.dict("os.environ", {}, clear=True):
+            cluster = Cluster.from_env()
+        self.assertEqual((cluster.index, cluster.workers), (0, 1))
+
+
+class TestProxy(unittest.IsolatedAsyncioTestCase):
+    async def proxy(self, downstream, upstream):
+        async def connect(url):
+            self.url = url
+            if isinstance(upstream, Exception):
+                raise upstream
+            return upstream
+
+        with patch.object(WebSocketClient, "connect", connect):
+            await wait_for(proxy_websocket(downstream, URLS[0] + "/game/connect?game_id=1"), 1)
+        self.assertEqual(self.url, URLS[0] + "/game/connect?game_id=1")
+
+    async def test_owner_unreachable(self):
+        downstream = Downstream()
+        await self.proxy(downstream, OSError("refused"))
+        self.assertFalse(downstream.accepted)
+        self.assertTrue(downstream.closed)
+
+    async def test_upstream_closes(self):
+        downstream, upstream = Downstream(), Upstream(['{"type": "GameStateMsg"}', b"\x01\x02"])
+        await self.proxy(downstream, upstream)
+        self.assertTrue(downstream.accepted)
+        self.assertEqual(downstream.sent, ['{"type": "GameStateMsg"}', b"\x01\x02"])
+        self.assertTrue(downstream.closed)
+        self.assertTrue(upstream.closed)
+
+    async def test_client_disconnects(self):
+        messages = [
+            {"type": "websocket.receive", "text": '{"type": "ResyncMsg"}'},
+            {"type": "websocket.receive", "bytes": b"\x05"},
+            {"type": "websocket.disconnect", "code": 1000},
+        ]
+        downstream, upstream = Downstream(messages), Upstream(hang=True)
+        await self.proxy(downstream, upstream)
+        self.assertEqual(upstream.sent, ['{"type": "ResyncMsg"}', b"\x05"])
+        self.assertTrue(upstream.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import time
+import unittest
+from asyncio import Event, sleep, wait_for
+from unittest.mock import patch
+
+from common.messages import GameOverMsg, GameStateMsg
+from common.pylos import Position
+from server.database.fanout import Fanout, Overflow
+
+from .fake_websocket import FakeWebSocket
+
+GAME_OVER = GameOverMsg({"winner_id": 1, "winner_name": "player 1", "winner_tokens": 3})
+
+
+def state(seq):
+    position = Position()
+    return GameStateMsg(
+        {
+            "seq": seq,
+            "turn": position.turn,
+            "players_ids": [1, 2],
+            "players_names": ["player 1", "player 2"],
+            "tokens": list(position.tokens),
+            "board": position.board(),
+            "legal": [],
+        }
+    )
+
+
+class GatedWebSocket(FakeWebSocket):
+    """
+    Sends wait until **gate** is set, never complete if it isn't
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.gate = Event()
+
+    async def send_text(self, data: str):
+        await self.gate.wait()
+        await super().send_text(data)
+
+
+async def until(condition, timeout=1):
+    """
+    wait for spectator tasks until **condition** holds, at most **timeout** seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await sleep(0.005)
+
+
+class TestFanout(unittest.IsolatedAsyncioTestCase):
+    def spectator(self, fanout):
+        """
+        spectator stuck in sending first message it gets
+        """
+        websocket = GatedWebSocket()
+        fanout.add_spectator(websocket)
+        self.addCleanup(fanout.remove, websocket)
+        return websocket
+
+    async def publish(self, fanout, *msgs):
+        for msg in msgs:
+            fanout.publish(msg)
+            await sleep(0)
+
+    def received(self, websocket):
+        return [msg.get("seq", msg["type"]) for msg in websocket.sent]
+
+    async def test_drop_oldest(self):
+        fanout = Fanout(queue_size=3)
+        websocket = self.spectator(fanout)
+        await self.publish(fanout, *map(state, range(0, 5)), GAME_OVER)
+        self.assertEqual(fanout._spectators[websocket].dropped, 2)
+        websocket.gate.set()
+        await until(lambda: len(websocket.sent) == 4)
+        self.assertEqual(self.received(websocket), [0, 3, 4, "GameOverMsg"])
+
+    async def test_coalesce(self):
+        fanout = Fanout(queue_size=3, overflow=Overflow.coalesce)
+        websocket = self.spectator(fanout)
+        await self.publish(fanout, state(0), state(1), GAME_OVER, state(2), state(3))
+        # other messages than game states are never coalesced
+        self.assertEqual(fanout._spectators[websocket].dropped, 2)
+        websocket.gate.set()
+        await until(lambda: len(websocket.sent) == 3)
+        self.assertEqual(self.received(websocket), [0, "GameOverMsg", 3])
+
+    @patch("server.database.fanout.SEND_TIMEOUT", 0.05)
+    async def test_evicted(self):
+        fanout = Fanout()
+        spectator, player = GatedWebSocket(), GatedWebSocket()
+        fanout.add_spectator(spectator)
+        await fanout.broadcast([player], state(0))
+        self.assertTrue(player.closed)
+        await until(lambda: spectator.closed)
+        self.assertTrue(spectator.closed)
+        self.assertEqual(list(fanout.spectators), [])
+        # evicted spectator gets nothing more
+        fanout.publish(state(1))
+        spectator.gate.set()
+        await sleep(0.01)
+        self.assertEqual(spectator.sent, [])
+
+    async def test_close_after_drain(self):
+        fanout = Fanout()
+        websocket = self.spectator(fanout)
+        await self.publish(fanout, state(0), state(1), GAME_OVER)
+        fanout.close_spectators()
+        await sleep(0.01)
+        self.assertFalse(websocket.closed)
+        websocket.gate.set()
+        await until(lambda: websocket.closed)
+        self.assertEqual(self.received(websocket), [0, 1, "GameOverMsg"])
+        self.assertTrue(websocket.closed)
+
+    async def test_players_not_blocked(self):
+        fanout = Fanout()
+        spectators = [self.spectator(fanout) for _ in range(0, 2)]
+        player = FakeWebSocket()
+        for seq in range(0, 100):
+            await wait_for(fanout.broadcast([player], state(seq)), 0.1)
+        self.assertEqual(self.received(player), list(range(0, 100)))
+        self.assertTrue(all(websocket.sent == [] for websocket in spectators))
+        self.assertEqual(list(fanout.spectators), spectators)
+
+    async def test_removed(self):
+        fanout = Fanout()
+        websocket = self.spectator(fanout)
+        await self.publish(fanout, state(0), state(1))
+        feed = fanout._spectators[websocket]
+        fanout.remove(websocket)
+        websocket.gate.set()
+        await until(feed._task.done)
+        self.assertTrue(feed._task.done())
+        self.assertEqual(websocket.sent, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tortoise import Tortoise
+
+from common.pylos import Position
+from common.wire import EXPORT_MAGIC, iter_games, pack_moves
+from server.database.game_export import (
+    EXPORT_CHUNK,
+    ExportFormat,
+    export_games,
+    iter_game_chunks,
+    replay_lines,
+)
+from server.database.models.game import Games, games_query
+from server.database.models.user import Users
+
+MODELS = ["server.database.models.user", "server.database.models.game"]
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def first_moves(count):
+    """
+    first **count** moves of game where the first legal move is always made
+    """
+    position, moves = Position(), []
+    for _ in range(0, count):
+        moves.append(sorted(position.legal_moves())[0])
+        position.make(moves[-1])
+    return moves
+
+
+async def collect(parts):
+    return [part async for part in parts]
+
+
+class TestGameExport(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        self.first = await Users.create(username="first")
+        self.second = await Users.create(username="second")
+        self.moves = first_moves(6)
+
+    async def asyncTearDown(self):
+        await Tortoise.close_connections()
+
+    async def create(self, count):
+        await Games.bulk_create(
+            [
+                Games(
+                    name=f"game {i}",
+                    player1=self.first,
+                    player2=self.second,
+                    winner=self.first,
+                    winner_tokens=i % 15,
+                    started_at=START,
+                    finished_at=START + timedelta(seconds=i),
+                    moves_count=len(self.moves),
+                    moves=pack_moves(self.moves),
+                )
+                for i in range(0, count)
+            ]
+        )
+
+    async def test_replay_lines(self):
+        await self.create(1)
+        game = (await Games.all().values())[0]
+        lines = [json.loads(line) for line in await collect(replay_lines(game))]
+        self.assertEqual(len(lines), len(self.moves) + 2)
+        self.assertEqual(lines[0]["name"], "game 0")
+        self.assertEqual(lines[0]["started_at"], START.isoformat())
+        self.assertNotIn("moves", lines[0])
+        position = Position()
+        self.assertEqual(lines[1], {"turn": 0, "move": None, "board": position.board(), "tokens": [15, 15]})
+        for move, line in zip(self.moves, lines[2:]):
+            position.make(move)
+            self.assertEqual(line["move"], move.to_dict())
+            self.assertEqual((line["turn"], line["board"]), (position.turn, position.board()))
+            self.assertEqual(line["tokens"], list(position.tokens))
+
+    async def test_chunks(self):
+        await self.create(5)
+        for chunk, sizes in ((2, [2, 2, 1]), (5, [5]), (10, [5])):
+            with self.subTest(chunk=chunk):
+                chunks = await collect(iter_game_chunks(Games.all(), chunk))
+                self.assertEqual([len(games) for games in chunks], sizes)
+                ids = [game["id"] for games in chunks for game in games]
+                self.assertEqual(ids, sorted(ids))
+                self.assertEqual(len(set(ids)), 5)
+        self.assertEqual(await collect(iter_game_chunks(games_query(player_id=99))), [])
+
+    async def test_export_across_chunks(self):
+        count = EXPORT_CHUNK * 2 + 1
+        await self.create(count)
+        parts = await collect(export_games(games_query(self.first.id), ExportFormat.ndjson))
+        self.assertEqual(len(parts), 3)
+        games = [json.loads(line) for part in parts for line in part.splitlines()]
+        self.assertEqual([game["id"] for game in games], list(range(1, count + 1)))
+        self.assertEqual(games[-1]["moves"], [m.to_dict() for m in self.moves])
+        self.assertEqual(games[-1]["finished_at"], (START + timedelta(seconds=count - 1)).isoformat())
+
+        parts = await collect(export_games(games_query(self.second.id), ExportFormat.binary))
+        self.assertEqual((len(parts), parts[0]), (4, EXPORT_MAGIC))
+        exported = list(iter_games(b"".join(parts)))
+        self.assertEqual([game["id"] for game in exported], list(range(1, count + 1)))
+        self.assertEqual(exported[EXPORT_CHUNK]["name"], f"game {EXPORT_CHUNK}")
+        self.assertEqual(exported[EXPORT_CHUNK]["moves"], self.moves)
+        self.assertEqual(exported[EXPORT_CHUNK]["winner_id"], self.first.id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from tortoise import Tortoise
+
+from server.database.models.game import GAME_RECORD_FIELDS, Games, games_query
+from server.database.models.user import Users
+
+MODELS = ["server.database.models.user", "server.database.models.game"]
+
+
+class TestGameRecords(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        first = await Users.create(username="first")
+        second = await Users.create(username="second")
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        # 3 games finished at the same time, then 3 games a minute apart each
+        self.times = [start] * 3 + [start + timedelta(minutes=i) for i in range(1, 4)]
+        for i, finished_at in enumerate(self.times):
+            await Games.create(
+                name=f"game {i}",
+                player1=first,
+                player2=second,
+                winner=first,
+                started_at=start,
+                finished_at=finished_at,
+                moves_count=0,
+                moves=b"",
+            )
+
+    async def asyncTearDown(self):
+        await Tortoise.close_connections()
+
+    async def test_pages_by_cursor(self):
+        seen, until, until_id = [], None, None
+        while True:
+            page = await games_query(until=until, until_id=until_id).limit(2).values(*GAME_RECORD_FIELDS)
+            if not page:
+                break
+            seen += [game["id"] for game in page]
+            until, until_id = page[-1]["finished_at"], page[-1]["id"]
+        # newest first, games finished at the same time by id
+        self.assertEqual(seen, [6, 5, 4, 3, 2, 1])
+
+    async def test_until_without_id(self):
+        games = await games_query(until=self.times[0] + timedelta(minutes=2)).values_list("id", flat=True)
+        self.assertEqual(games, [4, 3, 2, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+import time
+import unittest
+from asyncio import sleep
+from unittest.mock import patch
+
+from tortoise import Tortoise
+
+from server.database.active_game_sessions import GameSessionsManager
+from common.messages import MoveMsg
+from server.database.game_session import GameStatus, Pacing, TimeControl
+from server.database.move_pool import move_positions
+from server.database.user_stats import user_cache
+
+from .fake_websocket import FakeWebSocket, play, start_game
+
+MODELS = ["server.database.models.user", "server.database.models.game"]
+GRACE = 0.2
+FRAME_DELAY = 0.05
+
+
+class TimedWebSocket(FakeWebSocket):
+    """
+    Records also when every message is sent
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.sent_at = []
+
+    async def send_text(self, data: str):
+        self.sent_at.append(time.monotonic())
+        await super().send_text(data)
+
+
+class TestReconnect(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # finished games are recorded
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        grace = patch("server.database.game_session.RECONNECT_GRACE", GRACE)
+        grace.start()
+        self.addCleanup(grace.stop)
+        self.manager = GameSessionsManager()
+        self.game, self.websockets = await start_game(self.manager, "reconnect", pacing=Pacing.turbo)
+        await play(self.game, self.websockets, 3)
+        # player on move and their opponent
+        self.slot = (self.game._position.turn + 1) % 2
+        self.player_id = self.game._players_ids[self.slot]
+        self.opponent = self.websockets[1 - self.slot]
+
+    async def asyncTearDown(self):
+        for game in self.manager.games.values():
+            await game.abandon()
+        await Tortoise.close_connections()
+
+    async def leave(self, websocket, player_id):
+        await self.manager.disconnect(websocket, self.game.id, player_id)
+
+    async def test_seat_is_kept(self):
+        await self.leave(self.websockets[self.slot], self.player_id)
+        self.assertEqual(self.game.status, GameStatus.in_progress)
+        # nobody else takes the empty seat
+        stranger = FakeWebSocket()
+        await self.manager.connect(stranger, self.game.id, 3)
+        self.assertEqual(self.game._players_ids, [1, 2])
+        self.assertNotIn("YourMoveMsg", stranger.types())
+
+        websocket = FakeWebSocket()
+        await self.manager.connect(websocket, self.game.id, self.player_id)
+        self.assertEqual(websocket.types(), ["GameStateMsg", "YourMoveMsg"])
+        self.assertEqual(websocket.sent[0]["seq"], self.game._seq)
+        # reconnected player isn't forfeited once the window is over and plays on
+        await sleep(GRACE * 1.5)
+        self.assertFalse(self.game.is_finished)
+        self.websockets[self.slot] = websocket
+        await play(self.game, self.websockets, 2)
+        self.assertEqual(len(self.game._position.history), 5)
+
+    async def test_forfeit(self):
+        await self.leave(self.websockets[self.slot], self.player_id)
+        await sleep(GRACE * 1.5)
+        self.assertTrue(self.game.is_finished)
+        self.assertEqual(self.game.winner_id, self.game._players_ids[1 - self.slot])
+        self.assertEqual(self.opponent.sent[-1]["type"], "GameOverMsg")
+        self.assertEqual(self.opponent.sent[-1]["winner_id"], self.game.winner_id)
+        self.assertTrue(self.opponent.closed)
+
+    async def test_grace_is_spent_over_game(self):
+        for _ in range(0, 2):
+            await self.leave(self.websockets[self.slot], self.player_id)
+            await sleep(GRACE * 0.45)
+            self.assertFalse(self.game.is_finished)
+            self.websockets[self.slot] = FakeWebSocket()
+            await self.manager.connect(self.websockets[self.slot], self.game.id, self.player_id)
+        self.assertLess(self.game._grace[self.slot], GRACE * 0.2)
+        self.assertEqual(self.game._grace[1 - self.slot], GRACE)
+        # third absence is shorter than the first, but only what is left of grace counts
+        await self.leave(self.websockets[self.slot], self.player_id)
+        await sleep(GRACE * 0.3)
+        self.assertEqual(self.game.winner_id, self.game._players_ids[1 - self.slot])
+
+    async def test_abandoned(self):
+        for slot, websocket in enumerate(self.websockets):
+            await self.leave(websocket, self.game._players_ids[slot])
+        await sleep(GRACE * 1.5)
+        self.assertTrue(self.game.is_finished)
+        self.assertIsNone(self.game.winner_id)
+        self.assertNotIn("GameOverMsg", self.opponent.types())
+
+    async def test_waiting_player_leaves(self):
+        open_game, (websocket,) = await start_game(self.manager, "open", players=(3,))
+        self.assertEqual(open_game.status, GameStatus.open)
+        await self.manager.disconnect(websocket, open_game.id, 3)
+        self.assertEqual(open_game._players_ids, [])
+        self.assertFalse(open_game.is_finished)
+        # the freed seat can be taken by somebody else
+        user_cache.put(4, "player 4")
+        await self.manager.connect(FakeWebSocket(), open_game.id, 4)
+        self.assertEqual(open_game._players_ids, [4])
+
+
+class TestTimeControl(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        self.manager = GameSessionsManager()
+
+    async def asyncTearDown(self):
+        for game in self.manager.games.values():
+            await game.abandon()
+        await Tortoise.close_connections()
+
+    async def start(self, time_control):
+        game, websockets = await start_game(
+            self.manager, "clock", pacing=Pacing.turbo, time_control=time_control
+        )
+        return game, websockets, (game._position.turn + 1) % 2
+
+    def assertFlagged(self, game, websockets, slot):
+        self.assertTrue(game.is_finished)
+        self.assertEqual(game.winner_id, game._players_ids[1 - slot])
+        for websocket in websockets:
+            self.assertEqual(websocket.sent[-1]["type"], "GameOverMsg")
+            self.assertEqual(websocket.sent[-1]["winner_id"], game.winner_id)
+
+    async def test_not_limited(self):
+        game, websockets, slot = await self.start(TimeControl())
+        self.assertEqual(websockets[slot].sent[-1]["clocks"], [None, None])
+        self.assertIsNone(game._clock)
+
+    async def test_move_time(self):
+        game, websockets, slot = await self.start(TimeControl(move_time=0.1))
+        your_move = websockets[slot].sent[-1]
+        self.assertEqual(your_move["type"], "YourMoveMsg")
+        self.assertLessEqual(your_move["clocks"][slot], 100)
+        self.assertEqual(your_move["clocks"][1 - slot], 100)
+        # every move gets the whole move time again
+        for _ in range(0, 3):
+            await sleep(0.06)
+            await play(game, websockets, 1)
+        self.assertFalse(game.is_finished)
+        slot = (game._position.turn + 1) % 2
+        await sleep(0.15)
+        self.assertFlagged(game, websockets, slot)
+
+    async def test_bank(self):
+        game, websockets, slot = await self.start(TimeControl(bank=0.3))
+        await sleep(0.1)
+        await play(game, websockets, 2)
+        self.assertLess(game._banks[slot], 0.21)
+        self.assertGreater(game._banks[1 - slot], 0.25)
+        self.assertLessEqual(websockets[slot].sent[-1]["clocks"][slot], 210)
+        # bank left is shorter than first move took
+        await sleep(0.25)
+        self.assertFlagged(game, websockets, slot)
+
+    async def test_move_time_within_bank(self):
+        game, websockets, slot = await self.start(TimeControl(move_time=10, bank=0.1))
+        self.assertLessEqual(websockets[slot].sent[-1]["clocks"][slot], 100)
+        await sleep(0.15)
+        self.assertFlagged(game, websockets, slot)
+
+    async def test_clock_runs_while_disconnected(self):
+        game, websockets, slot = await self.start(TimeControl(move_time=0.1))
+        await self.manager.disconnect(websockets[slot], game.id, game._players_ids[slot])
+        await sleep(0.15)
+        self.assertTrue(game.is_finished)
+        self.assertEqual(game.winner_id, game._players_ids[1 - slot])
+        self.assertEqual(websockets[1 - slot].sent[-1]["type"], "GameOverMsg")
+
+
+@patch("server.database.game_session.FRAME_DELAY", FRAME_DELAY)
+class TestPacing(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.manager = GameSessionsManager()
+
+    async def asyncTearDown(self):
+        for game in self.manager.games.values():
+            await game.abandon()
+
+    async def move_up(self, pacing):
+        """
+        play until token can be moved up and move it with spectator watching,
+        returns types of messages players got for move (mover first), spectator,
+        move steps and when move was sent
+        """
+        game, websockets = await start_game(self.manager, f"pacing {pacing.value}", pacing=pacing)
+        while not any(m.cat == "move" for m in game._next_legal):
+            await play(game, websockets, 1, seed=game._position.turn)
+        spectator = TimedWebSocket()
+        await self.manager.connect(spectator, game.id, 0)
+        move = min(m for m in game._next_legal if m.cat == "move")
+        steps = len(move_positions(game._position, move))
+        slot = (game._position.turn + 1) % 2
+        players = [websockets[slot], websockets[1 - slot]]
+        before = [len(websocket.sent) for websocket in players]
+        sent = time.monotonic()
+        await game.handle_msg(websockets[slot], game._players_ids[slot], MoveMsg.from_move(move))
+        received = [websocket.types()[count:] for websocket, count in zip(players, before)]
+        return received, spectator, steps, sent
+
+    async def test_players_not_delayed(self):
+        for pacing in Pacing:
+            with self.subTest(pacing=pacing):
+                received, _, steps, sent = await self.move_up(pacing)
+                self.assertGreater(steps, 1)
+                self.assertLess(time.monotonic() - sent, FRAME_DELAY)
+                # players with protocol=full get only the final state
+                self.assertEqual(received, [["GameStateMsg"], ["GameStateMsg", "YourMoveMsg"]])
+
+    async def test_realtime_spectator(self):
+        _, spectator, steps, sent = await self.move_up(Pacing.realtime)
+        await sleep(FRAME_DELAY * (steps + 1))
+        self.assertEqual(spectator.types(), ["GameStateMsg"] * steps)
+        for before, after in zip([sent] + spectator.sent_at, spectator.sent_at):
+            self.assertGreaterEqual(after - before, FRAME_DELAY * 0.9)
+
+    async def test_turbo_spectator(self):
+        _, spectator, steps, sent = await self.move_up(Pacing.turbo)
+        await sleep(FRAME_DELAY / 5)
+        self.assertEqual(spectator.types(), ["GameStateMsg"] * steps)
+        self.assertLess(spectator.sent_at[-1] - sent, FRAME_DELAY)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from asyncio import gather, sleep
+from unittest.mock import patch
+
+from tortoise import Tortoise
+
+from server.database import lobby
+from server.database.game_session import GameSessionState, GameStatus, Pacing
+from server.database.lobby import WRITE_ATTEMPTS, SharedLobby
+from server.database.models.lobby import LobbyGames
+
+MODELS = ["server.database.models.user", "server.database.models.game", "server.database.models.lobby"]
+RETRY_DELAY = 0.01
+
+
+def state(game_id, name, status=GameStatus.open):
+    return GameSessionState(
+        game_id=game_id,
+        game_name=name,
+        players_ids=[],
+        players_names=[],
+        is_finished=status == GameStatus.finished,
+        pacing=Pacing.realtime,
+        status=status,
+    )
+
+
+class FailedQuery:
+    """
+    Update or delete query failing when it is awaited
+    """
+    async def fail(self):
+        raise OSError("database is locked")
+
+    def update(self, **kwargs):
+        return self.fail()
+
+    def delete(self):
+        return self.fail()
+
+
+@patch.object(lobby, "WRITE_RETRY_DELAY", RETRY_DELAY)
+class TestSharedLobby(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        # two workers sharing database
+        self.lobbies = [SharedLobby(0), SharedLobby(1)]
+        for game_id in range(0, 4):
+            await self.lobbies[game_id % 2].claim(state(game_id, f"game {game_id}"))
+
+    async def asyncTearDown(self):
+        await self.written()
+        await Tortoise.close_connections()
+
+    async def written(self):
+        """
+        wait for pending writes of both workers
+        """
+        for shared in self.lobbies:
+            await gather(*shared._writes, return_exceptions=True)
+
+    async def names(self, **kwargs):
+        states, _ = await self.lobbies[0].page(-1, 10, **kwargs)
+        return [s.game_name for s in states]
+
+    def failing(self, failures):
+        """
+        LobbyGames.filter failing **failures** times, then working
+        """
+        calls = []
+        filter_ = LobbyGames.filter
+
+        def failing_filter(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) <= failures:
+                return FailedQuery()
+            return filter_(*args, **kwargs)
+
+        return patch.object(LobbyGames, "filter", failing_filter), calls
+
+    async def test_claim_and_page(self):
+        with self.assertRaises(NameError):
+            await self.lobbies[1].claim(state(5, "game 2"))
+        states, cursor = await self.lobbies[1].page(-1, 3)
+        self.assertEqual([s.game_id for s in states], [0, 1, 2])
+        self.assertEqual(cursor, 2)
+        states, cursor = await self.lobbies[1].page(cursor, 3)
+        self.assertEqual(([s.game_id for s in states], cursor), ([3], None))
+        self.assertEqual(await self.names(name="3"), ["game 3"])
+
+    async def test_update_and_remove(self):
+        self.lobbies[1].update(state(1, "game 1", GameStatus.in_progress))
+        self.lobbies[0].remove(2)
+        await self.written()
+        self.assertEqual(await self.names(status=GameStatus.in_progress), ["game 1"])
+        self.assertEqual(await self.names(), ["game 0", "game 1", "game 3"])
+        # worker's games of its previous run are forgotten
+        await self.lobbies[1].reset()
+        self.assertEqual(await self.names(), ["game 0"])
+
+    async def test_failed_write_retried(self):
+        failing, calls = self.failing(1)
+        with failing, self.assertLogs("server.database.lobby", "WARNING"):
+            self.lobbies[1].update(state(1, "game 1", GameStatus.in_progress))
+            await sleep(RETRY_DELAY * 5)
+            await self.written()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(await self.names(status=GameStatus.in_progress), ["game 1"])
+        self.assertEqual(self.lobbies[1]._latest, {})
+
+    async def test_given_up(self):
+        failing, calls = self.failing(WRITE_ATTEMPTS)
+        with failing, self.assertLogs("server.database.lobby", "ERROR"):
+            self.lobbies[0].remove(0)
+            await sleep(RETRY_DELAY * 5 * WRITE_ATTEMPTS)
+        self.assertEqual(len(calls), WRITE_ATTEMPTS)
+        self.assertEqual(await self.names(), ["game 0", "game 1", "game 2", "game 3"])
+        self.assertEqual(self.lobbies[0]._latest, {})
+
+    async def test_newer_write_not_overwritten(self):
+        failing, calls = self.failing(1)
+        with failing:
+            self.lobbies[1].update(state(1, "game 1", GameStatus.in_progress))
+            self.lobbies[1].update(state(1, "game 1", GameStatus.finished))
+            await sleep(RETRY_DELAY * 5)
+            await self.written()
+        # failed older state isn't tried again
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(await self.names(status=GameStatus.finished), ["game 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
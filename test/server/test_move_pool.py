@@ -0,0 +1,106 @@
+import threading
+import unittest
+from struct import Struct
+from unittest.mock import patch
+
+from common.pylos import LegalList, LegalMovesCache, Position, bitboard_moves
+from server.database import game_session, move_pool
+from server.database.active_game_sessions import GameSessionsManager
+from server.database.game_session import Pacing
+from server.database.move_pool import LegalMovesPool, PoolKind, move_positions
+
+from .fake_websocket import play, start_game
+
+
+def positions_of_game(moves):
+    """
+    positions after every token step of first **moves** moves of game
+    """
+    position, res = Position(), []
+    for _ in range(0, moves):
+        move = position.legal_moves()[-1]
+        res += move_positions(position, move)
+        position.make(move)
+    return res
+
+
+class TestLegalMovesPool(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.threads = []
+
+    def recording(self, bitboard, player):
+        self.threads.append(threading.get_ident())
+        return bitboard_moves(bitboard, player)
+
+    def pool(self, kind):
+        pool = LegalMovesPool(kind, workers=1, cache=LegalMovesCache())
+        self.addCleanup(pool.close)
+        return pool
+
+    def assertLegalLists(self, pool, positions):
+        for bitboard, player in positions:
+            legal = pool.legal_list(bitboard, player)
+            self.assertEqual(legal, tuple(sorted(bitboard_moves(bitboard, player))))
+            self.assertEqual(legal.dicts, [m.to_dict() for m in legal])
+            packed = Struct(f"<{len(legal)}H").unpack(legal.packed)
+            self.assertEqual(list(packed), [m.to_int() for m in legal])
+            # the one stored list is served
+            self.assertIs(pool.cache.lookup(bitboard, player), legal)
+
+    def test_default(self):
+        self.assertEqual(LegalMovesPool().kind, PoolKind.thread)
+        with patch.dict("os.environ", {}, clear=True):
+            self.assertEqual(LegalMovesPool.from_env().kind, PoolKind.thread)
+        with patch.dict("os.environ", {"PYLON_MOVE_POOL": "process", "PYLON_MOVE_WORKERS": "2"}):
+            pool = LegalMovesPool.from_env()
+        self.assertEqual((pool.kind, pool.workers), (PoolKind.process, 2))
+
+    async def test_thread(self):
+        pool = self.pool(PoolKind.thread)
+        positions = positions_of_game(4)
+        with patch.object(move_pool, "bitboard_moves", self.recording):
+            await pool.prefetch(positions)
+            computed = len(self.threads)
+            self.assertEqual(computed, len(set(positions)))
+            self.assertNotIn(threading.get_ident(), self.threads)
+            self.assertLegalLists(pool, positions)
+            # nothing is computed again, in executor or in event loop
+            await pool.prefetch(positions)
+            self.assertEqual(len(self.threads), computed)
+            self.assertEqual(pool.cache.misses, 0)
+
+    async def test_inline(self):
+        pool = self.pool(PoolKind.inline)
+        positions = positions_of_game(2)
+        await pool.prefetch(positions)
+        self.assertIsNone(pool._executor)
+        self.assertIsNone(pool.cache.lookup(*positions[0]))
+        self.assertLegalLists(pool, positions)
+
+    async def test_process(self):
+        pool = self.pool(PoolKind.process)
+        positions = positions_of_game(4)
+        await pool.prefetch(positions)
+        self.assertLegalLists(pool, positions)
+        self.assertIsInstance(pool.legal_list(*positions[0]), LegalList)
+
+    async def test_session(self):
+        pool = self.pool(PoolKind.thread)
+        manager = GameSessionsManager()
+        with patch.object(game_session, "legal_moves_pool", pool), patch.object(
+            move_pool, "bitboard_moves", self.recording
+        ):
+            game, websockets = await start_game(manager, "pool", pacing=Pacing.turbo)
+            # starting position only
+            self.assertEqual(pool.cache.misses, 1)
+            await play(game, websockets, 6)
+            await game.abandon()
+        self.assertEqual(pool.cache.misses, 1)
+        self.assertGreaterEqual(len(self.threads), 6)
+        self.assertNotIn(threading.get_ident(), self.threads)
+        legal = pool.legal_list(game._position.bitboard, game._position.player)
+        self.assertEqual(websockets[0].sent[-1]["legal"], legal.dicts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import time
+import unittest
+
+from anyio.from_thread import start_blocking_portal
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server_main
+from common.messages import ResyncMsg
+from common.wire import Encoding, decode_msg, encode_msg
+from server.database.active_game_sessions import current_sessions
+from server.database.user_stats import user_cache
+
+
+def received(websocket, count=1, encoding=Encoding.json):
+    """
+    types of next **count** messages
+    """
+    if encoding == Encoding.binary:
+        return [type(decode_msg(websocket.receive_bytes(), encoding)).__name__ for _ in range(0, count)]
+    return [websocket.receive_json()["type"] for _ in range(0, count)]
+
+
+class TestConnect(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # all connections share one event loop, like on server, but without startup events,
+        # so that no database is opened
+        cls.client = TestClient(server_main.app)
+        cls.portal_cm = start_blocking_portal()
+        cls.client.portal = cls.portal_cm.__enter__()
+        for player_id in (1, 2):
+            user_cache.put(player_id, f"player {player_id}")
+
+    @classmethod
+    def tearDownClass(cls):
+        for game in list(current_sessions.games.values()):
+            cls.client.portal.call(game.abandon)
+        cls.client.portal = None
+        cls.portal_cm.__exit__(None, None, None)
+
+    def new_game(self, name):
+        return self.client.portal.call(current_sessions.new_game, name).game_id
+
+    def connect(self, game_id, player_id, encoding=Encoding.json):
+        return self.client.websocket_connect(
+            f"/game/connect?game_id={game_id}&player_id={player_id}&encoding={encoding.value}"
+        )
+
+    def test_unknown_game(self):
+        with self.assertRaises(WebSocketDisconnect) as cm:
+            with self.connect(99, 1):
+                pass
+        self.assertEqual(cm.exception.code, 1008)
+
+    def test_bad_messages(self):
+        game_id = self.new_game("bad json")
+        with self.connect(game_id, 1) as websocket:
+            for data in ('{"type": "MoveMsg"}', '{"cat": "put"}', '{"type": "NoMsg"}', "[1"):
+                websocket.send_text(data)
+                self.assertEqual(received(websocket), ["BadMsgResp"])
+            websocket.send_bytes(encode_msg(ResyncMsg({}), Encoding.binary))
+            self.assertEqual(websocket.receive_json()["detail"], "expected text frame")
+            # connection goes on
+            websocket.send_text(encode_msg(ResyncMsg({}), Encoding.json))
+            self.assertEqual(received(websocket), ["GameStateMsg"])
+
+    def test_bad_binary_messages(self):
+        game_id = self.new_game("bad binary")
+        with self.connect(game_id, 1, Encoding.binary) as websocket:
+            for send, data in ((websocket.send_text, "{}"), (websocket.send_bytes, b"\xff\x00")):
+                send(data)
+                self.assertEqual(received(websocket, encoding=Encoding.binary), ["BadMsgResp"])
+            websocket.send_bytes(encode_msg(ResyncMsg({}), Encoding.binary))
+            self.assertEqual(received(websocket, encoding=Encoding.binary), ["GameStateMsg"])
+
+    def test_seat_released(self):
+        game_id = self.new_game("released")
+        game = current_sessions.games[game_id]
+        with self.connect(game_id, 1) as first:
+            with self.connect(game_id, 2) as second:
+                self.assertEqual(received(first), ["GameStateMsg"])
+                self.assertEqual(received(second, 2), ["GameStateMsg", "YourMoveMsg"])
+                # messages that used to end the connection without releasing the seat
+                second.send_text('{"type": "MoveMsg"}')
+                second.send_bytes(b"\x00")
+                self.assertEqual(received(second, 2), ["BadMsgResp"] * 2)
+            # server side of closed connection ends a bit later
+            deadline = time.monotonic() + 2
+            while game._players_connections[1] is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertIsNone(game._players_connections[1])
+            with self.connect(game_id, 2) as again:
+                self.assertEqual(received(again, 2), ["GameStateMsg", "YourMoveMsg"])
+            self.assertFalse(game.is_finished)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+
+from server.database.active_game_sessions import SNAPSHOT_MAGIC, GameSessionsManager
+from server.database.game_session import GameStatus, Pacing, TimeControl
+from server.database.snapshots import SessionSnapshots
+
+from .fake_websocket import FakeWebSocket, play, start_game
+
+
+class TestSnapshots(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.manager = GameSessionsManager()
+        self.open = await self.manager.new_game("open")
+        self.game, self.websockets = await start_game(
+            self.manager, "running", pacing=Pacing.turbo, time_control=TimeControl(move_time=30, bank=600)
+        )
+        await play(self.game, self.websockets, 9)
+        finished, _ = await start_game(self.manager, "finished", players=(3, 4))
+        await finished.abandon()
+
+    async def asyncTearDown(self):
+        for manager in (self.manager, getattr(self, "restored", None)):
+            for game in manager.games.values() if manager else ():
+                await game.abandon()
+
+    async def test_round_trip(self):
+        self.restored = GameSessionsManager()
+        self.assertEqual(await self.restored.restore(self.manager.snapshot()), 2)
+        self.assertEqual(sorted(g.name for g in self.restored.games.values()), ["open", "running"])
+        game = self.restored.games[self.game.id]
+        self.assertEqual(game._position.bitboard, self.game._position.bitboard)
+        self.assertEqual(game._position.history, self.game._position.history)
+        self.assertEqual(game._seq, self.game._seq)
+        self.assertEqual(game.state.players_ids, [1, 2])
+        self.assertEqual(game.state.pacing, Pacing.turbo)
+        self.assertEqual(game.time_control, TimeControl(move_time=30, bank=600))
+        self.assertEqual(game.status, GameStatus.in_progress)
+        self.assertEqual(self.restored.games[self.open.game_id].status, GameStatus.open)
+        # new games don't reuse ids of restored ones
+        self.assertGreater((await self.restored.new_game("new")).game_id, self.game.id)
+
+        # player on move gets state and their turn when they are back
+        slot = (game._position.turn + 1) % 2
+        websocket = FakeWebSocket()
+        await self.restored.connect(websocket, game.id, game._players_ids[slot])
+        self.assertEqual(websocket.types(), ["GameStateMsg", "YourMoveMsg"])
+        self.assertEqual(websocket.sent[-1]["legal"], [m.to_dict() for m in sorted(game._next_legal)])
+
+    async def test_damaged(self):
+        data = self.manager.snapshot()
+        for bad in (b"", b"PYLS\x01" + data[5:], data[:-1], data[:len(SNAPSHOT_MAGIC) + 3], data[:40]):
+            manager = GameSessionsManager()
+            with self.assertRaises(ValueError):
+                await manager.restore(bad)
+            self.assertEqual(manager.games, {})
+        # invalid utf-8 in name
+        name = data.index(b"running")
+        manager = GameSessionsManager()
+        with self.assertRaises(ValueError):
+            await manager.restore(data[:name] + b"\xff" + data[name + 1:])
+        self.assertEqual(manager.games, {})
+
+    async def test_load_damaged_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sessions.snapshot")
+            snapshots = SessionSnapshots(self.manager, path)
+            await snapshots.save()
+            self.restored = GameSessionsManager()
+            self.assertEqual(await SessionSnapshots(self.restored, path).load(), 2)
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 3)
+            manager = GameSessionsManager()
+            with self.assertLogs("server.database.snapshots", "WARNING"):
+                self.assertEqual(await SessionSnapshots(manager, path).load(), 0)
+            self.assertEqual(manager.games, {})
+            self.assertEqual(await SessionSnapshots(manager, os.path.join(directory, "missing")).load(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
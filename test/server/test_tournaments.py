@@ -0,0 +1,87 @@
+import unittest
+from asyncio import sleep
+from unittest.mock import patch
+
+from tortoise import Tortoise
+
+from common.tournament import INITIAL_RATING, TournamentFormat
+from server.database.active_game_sessions import GameSessionsManager
+from server.database.models import user
+from server.database.models.user import Ratings, Users
+from server.database.tournaments import TournamentsManager
+
+from .fake_websocket import FakeWebSocket
+
+MODELS = ["server.database.models.user", "server.database.models.game"]
+
+
+class TestTournament(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        self.players = [(await Users.create(username=f"bot {i}")).id for i in range(0, 3)]
+        self.sessions = GameSessionsManager()
+        self.tournaments = TournamentsManager(self.sessions)
+
+    async def asyncTearDown(self):
+        for tournament in self.tournaments.tournaments.values():
+            tournament._task.cancel()
+        for game in self.sessions.games.values():
+            await game.abandon()
+        await Tortoise.close_connections()
+
+    async def start(self, players):
+        state = await self.tournaments.new_tournament("cup", TournamentFormat.round_robin, players)
+        return self.tournaments.get_tournament(state.tournament_id)
+
+    async def test_taken_game_name(self):
+        await self.sessions.new_game("cup #0.0")
+        with self.assertLogs("server.database.tournaments", "WARNING"):
+            tournament = await self.start(self.players[:2])
+            games = await tournament.games_of(self.players[0], timeout=1)
+        self.assertEqual([game.game_name for game in games], ["cup #0.1"])
+        self.assertEqual(games[0].status, "open")
+
+        # only paired players join as players
+        game = self.sessions.get_game(games[0].game_id)
+        await game.connect(FakeWebSocket(), self.players[2])
+        self.assertEqual(game._players_ids, [])
+
+        await game.abandon()
+        await tournament._task
+        self.assertEqual(await tournament.games_of(self.players[0]), [])
+        self.assertTrue(tournament.state.is_finished)
+        self.assertFalse(tournament.state.failed)
+        self.assertEqual(tournament.state.games_played, 1)
+
+    async def test_failed(self):
+        async def taken(*args, **kwargs):
+            raise NameError
+
+        with patch.object(self.sessions, "new_game", taken), self.assertLogs("server.database.tournaments"):
+            tournament = await self.start(self.players[:2])
+            self.assertEqual(await tournament.games_of(self.players[0], timeout=1), [])
+        self.assertTrue(tournament.state.is_finished)
+        self.assertTrue(tournament.state.failed)
+        self.assertEqual(tournament.state.games_played, 0)
+
+    async def test_initial_rating(self):
+        self.assertEqual(user.INITIAL_RATING, INITIAL_RATING)
+        rating, _ = await Ratings.get_or_create(user_id=self.players[0])
+        self.assertEqual(rating.rating, INITIAL_RATING)
+
+    async def test_poll_timeout(self):
+        tournament = await self.start(self.players)
+        await sleep(0.05)
+        # one of 3 players has no game in round
+        waiting = [player for player in self.players if not tournament._games[player]]
+        self.assertEqual(len(waiting), 1)
+        self.assertEqual(await tournament.games_of(waiting[0], timeout=0.05), [])
+        self.assertFalse(tournament.state.is_finished)
+        for game in list(self.sessions.games.values()):
+            await game.abandon()
+        self.assertEqual(len(await tournament.games_of(waiting[0], timeout=1)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
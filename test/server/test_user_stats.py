@@ -0,0 +1,147 @@
+import unittest
+from asyncio import sleep
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from tortoise import Tortoise
+
+from server.database import user_stats
+from server.database.models.game import Games
+from server.database.models.user import Users
+from server.database.user_stats import FLUSH_ATTEMPTS, StatsWriter, UserCache
+
+MODELS = ["server.database.models.user", "server.database.models.game"]
+
+
+def game(name, player1_id, player2_id):
+    now = datetime.now(timezone.utc)
+    return Games(
+        name=name,
+        player1_id=player1_id,
+        player2_id=player2_id,
+        winner_id=player1_id,
+        started_at=now,
+        finished_at=now,
+        moves_count=0,
+        moves=b"",
+    )
+
+
+class TestStatsWriter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+        self.players = [(await Users.create(username=f"player {i}")).id for i in range(0, 4)]
+        self.started = []
+
+    async def asyncTearDown(self):
+        for writer in self.started:
+            await writer.close()
+        await Tortoise.close_connections()
+
+    def start(self, writer):
+        writer.start()
+        self.started.append(writer)
+        return writer
+
+    async def stats(self):
+        return {user.id: (user.wins, user.loses) for user in await Users.all()}
+
+    async def test_equal_increments_grouped(self):
+        writer = StatsWriter()
+        first, second, third, fourth = self.players
+        writer.record(first, third)
+        writer.record(second, fourth)
+        writer.record(first, second)
+        with patch.object(Users, "filter", wraps=Users.filter) as updates:
+            await writer.flush()
+        # first (2, 0), second (1, 1), third and fourth (0, 1)
+        self.assertEqual(updates.call_count, 3)
+        self.assertEqual(
+            await self.stats(), {first: (2, 0), second: (1, 1), third: (0, 1), fourth: (0, 1)}
+        )
+
+    async def test_batch(self):
+        writer = self.start(StatsWriter(flush_interval=10, batch=3))
+        writer.record(*self.players[:2])
+        await sleep(0.05)
+        self.assertEqual(await Users.filter(wins=1).count(), 0)
+        # 4 users pending, flushed before flush_interval passes
+        writer.record(*self.players[2:])
+        await sleep(0.05)
+        self.assertEqual(await Users.filter(wins=1).count(), 2)
+        self.assertEqual(writer._pending, {})
+
+    async def test_failed_flush_put_back(self):
+        writer = StatsWriter()
+        first, second = self.players[:2]
+        writer.record(first, second, game("lost once", first, second))
+        with patch.object(Games, "bulk_create", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                await writer.flush()
+        # transaction is rolled back, nothing is counted twice
+        writer.record(second, first)
+        self.assertEqual(writer._pending, {first: [1, 1], second: [1, 1]})
+        self.assertEqual(writer.failures, 1)
+        await writer.flush()
+        stats = await self.stats()
+        self.assertEqual((stats[first], stats[second]), ((1, 1), (1, 1)))
+        self.assertEqual(await Games.all().values_list("name", flat=True), ["lost once"])
+        self.assertEqual(writer.failures, 0)
+
+    async def test_bad_game_dropped(self):
+        writer = StatsWriter()
+        first, second = self.players[:2]
+        # row referring to user that doesn't exist
+        writer.record(first, second, game("bad", first, 999))
+        writer.record(first, second, game("good", first, second))
+        for _ in range(0, FLUSH_ATTEMPTS):
+            with self.assertRaises(Exception):
+                await writer.flush()
+        self.assertEqual(len(writer._games), 2)
+        with self.assertLogs("server.database.user_stats", "ERROR"):
+            await writer.flush()
+        self.assertEqual(writer._games, [])
+        self.assertEqual(await Games.all().values_list("name", flat=True), ["good"])
+        self.assertEqual((await Users.get(id=first)).wins, 2)
+
+    @patch.object(user_stats, "MAX_FLUSH_BACKOFF", 0.1)
+    async def test_retry_backoff(self):
+        writer = self.start(StatsWriter(flush_interval=0.01))
+        flushes = []
+
+        async def failing():
+            flushes.append(1)
+            writer.failures += 1
+            raise OSError("database is down")
+
+        with patch.object(writer, "flush", failing), self.assertLogs("server.database.user_stats", "WARNING"):
+            writer.record(*self.players[:2])
+            await sleep(0.2)
+        # retried 0.02, 0.04 and 0.08 seconds after failures, not in tight loop
+        self.assertLessEqual(len(flushes), 5)
+        self.assertGreaterEqual(len(flushes), 2)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": MODELS})
+        await Tortoise.generate_schemas()
+
+    async def asyncTearDown(self):
+        await Tortoise.close_connections()
+
+    async def test_username(self):
+        cache = UserCache(maxsize=1)
+        first, second = [await Users.create(username=name) for name in ("first", "second")]
+        self.assertEqual(await cache.username(first.id), "first")
+        await first.delete()
+        self.assertEqual(await cache.username(first.id), "first")
+        # least recently used name is evicted
+        self.assertEqual(await cache.username(second.id), "second")
+        with self.assertRaises(Exception):
+            await cache.username(first.id)
+
+
+if __name__ == "__main__":
+    unittest.main()